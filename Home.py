@@ -2,8 +2,8 @@
 
 import streamlit as st
 from services.ml import load_priority_model, load_sentiment_model
+from services.db import ensure_indexes_once
 from dotenv import load_dotenv
-import joblib
 import pandas as pd
 import os
 
@@ -17,17 +17,14 @@ required_vars = [
 for var in required_vars:
     assert os.getenv(var), f"❌ {var} not defined in .env"
 
-models_dir = "ml/models"
-model_files = {
-    "priority_pipeline": os.path.join(models_dir, "priority_pipeline.joblib"),
-    "sentiment_pipeline": os.path.join(models_dir, "sentiment_pipeline.joblib")
-}
+ensure_indexes_once()
+
 loaded_models = {}
-for name, path in model_files.items():
-    if os.path.exists(path):
-        loaded_models[name] = joblib.load(path)
-    else:
-        st.warning(f"⚠️ MoModel not found: {path}")
+for name, load in {"priority_pipeline": load_priority_model, "sentiment_pipeline": load_sentiment_model}.items():
+    try:
+        loaded_models[name] = load()
+    except FileNotFoundError as e:
+        st.warning(f"⚠️ {e}")
 
 data_dir = "data"
 loaded_data = {}
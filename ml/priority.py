@@ -4,6 +4,7 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.pipeline import Pipeline
 import joblib
+from services.model_registry import get_pipeline, model_registry
 
 DATA_PATH = "data/train_model.csv"
 MODEL_PATH = "ml/models/priority_pipeline.joblib"
@@ -21,8 +22,7 @@ def classify_priority(text):
         return "low"
 
     # Fallback to model prediction
-    from joblib import load
-    model = load("ml/models/priority_pipeline.joblib")
+    model = get_pipeline("priority")
     pred = model.predict([text])[0].lower()
     print(f"Classify priority input: '{text}' -> prediction: '{pred}'")
     return pred
@@ -45,6 +45,7 @@ def train_priority():
     print("Test accuracy: ", pipeline.score(X_test, y_test))
 
     joblib.dump(pipeline, MODEL_PATH)
+    model_registry.unload("pipeline:priority")
     print(f"Priority model saved to {MODEL_PATH}")
 
 if __name__ == "__main__":
@@ -4,22 +4,18 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
 import joblib
-from joblib import load
+from services.model_registry import get_pipeline, model_registry
 
 DATA_PATH = "data/train_model.csv"
 MODEL_PATH = "ml/models/sentiment_pipeline.joblib"
 
-try:
-    model = load(MODEL_PATH)
-except Exception as e:
-    model = None
-    print(f"Warning: could not load sentiment model: {e}")
-
 def classify_sentiment(text):
     if not text:
         return "neutral"
-    if model is None:
-        raise RuntimeError("Unloaded sentiment model")
+    try:
+        model = get_pipeline("sentiment")
+    except Exception as e:
+        raise RuntimeError(f"Unloaded sentiment model: {e}")
     pred = model.predict([text])[0]
     print(f"Classify sentiment input: {text} -> prediction: {pred}")
     return pred.lower()
@@ -42,6 +38,7 @@ def train_sentiment():
 
     # save pipeline
     joblib.dump(pipeline, MODEL_PATH)
+    model_registry.unload("pipeline:sentiment")
     print(f"Sentiment model saved to {MODEL_PATH}")
 
 if __name__ == "__main__":
@@ -5,8 +5,28 @@ import yagmail
 import random
 import google.generativeai as genai
 import os
+import time
+import threading
+import itertools
+from types import SimpleNamespace
 from services.mongo import db
-from services import ml as ml_services
+from services.intent_index import get_intent_index, INTENT_SIM_THRESHOLD
+from services.vector_index import get_knowledge_index
+from services.bm25 import get_bm25_index
+from services.hybrid_retrieval import HybridRetriever, RETRIEVAL_TOP_K
+from services.tier_router import TierRouter, TierResult, SpeculativeCall, SPECULATIVE_AI
+from services.llm_guard import llm_guard, open_stream, HttpLLM, CircuitOpenError
+from services.answer_cache import answer_cache
+from services.content_version import get_versions
+from services.semantic_cache import semantic_cache
+from services.prompt_context import get_prompt_context, render_prompt
+from services.context_assembler import assemble_prompt, estimate_tokens, get_intent_lexicon, PROMPT_TOP_K
+from services.inference_profile import INFERENCE_PROFILE
+from services.model_registry import get_bert, get_gpt2_lm
+from services.enrichment import get_enrichment_worker
+from services.embedding_store import save_embedding
+from services.event_sink import event_sink
+from services.chat_store import append_message, update_message, load_messages, first_messages, CHAT_HISTORY_BUCKETS
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 from numpy.linalg import norm
@@ -14,8 +34,7 @@ import uuid as _uuid
 import pandas as pd
 import numpy as np
 import torch
-import re
-from transformers import GPT2Tokenizer, GPT2LMHeadModel, BertTokenizer, BertModel
+from transformers import TextIteratorStreamer
 import logging
 from difflib import SequenceMatcher
 
@@ -25,22 +44,16 @@ logging.basicConfig(
 logging.info("🔄️ Reloading Chatbot.py...")
 load_dotenv(dotenv_path="config/.env")
 
-try:
-    predict_sentiment = ml_services.predict_sentiment
-    predict_priority = ml_services.predict_priority
-    _ml_available = True
-except Exception as e:
-    logging.warning("ML services not available: %s", e)
-    _ml_available = False
-
-    def predict_sentiment(texts):
-        return ["unknown" for _ in texts]
-    def predict_priority(texts):
-        return ["Low" for _ in texts]
+# Optional plain-HTTP LLM backend (e.g. simulation/fake_llm_server.py) instead of Gemini
+LLM_BACKEND_URL = os.getenv("LLM_BACKEND_URL")
+LLM_NAME = "http" if LLM_BACKEND_URL else "gemini"
 
 try: 
-    genai.configure(api_key=os.getenv("GOOGLE_GENAI_API_KEY"))
-    model = genai.GenerativeModel("gemini-2.5-pro")
+    if LLM_BACKEND_URL:
+        model = HttpLLM(LLM_BACKEND_URL)
+    else:
+        genai.configure(api_key=os.getenv("GOOGLE_GENAI_API_KEY"))
+        model = genai.GenerativeModel("gemini-2.5-pro")
 except Exception as e:
     logging.warning("Failed to configure genai: %s", e)
     model = None
@@ -48,17 +61,32 @@ except Exception as e:
 email_admin = os.getenv("EMAIL_ADMIN")
 email_pass = os.getenv("EMAIL_PASS")
 
+# Render AI answers chunk by chunk as they arrive (st.write_stream)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() in ("1", "true", "yes")
+# Write question + answer as one append once the answer exists (instead of
+# saving the question, then updating it with the answer on the next rerun).
+# Tradeoff: the question is only stored once generation ends. A failed
+# generation still saves it (answer_pending_turn), but if the tab closes or the
+# process dies during the LLM call the question is lost. Set to false to save
+# every question immediately.
+CHAT_BATCH_TURN_WRITES = os.getenv("CHAT_BATCH_TURN_WRITES", "true").lower() in ("1", "true", "yes")
+
 users = db["users"]
 chats = db["chats"]
+chat_buckets = db["chat_buckets"]
 faq = db["faq"]
 knowledge = db["knowledge"]
 unanswered = db["unanswered"]
 default_chat = db["default_chat"]
 monitoring_col = db["monitoring"]
+# messages live in chat_buckets (services.chat_store); chats holds session headers
+enrichment_worker = get_enrichment_worker(chat_buckets)
+# embeddings live in services.embedding_store; hide any not yet migrated from legacy chats.messages
+CHAT_PROJECTION = {"messages.bert_embedding": 0}
 
 def log_event(event_type, details, status="success", log_source="production"):
-    """Registra um evento no MongoDB (coleção monitoring)."""
-    monitoring_col.insert_one({
+    """Registra um evento no MongoDB (coleção monitoring), via services.event_sink (write-behind)."""
+    event_sink.emit(monitoring_col, {
         "event": event_type,
         "details": details,
         "status": status,
@@ -72,13 +100,10 @@ def load_faq_df():
     return pd.read_csv("data/train_model.csv")
 
 
-@st.cache_resource(show_spinner=False)
 def load_models():
-    bert_tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
-    bert_model = BertModel.from_pretrained("bert-base-uncased")
-    gpt2_tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
-    gpt2_model = GPT2LMHeadModel.from_pretrained("gpt2")
-    gpt2_tokenizer.pad_token = gpt2_tokenizer.eos_token
+    """Process-wide models from services.model_registry (loaded once, shared with services.embeddings)."""
+    bert_tokenizer, bert_model = get_bert(INFERENCE_PROFILE)
+    gpt2_tokenizer, gpt2_model = get_gpt2_lm(INFERENCE_PROFILE)
     return bert_tokenizer, bert_model, gpt2_tokenizer, gpt2_model
 
 bert_tokenizer, bert_model, gpt2_tokenizer, gpt2_model = load_models()
@@ -93,7 +118,7 @@ def get_bert_embeddings(text):
     with torch.no_grad():
         outputs = bert_model(**inputs)
     emb = outputs.last_hidden_state.mean(dim=1).squeeze()
-    return emb.detach().cpu().numpy()
+    return emb.detach().float().cpu().numpy()
 
 
 def generate_gpt2_reply(prompt, max_length=50):
@@ -108,22 +133,20 @@ def generate_gpt2_reply(prompt, max_length=50):
     return reply
 
 
-def predict_sentiment_with_text(text):
-    try:
-        preds = predict_sentiment([text])
-        return str(preds[0])
-    except Exception as e:
-        logging.error("predict_sentiment error: %s", e)
-        return "unknown"
-
-
-def predict_priority_with_text(text):
-    try:
-        preds = predict_priority([text])
-        return str(preds[0])
-    except Exception as e:
-        logging.error("predict_priority error: %s", e)
-        return "Low"
+def stream_gpt2_reply(prompt, max_length=50):
+    """Same output as generate_gpt2_reply, yielded token by token."""
+    inputs = gpt2_tokenizer(prompt, return_tensors="pt")
+    streamer = TextIteratorStreamer(gpt2_tokenizer, skip_special_tokens=True)
+    worker = threading.Thread(
+        target=gpt2_model.generate,
+        kwargs=dict(**inputs, max_length=max_length, pad_token_id=gpt2_tokenizer.eos_token_id, streamer=streamer),
+        daemon=True
+    )
+    worker.start()
+    for text in streamer:
+        if text:
+            yield text
+    worker.join()
 
 
 st.set_page_config(page_title="Chatbot", page_icon="🤖", layout="wide")
@@ -150,142 +173,247 @@ def is_similar(a, b, threshold=0.85):
     return SequenceMatcher(None, a, b).ratio() > threshold
 
 
-def get_ai_reply(user_input):
+def build_ai_prompt(user_input, hits=None):
+    """
+    Prompt with the most relevant FAQ / intent / KB snippets within the token
+    budget. Falls back to the cached static context if retrieval fails.
+    Returns (prompt, details) where details is logged with the AI request.
+    """
     try:
-        faq_entries = list(faq.find({}, {"_id": 0}).limit(10))
-
-        default_doc = default_chat.find_one({"intents": {"$exists": True}}) or {}
-        intent_entries = default_doc.get("intents", [])[:5]
-        
-        knowledge_articles = list(knowledge.find({}, {"_id": 0}).limit(5))
-        
-        faq_context = "\n".join([f"Q: {e.get('question','')}\nA: {e.get('answer','')}" 
-            for e in faq_entries])
-
-        intent_context = "\n".join([
-            f"[Intent: {i.get('tag','')}]\n"
-            f"Patterns: {', '.join(i.get('patterns', []))}\n"
-            f"Responses: {', '.join(i.get('responses', []))}"
-            for i in intent_entries
-        ])
-
-        kb_context = "\n".join([f"Title: {a.get('title','')}\nContent: {a.get('content','')}"
-            for a in knowledge_articles])
-
-        full_context = f"""
-You are a support assistant for TechFix Solutions.
-Use the company's FAQ, known intent patterns,
-and support knowledge base to better answer customer questions.
+        if hits is None:
+            hits = retrieve_answer(user_input).hits
+        intent_hits = get_intent_lexicon(get_intent_index(default_chat)).search(user_input, k=PROMPT_TOP_K)
+        assembled = assemble_prompt(user_input, hits, intent_hits)
+        return assembled.prompt, {
+            "prompt_tokens": assembled.prompt_tokens,
+            "token_budget": assembled.budget,
+            "snippets": assembled.snippets,
+        }
+    except Exception as e:
+        logging.error(f"Context assembly failed, using static context: {e}")
+        context = get_prompt_context(faq, default_chat, knowledge)
+        prompt = render_prompt(context.text, user_input)
+        return prompt, {"prompt_tokens": estimate_tokens(prompt), "context_version": context.version}
 
-=== FAQs ===
-{faq_context}
 
-=== Intents ===
-{intent_context}
+def cache_ai_answer(user_input, answer, question_vector=None, semantic=True, versions=None):
+    """Cache an AI answer unless FAQ / knowledge content changed since `versions` were taken."""
+    if versions is not None and versions != get_versions():
+        logging.info("♻️ Content changed while answering, not caching the answer")
+        return
+    answer_cache.put(user_input, answer, "ai", versions=versions)
+    if semantic:
+        semantic_cache.store(user_input, answer, question_vector)
 
-=== Knowledge Articles ===
-{kb_context}
 
-USER: {user_input}
-Respond professionally and clearly based on the context above.
-""".strip()
+def stream_ai_reply(user_input, hits=None, cancel_event=None, on_complete=None, versions=None):
+    """
+    Yield the AI answer in chunks as Gemini streams it (GPT-2 fallback streams
+    token by token). Time-to-first-token is logged with the ai_request event.
+    Setting `cancel_event` stops a speculative call between chunks. A complete
+    answer is passed to `on_complete(user_input, answer, question_vector,
+    semantic, versions)` (default: cache_ai_answer), with the content
+    `versions` taken when the lookup started.
+    """
+    on_complete = on_complete or cache_ai_answer
+    versions = versions if versions is not None else get_versions()
+    question_vector = semantic_cache.embed(user_input)
+    cached = semantic_cache.lookup(user_input, question_vector)
+    if cached:
+        logging.info(f"🧠 Semantic cache hit (score={cached['score']:.3f}): {cached['question']!r}")
+        on_complete(user_input, cached["answer"], question_vector, False, versions)
+        yield cached["answer"]
+        return
 
-        chat = model.start_chat(history=[])
-        response = chat.send_message(full_context)
-        return response.text.strip()
+    chunks = []
+    try:
+        full_context, prompt_details = build_ai_prompt(user_input, hits)
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        start = time.perf_counter()
+        ttft_ms = None
+
+        # deadline + hedging cover the wait for the first chunk
+        first_text, response = llm_guard.call(open_stream, lambda: model.start_chat(history=[]), full_context)
+        for chunk in itertools.chain([SimpleNamespace(text=first_text)], response):
+            if cancel_event is not None and cancel_event.is_set():
+                logging.info("🛑 Speculative AI call cancelled, a cheaper tier answered")
+                log_event("ai_request", {
+                    **prompt_details,
+                    "model": LLM_NAME,
+                    "cancelled": True,
+                    "llm_ms": round((time.perf_counter() - start) * 1000, 2),
+                }, log_source="production")
+                return
+            text = chunk.text
+            if not text:
+                continue
+            if ttft_ms is None:
+                ttft_ms = round((time.perf_counter() - start) * 1000, 2)
+            chunks.append(text)
+            yield text
+
+        answer = "".join(chunks).strip()
+        log_event("ai_request", {
+            **prompt_details,
+            "model": LLM_NAME,
+            "stream": True,
+            "ttft_ms": ttft_ms,
+            "llm_ms": round((time.perf_counter() - start) * 1000, 2),
+            "circuit": llm_guard.breaker.state,
+        }, log_source="production")
+        if cancel_event is not None and cancel_event.is_set():
+            return  # cancelled after the last chunk: the answer is discarded
+        on_complete(user_input, answer, question_vector, True, versions)
 
     except Exception as e:
-        logging.error(f"get_ai_reply error: {e}")
+        if isinstance(e, CircuitOpenError):
+            logging.warning(f"⚡ {e}, answering with GPT-2")
+        else:
+            logging.error(f"get_ai_reply error: {e}")
+        if chunks or (cancel_event is not None and cancel_event.is_set()):
+            return  # partial answer was already shown, don't append a different one
 
         try:
-            return generate_gpt2_reply(user_input)
+            yield from stream_gpt2_reply(user_input)
         except Exception:
-            return f"Sorry, there was an error with the AI: {e}"
+            yield f"Sorry, there was an error with the AI: {e}"
 
 
-def generate_bot_response(user_input):
-    logging.info("👁️ Checking Patterns...")
-    answer, tag = find_default_answer(user_input)
-    if answer:
-        log_event("chat_response", {
-            "user_input": user_input,
-            "predicted_source": "intent",
-            "predicted_tag": tag
-        }, log_source="production")
-        return answer, tag or "intent"
+def get_ai_reply(user_input, hits=None, versions=None):
+    return "".join(stream_ai_reply(user_input, hits, versions=versions)).strip()
 
-    logging.info("👁️ Checking FAQ...")
-    answer = find_known_answer(user_input)
-    if answer:
+
+def generate_bot_response(user_input, stream=False):
+    """
+    Returns (answer, source). With stream=True an AI answer is returned as a
+    generator of text chunks (see stream_ai_reply) instead of a string.
+    """
+    # content versions the answer is built from: it isn't cached if they change meanwhile
+    versions = get_versions()
+    cached = answer_cache.get(user_input)
+    if cached:
+        answer, source = cached
         log_event("chat_response", {
             "user_input": user_input,
-            "predicted_source": "faq"
+            "predicted_source": source,
+            "cache_hit": True
         }, log_source="production")
-        return answer, "faq"
+        return answer, source
 
-    logging.info("👁️ Checking Knowledge Base...")
-    answer = find_knowledge_answer(user_input)
-    if answer:
+    speculative = start_speculative_ai(user_input, versions) if SPECULATIVE_AI else None
+
+    logging.info("👁️ Checking Patterns + FAQ + Knowledge Base...")
+    route = tier_router.route(user_input, speculative)
+    if route.result is not None:
         log_event("chat_response", {
             "user_input": user_input,
-            "predicted_source": "kb"
+            **route.result.details,
+            "tier_ms": {k: round(v, 2) for k, v in route.timings.items()},
+            "speculative_cancelled": speculative is not None,
         }, log_source="production")
-        return answer, "kb"
+        if route.tier != "intent":
+            answer_cache.put(user_input, route.result.answer, route.result.source, versions=versions)
+        return route.result.answer, route.result.source
 
     logging.info("🤖 Calling AI model...")
-    answer = get_ai_reply(user_input)
+    if speculative is not None:
+        answer = speculative.stream() if stream else speculative.result()
+    else:
+        retrieval = route.results.get("retrieval")
+        hits = retrieval.payload.hits if retrieval is not None and retrieval.payload is not None else None
+        if stream:
+            answer = stream_ai_reply(user_input, hits=hits, versions=versions)
+        else:
+            answer = get_ai_reply(user_input, hits=hits, versions=versions)
     log_event("chat_response", {
         "user_input": user_input,
-        "predicted_source": "ai"
+        "predicted_source": "ai",
+        "stream": stream,
+        "speculative": speculative is not None,
+        "tier_ms": {k: round(v, 2) for k, v in route.timings.items()},
     }, log_source="production")
     return answer, "ai"
 
 
+def intent_tier(user_input):
+    answer, tag = find_default_answer(user_input)
+    return TierResult(answer, tag or "intent", {"predicted_source": "intent", "predicted_tag": tag})
+
+
+def retrieval_tier(user_input):
+    result = retrieve_answer(user_input)
+    return TierResult(result.answer, result.kind, {
+        "predicted_source": result.kind,
+        "retriever": result.retriever,
+        "confidence": round(result.confidence, 4),
+        "retrieval_ms": {k: round(v, 2) for k, v in result.timings.items()},
+    }, payload=result)
+
+
+# Priority order: the first tier with an answer wins, all of them run concurrently
+tier_router = TierRouter([("intent", intent_tier), ("retrieval", retrieval_tier)])
+
+
+def start_speculative_ai(user_input, versions=None):
+    """
+    Start the AI call before the lookup tiers finish. The prompt uses BM25
+    hits only (sub-millisecond) so the request isn't held up by dense search.
+    The answer is cached only once generate_bot_response actually serves it.
+    """
+    completed = []
+
+    def produce(cancel_event):
+        try:
+            hits = get_bm25_index(faq, knowledge).search(user_input, k=RETRIEVAL_TOP_K)
+        except Exception as e:
+            logging.error("BM25 index unavailable: %s", e)
+            hits = []
+        return stream_ai_reply(user_input, hits=hits, cancel_event=cancel_event, versions=versions,
+                               on_complete=lambda *args: completed.append(args))
+
+    def served():
+        for args in completed:
+            cache_ai_answer(*args)
+
+    return SpeculativeCall(produce, on_served=served)
+
+
 def find_default_answer(user_input):
     user_input = user_input.strip().lower()
-    doc = default_chat.find_one({"intents": {"$exists": True}}) or {}
-    intents = doc.get("intents", [])
-    if not intents:
+    index = get_intent_index(default_chat)
+    if not len(index):
         return None, None
 
-    for intent in intents:
-        for pattern in intent.get("patterns", []):
-            if is_similar(pattern, user_input):
-                selected_response = random.choice(intent.get("responses", [])) if intent.get("responses") else None
-                return selected_response, intent.get("tag", "intent")
-    return None, None
+    match = index.match(user_input, threshold=INTENT_SIM_THRESHOLD)
+    if match is None:
+        return None, None
 
+    intent, _pattern = match
+    selected_response = random.choice(intent.get("responses", [])) if intent.get("responses") else None
+    return selected_response, intent.get("tag", "intent")
 
-def find_known_answer(user_input):
-    user_input = user_input.strip()
-    if len(user_input) < 2:
-        return None
-    
-    safe = re.escape(user_input)
-    doc = faq.find_one(
-        {"question": {"$regex": safe, "$options": "i"}})
-    logging.info(f"find_known_answer:{doc}")
-    if doc and doc.get("answer"):
-        return doc["answer"]
-
-    for f in faq.find({}, {"question": 1, "answer": 1}).limit(50):
-        q = f.get("question", "")
-        if SequenceMatcher(None, q.lower(), user_input.lower()).ratio() > 0.75:
-            return f.get("answer")
-    return None
-
-
-def find_knowledge_answer(user_input):
-    if len(user_input.strip()) < 4:
-        return None
-    safe = re.escape(user_input)
-    doc = knowledge.find_one(
-        {"$or": [
-            {"title": {"$regex": safe, "$options": "i"}}, 
-            {"content": {"$regex": safe, "$options": "i"}},
-        ]
-    })
-    return doc.get("content") if doc else None
+
+def retrieve_answer(user_input):
+    """
+    One-pass FAQ + knowledge lookup: BM25 and dense retrieval in parallel,
+    fused with RRF. Returns a services.hybrid_retrieval.RetrievalResult.
+    """
+    try:
+        lexical = get_bm25_index(faq, knowledge)
+    except Exception as e:
+        logging.error("BM25 index unavailable: %s", e)
+        lexical = None
+    try:
+        dense = get_knowledge_index(faq, knowledge)
+    except Exception as e:
+        logging.error("Dense index unavailable: %s", e)
+        dense = None
+
+    result = HybridRetriever(lexical, dense).retrieve(user_input.strip())
+    if result.answer:
+        logging.info(f"retrieval hit: {result.retriever} confidence={result.confidence:.3f} key={result.key}")
+    return result
 
 
 def save_chat_message(
@@ -307,34 +435,16 @@ def save_chat_message(
     if embedding is not None:
         try:
             if isinstance(embedding, torch.Tensor):
-                embedding = embedding.detach().cpu().tolist()
-            elif isinstance(embedding, np.ndarray):
-                embedding = embedding.tolist()
-            else:
-                embedding = list(embedding)
+                embedding = embedding.detach().float().cpu().numpy()
+            embedding = np.asarray(embedding, dtype=np.float32)
         except Exception:
-            try:
-                embedding = np.array(embedding).tolist()
-            except Exception:
-                embedding = None
+            embedding = None
     
     if not session_id:
+        # the session header is created by the first append
         session_id = generate_chat_id()
         st.session_state.session_id = session_id
 
-        new_session = {
-                "session_id": session_id,
-                "user_id": user.get("email") if user else None,
-                "start_time": timestamp,
-                "messages": [],
-                "last_updated": timestamp
-            }
-        try:
-            chats.insert_one(new_session)
-        except Exception as e:
-            logging.error("Failed to create new session: %s", e)
-            return None, None, None
-
     message_id = str(_uuid.uuid4())
     message = {
         "message_id": message_id,
@@ -346,26 +456,93 @@ def save_chat_message(
         "intent_tag": tag,
         "sentiment": sentiment,
         "priority": priority,
-        "bert_embedding": embedding,
         "thumbs_up": bool(thumbs_up),
         "thumbs_down": bool(thumbs_down)
     }
 
     try:
-        chats.update_one(
-            {"session_id": session_id},
-            {
-                "$push": {"messages": message},
-                "$set": {"last_updated": timestamp}
-            },
-            upsert=True
+        append_message(
+            session_id, message,
+            user_id=user.get("email") if user else None,
+            start_time=st.session_state.get("chat_start_time") or timestamp,
+            chats_col=chats, buckets_col=chat_buckets
         )
+        if embedding is not None:
+            save_embedding(message_id, embedding, session_id=session_id)
         return session_id, message_id, message
     except Exception as e:
         logging.error(f"❌ Failed to log conversation: {e}")
         return None, None, None
     
 
+def save_question(idx, msg):
+    """Persist a turn's question without its answer (the answer is filled in later by update_message)."""
+    session_id, message_id, message = save_chat_message(
+        st.session_state.user,
+        msg.get("question"),
+        answer=None,
+        user_time=msg.get("user_time"),
+        bot_time=None
+    )
+    if message is not None:
+        st.session_state.chat_history[idx] = message
+        enrichment_worker.submit(session_id, message_id, msg.get("question"))
+    return message
+
+
+def answer_pending_turn(idx, msg):
+    """
+    Generate the answer for chat_history[idx] and persist the turn: an
+    update of the saved question, or (CHAT_BATCH_TURN_WRITES) one append of
+    question + answer. If generation fails the question is saved on its own
+    before the error propagates, so it is not lost.
+    """
+    question = msg.get("question")
+    try:
+        answer, tag = generate_bot_response(question, stream=STREAM_RESPONSES)
+        if not isinstance(answer, str):
+            st.markdown("🤖 **Bot**:")
+            answer = st.write_stream(answer)
+            if not isinstance(answer, str):
+                answer = "".join(map(str, answer))
+    except Exception:
+        if not msg.get("message_id"):
+            save_question(idx, msg)
+        raise
+    bot_time = datetime.now(timezone.utc)
+
+    st.session_state.chat_history[idx].update({
+        "answer": answer,
+        "bot_time": bot_time,
+        "intent_tag": tag
+    })
+
+    session_id = st.session_state.get("session_id")
+    message_id = msg.get("message_id")
+    try:
+        if message_id:
+            update_message(
+                session_id, message_id,
+                {"answer": answer, "bot_time": bot_time, "intent_tag": tag},
+                chats_col=chats, buckets_col=chat_buckets
+            )
+        else:
+            # whole turn in one append (session header created on first use)
+            session_id, message_id, message = save_chat_message(
+                st.session_state.user,
+                question,
+                answer,
+                tag=tag,
+                user_time=msg.get("user_time"),
+                bot_time=bot_time
+            )
+            if message is not None:
+                st.session_state.chat_history[idx] = message
+                enrichment_worker.submit(session_id, message_id, question)
+    except Exception as e:
+        logging.error("Failed to persist bot answer: %s", e)
+
+
 def send_email(to, subject, body):
     try:
         yag = yagmail.SMTP(email_admin, email_pass)
@@ -397,7 +574,7 @@ def handle_unanswered(user, question, request_type="unknown"):
     send_email(email_admin, subject, body)
 
 
-def handle_feedback(user, question, answer, ticket_id, feedback_text, liked=False):
+def handle_feedback(user, question, answer, ticket_id, feedback_text, liked=False, message_id=None):
     feedback_doc = {
         "ticket_id": ticket_id,
         "feedback": feedback_text,
@@ -405,9 +582,20 @@ def handle_feedback(user, question, answer, ticket_id, feedback_text, liked=Fals
     }
     try:
         db.feedback.insert_one(feedback_doc)
+        if message_id:
+            # positional $set of the two flags on this message only
+            update_message(ticket_id, message_id, {"thumbs_up": liked, "thumbs_down": not liked},
+                           chats_col=chats, buckets_col=chat_buckets)
     except Exception as e:
         logging.error("Failed to insert feedback: %s", e)
 
+    if not liked:
+        # don't keep serving an answer the user rejected
+        answer_cache.discard(question)
+        purged = semantic_cache.purge(question, answer)
+        if purged:
+            logging.info(f"🧹 Purged {purged} semantic cache entries after 👎")
+
     thumbs = "👍" if liked else "👎"
     subject = (f"[Chatbot - Feedback] {thumbs} from {user['email']} | {ticket_id}")
     body = (
@@ -438,9 +626,10 @@ def reload_chat_history(force=False):
         return
     if st.session_state.get("chat_loaded_for_session") == session_id and not force:
         return
-    doc = chats.find_one({"session_id": session_id})
+    doc = chats.find_one({"session_id": session_id}, CHAT_PROJECTION)
     if doc:
-        st.session_state.chat_history = doc.get("messages", [])
+        st.session_state.chat_history = load_messages(
+            session_id, header=doc, last_buckets=CHAT_HISTORY_BUCKETS, chats_col=chats, buckets_col=chat_buckets)
     else:
         st.session_state.chat_history = []
     st.session_state["chat_loaded_for_session"] = session_id
@@ -507,15 +696,20 @@ def user_details():
         st.sidebar.markdown(f"**Last Active:** {fmt_date(last_active)}")
 
     user_email = user.get("email")
-    past_chats = list(chats.find({"user_id": user_email}).sort("start_time", -1))
+    past_chats = list(chats.find({"user_id": user_email}, CHAT_PROJECTION).sort("start_time", -1))
+    # topics come from the first bucket of each session (one query for all of them)
+    first_bucket = first_messages(
+        [c.get("session_id") for c in past_chats if c.get("bucket_count")], buckets_col=chat_buckets)
     st.sidebar.markdown("---")
 
     def load_chat(session_id):
-        chat_data = chats.find_one({"session_id": session_id})
+        chat_data = chats.find_one({"session_id": session_id}, CHAT_PROJECTION)
         if chat_data:
             st.session_state.session_id = chat_data.get("session_id")
             st.session_state.chat_start_time = chat_data.get("start_time")
-            st.session_state.chat_history = chat_data.get("messages", [])
+            st.session_state.chat_history = load_messages(
+                session_id, header=chat_data, last_buckets=CHAT_HISTORY_BUCKETS,
+                chats_col=chats, buckets_col=chat_buckets)
             st.session_state.chat_loaded_for_session = session_id
             st.success(f"✅ Loaded chat session {session_id}!")
 
@@ -523,7 +717,7 @@ def user_details():
         for idx, msg in enumerate(past_chats, start=1):
             session_id = msg.get("session_id")
             start_time = msg.get("start_time")
-            messages = msg.get("messages", [])
+            messages = msg.get("messages") or first_bucket.get(session_id, [])
             topic = get_chat_topic(messages)
 
             # Garantir que start_time é datetime
@@ -582,11 +776,13 @@ def chat_interface():
             with col1:
                 if st.button("👍", key=f"thumbsup_{idx}"):
                     handle_feedback(st.session_state.user, msg["question"], msg["answer"],
-                                    st.session_state.get("session_id"), feedback_text="like", liked=True)
+                                    st.session_state.get("session_id"), feedback_text="like", liked=True,
+                                    message_id=msg.get("message_id"))
             with col2:
                 if st.button("👎", key=f"thumbsdown_{idx}"):
                     handle_feedback(st.session_state.user, msg["question"], msg["answer"],
-                                    st.session_state.get("session_id"), feedback_text="dislike", liked=False)
+                                    st.session_state.get("session_id"), feedback_text="dislike", liked=False,
+                                    message_id=msg.get("message_id"))
         else:
             elapsed = 0
             try:
@@ -624,97 +820,35 @@ def chat_interface():
         if not st.session_state.get("session_id"):
             st.session_state.session_id = generate_chat_id()
             st.session_state.chat_start_time = datetime.now(timezone.utc)
+            # nothing to reload yet: the first turn is still only in chat_history
+            st.session_state.chat_loaded_for_session = st.session_state.session_id
 
-        chats.update_one(
-            {"session_id": st.session_state.session_id},
-            {"$setOnInsert": {
-                "user_id": st.session_state.user.get("email") if st.session_state.user else None,
-                "start_time": st.session_state.chat_start_time,
-                "messages": []
-            }, "$set": {"last_updated": datetime.now(timezone.utc)}},
-            upsert=True
-        )
-
-        sentiment_pred = predict_sentiment_with_text(user_input)
-        priority_pred = predict_priority_with_text(user_input)
         user_time = datetime.now(timezone.utc)
 
-        session_id_ret, message_id, message = save_chat_message(
-            st.session_state.user,
-            user_input,
-            answer=None,
-            tag=None,
-            sentiment=sentiment_pred,
-            priority=priority_pred,
-            embedding=None,
-            user_time=user_time,
-            bot_time=None
-        )
-
-        if message is not None:
-            st.session_state.chat_history.append(message)
-        else:
+        if CHAT_BATCH_TURN_WRITES:
+            # persisted together with its answer below (one write per turn)
             st.session_state.chat_history.append({
                 "message_id": None,
                 "question": user_input,
                 "answer": None,
                 "user_time": user_time
             })
+            st.rerun()
+
+        # sentiment / priority / embedding are filled in by services.enrichment
+        st.session_state.chat_history.append({
+            "message_id": None,
+            "question": user_input,
+            "answer": None,
+            "user_time": user_time
+        })
+        save_question(len(st.session_state.chat_history) - 1, st.session_state.chat_history[-1])
         st.rerun()
 
 
     for idx, msg in enumerate(st.session_state.chat_history):
         if not msg.get("answer"):
-            question = msg.get("question")
-            answer, tag = generate_bot_response(question)
-            bot_time = datetime.now(timezone.utc)            
-            emb = get_bert_embeddings(msg["question"])
-
-            try:
-                emb = get_bert_embeddings(question)
-                emb_list = emb.tolist() if hasattr(emb, "tolist") else list(emb)
-            except Exception:
-                emb_list = None
-
-            st.session_state.chat_history[idx].update({
-                "answer": answer,
-                "bot_time": bot_time,
-                "intent_tag": tag,
-                "bert_embedding": emb_list
-            })
-
-            session_id = st.session_state.get("session_id")
-            message_id = msg.get("message_id")
-            try:
-                if message_id:
-                    chats.update_one(
-                        {"session_id": session_id, "messages.message_id": message_id},
-                        {"$set": {
-                            "messages.$.answer": answer,
-                            "messages.$.bot_time": bot_time,
-                            "messages.$.intent_tag": tag,
-                            "messages.$.bert_embedding": emb_list
-                        }}
-                    )
-                else:
-                    chats.update_one(
-                        {"session_id": session_id},
-                        {"$push": {"messages": {
-                            "message_id": str(_uuid.uuid4()),
-                            "question": question,
-                            "answer": answer,
-                            "timestamp": datetime.now(timezone.utc),
-                            "user_time": msg.get("user_time"),
-                            "bot_time": bot_time,
-                            "intent_tag": tag,
-                            "sentiment": msg.get("sentiment"),
-                            "priority": msg.get("priority"),
-                            "bert_embedding": emb_list
-                        }}}
-                    )
-            except Exception as e:
-                logging.error("Failed to persist bot answer: %s", e)
-
+            answer_pending_turn(idx, msg)
             st.rerun()
             break
 
@@ -744,11 +878,13 @@ if "user" not in st.session_state or st.session_state.user is None:
                     {"$set": {"last_active": datetime.now(timezone.utc)}})
                 
                 st.session_state.user = user
-                last_chat = chats.find_one({"user_id": email}, sort=[("start_time", -1)])
+                last_chat = chats.find_one({"user_id": email}, CHAT_PROJECTION, sort=[("start_time", -1)])
                 if last_chat:
                     st.session_state.session_id = last_chat["session_id"]
                     st.session_state.chat_start_time = last_chat.get("start_time")
-                    st.session_state.chat_history = last_chat.get("messages", [])
+                    st.session_state.chat_history = load_messages(
+                        last_chat["session_id"], header=last_chat, last_buckets=CHAT_HISTORY_BUCKETS,
+                        chats_col=chats, buckets_col=chat_buckets)
                     st.session_state.chat_loaded_for_session = st.session_state.session_id
                 else:
                     st.session_state.session_id = None
@@ -766,7 +902,7 @@ if "user" not in st.session_state or st.session_state.user is None:
         ticket_id = st.text_input("Enter your Ticket ID")
 
         if st.button("Resume via Ticket ID"):
-            chat_data = chats.find_one({"session_id": ticket_id})
+            chat_data = chats.find_one({"session_id": ticket_id}, CHAT_PROJECTION)
 
             if chat_data:
                 email = chat_data["user_id"]
@@ -777,7 +913,9 @@ if "user" not in st.session_state or st.session_state.user is None:
                     st.session_state.session_id = ticket_id
                     st.session_state.chat_start_time = chat_data.get(
                         "start_time", datetime.now(timezone.utc))
-                    st.session_state.chat_history = chat_data.get("messages", [])
+                    st.session_state.chat_history = load_messages(
+                        ticket_id, header=chat_data, last_buckets=CHAT_HISTORY_BUCKETS,
+                        chats_col=chats, buckets_col=chat_buckets)
                     st.session_state.chat_loaded_for_session = ticket_id
 
                     logging.info("✅ Session restored!")
@@ -3,12 +3,16 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 from bson import ObjectId
+from pymongo import UpdateOne
 from pathlib import Path
 from datetime import datetime, timezone
 import altair as alt
 
 from services.mongo import db
+from services.content_version import bump_version
+from services.chat_store import messages_for_sessions, sessions_matching, bulk_update_messages, legacy_message_keys
 
 st.set_page_config(page_title="📊 Chatbot Dashboard", page_icon="👩‍💻", layout="wide")
 
@@ -22,6 +26,7 @@ st.title("📊 Chatbot Admin Dashboard")
 
 # Mongo collections
 chats = db["chats"]
+chat_buckets = db["chat_buckets"]
 monitoring = db["monitoring"]
 unanswered = db["unanswered"]
 faq = db["faq"]
@@ -31,6 +36,33 @@ knowledge = db["knowledge"]
 def get_recent(collection, filter={}, sort_field="start_time", limit=50):
     return list(collection.find(filter).sort(sort_field, -1).limit(limit))
 
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and pd.isna(value))
+
+def changed_fields(before: dict, after: dict) -> dict:
+    """Fields of an edited row that differ from the original (as plain Python values)."""
+    changes = {}
+    for key, value in after.items():
+        old = before.get(key)
+        if _is_missing(value) and _is_missing(old):
+            continue
+        try:
+            same = bool(value == old)
+        except (TypeError, ValueError):
+            same = False
+        if not same:
+            changes[key] = value.item() if isinstance(value, np.generic) else value
+    return changes
+
+def message_changes(original: pd.DataFrame, edited: pd.DataFrame, editable=("question", "answer", "thumbs_up", "thumbs_down")):
+    """[(session_id, message_id, {field: value})] for the rows edited in the message editor."""
+    updates = []
+    for (_, before), (_, after) in zip(original.iterrows(), edited.iterrows()):
+        fields = changed_fields(before[list(editable)].to_dict(), after[list(editable)].to_dict())
+        if fields:
+            updates.append((before["session_id"], before["message_id"], fields))
+    return updates
+
 tab1, tab2, tab3, tab4 = st.tabs([
     "📚 FAQs",
     "📄 Knowledge Articles",
@@ -53,7 +85,9 @@ with tab1:
             cancelled = st.form_submit_button("Cancel")
 
             if submitted:
-                faq.insert_one({"question": new_q, "answer": new_a})
+                new_doc = {"question": new_q, "answer": new_a}
+                faq.insert_one(new_doc)
+                bump_version("faq", "insert", new_doc)
                 st.success("New FAQ added!")
                 del st.session_state['adding_new_faq']
                 st.rerun()
@@ -77,6 +111,7 @@ with tab1:
         with col2:
             if st.button("🗑️ Delete", key=f"delete_faq_{doc['_id']}"):
                 faq.delete_one({"_id": doc["_id"]})
+                bump_version("faq", "delete", {"_id": doc["_id"]})
                 st.success("FAQ deleted!")
                 st.rerun()
 
@@ -90,10 +125,12 @@ with tab1:
             cancelled = st.form_submit_button("Cancel")
 
             if submitted:
+                faq_id = ObjectId(st.session_state['editing_faq_id'])
                 faq.update_one(
-                    {"_id": ObjectId(st.session_state['editing_faq_id'])},
+                    {"_id": faq_id},
                     {"$set": {"question": q, "answer": a}}
                 )
+                bump_version("faq", "update", {"_id": faq_id, "question": q, "answer": a})
                 st.success("FAQ updated!")
                 del st.session_state['editing_faq_id']
                 del st.session_state['editing_faq_question']
@@ -121,11 +158,13 @@ with tab2:
             cancelled = st.form_submit_button("Cancel")
 
             if submitted:
-                knowledge.insert_one({
+                new_doc = {
                     "title": new_t,
                     "content": new_c,
                     "import_timestamp": datetime.now(timezone.utc)
-                })
+                }
+                knowledge.insert_one(new_doc)
+                bump_version("knowledge", "insert", new_doc)
                 st.success("New article added!")
                 del st.session_state['adding_new_article']
                 st.rerun()
@@ -149,6 +188,7 @@ with tab2:
         with col2:
             if st.button(f"🗑️ Delete Article", key=f"delete_article_{article['_id']}"):
                 knowledge.delete_one({"_id": article["_id"]})
+                bump_version("knowledge", "delete", {"_id": article["_id"]})
                 st.success("Article deleted!")
                 st.rerun()
 
@@ -162,10 +202,12 @@ with tab2:
             cancelled = st.form_submit_button("Cancel")
 
             if submitted:
+                article_id = ObjectId(st.session_state['editing_article_id'])
                 knowledge.update_one(
-                    {"_id": ObjectId(st.session_state['editing_article_id'])},
+                    {"_id": article_id},
                     {"$set": {"title": t, "content": c}}
                 )
+                bump_version("knowledge", "update", {"_id": article_id, "title": t, "content": c})
                 st.success("Article updated!")
                 del st.session_state['editing_article_id']
                 del st.session_state['editing_article_title']
@@ -189,17 +231,20 @@ with tab3:
             "$or": [
                 {"user_id": {"$regex": search_term, "$options": "i"}},
                 {"messages.question": {"$regex": search_term, "$options": "i"}},
-                {"messages.answer": {"$regex": search_term, "$options": "i"}}
+                {"messages.answer": {"$regex": search_term, "$options": "i"}},
+                {"session_id": {"$in": sessions_matching(search_term, buckets_col=chat_buckets)}}
             ]
         }
 
     chat_sessions = get_recent(chats, query, "start_time", 50)
+    # legacy chats.messages + the buckets of these sessions only (one query)
+    session_messages = messages_for_sessions(chat_sessions, buckets_col=chat_buckets)
 
     if chat_sessions:
         for chat in chat_sessions:
             session_id = chat.get("session_id", "N/A")
             user_id = chat.get("user_id", "N/A")
-            messages = chat.get("messages", [])
+            messages = session_messages.get(chat.get("session_id"), [])
             start_time = chat.get("start_time")
             readable_time = start_time.strftime('%Y-%m-%d %H:%M:%S') if isinstance(start_time, datetime) else "unknown"
 
@@ -232,26 +277,56 @@ with tab3:
     else:
         st.info("No chat sessions found.")
 
+    # ✏️ Edição de mensagens das sessões listadas: só os campos alterados, num único bulk_write
+    message_rows = [
+        {"session_id": sid, "message_id": m["message_id"], "question": m.get("question") or "",
+         "answer": m.get("answer") or "", "thumbs_up": bool(m.get("thumbs_up")),
+         "thumbs_down": bool(m.get("thumbs_down"))}
+        for sid, msgs in session_messages.items() for m in msgs if m.get("message_id")
+    ]
+    if message_rows:
+        st.markdown("---")
+        st.info("✏️ Message Editor (sessions listed above)")
+        df_messages = pd.DataFrame(message_rows)
+        edited_messages = st.data_editor(df_messages, disabled=["session_id", "message_id"], key="message_editor")
+
+        if st.button("💾 Save message changes"):
+            updates = message_changes(df_messages, edited_messages)
+            # por mensagem: uma sessão não migrada tem mensagens em chats e em chat_buckets
+            legacy = legacy_message_keys(chat_sessions)
+            modified = bulk_update_messages(updates, legacy, chats_col=chats, buckets_col=chat_buckets)
+            st.success(f"✅ {modified} message(s) updated.")
+
     st.markdown("---")
     st.info("🗄️ Quick MongoDB Chats Editor")
 
-    df_chats = pd.DataFrame(list(chats.find()))
+    df_chats = pd.DataFrame(list(chats.find({}, {"messages.bert_embedding": 0})))
     if not df_chats.empty:
         df_chats["_id"] = df_chats["_id"].astype(str)
         edited_df = st.data_editor(df_chats, num_rows="dynamic")
 
         if st.button("💾 Save changes"):
+            # only the fields that changed, one bulk_write for every edited row
+            originals = {row["_id"]: row.to_dict() for _, row in df_chats.iterrows()}
+            requests = []
             for _, row in edited_df.iterrows():
-                doc_id = ObjectId(row["_id"])
-                updated_doc = row.drop(labels=["_id"]).to_dict()
-                chats.update_one({"_id": doc_id}, {"$set": updated_doc})
-            st.success("Chats collection updated!")
+                if row["_id"] not in originals:
+                    continue
+                fields = changed_fields(originals[row["_id"]], row.drop(labels=["_id"]).to_dict())
+                if fields:
+                    requests.append(UpdateOne({"_id": ObjectId(row["_id"])}, {"$set": fields}))
+            if requests:
+                chats.bulk_write(requests, ordered=False)
+            st.success(f"Chats collection updated! ({len(requests)} document(s) changed)")
 
     delete_id = st.text_input("Delete chat by _id (paste ObjectId here):")
     if st.button("Delete document"):
         try:
             oid = ObjectId(delete_id)
+            header = chats.find_one({"_id": oid}, {"session_id": 1})
             result = chats.delete_one({"_id": oid})
+            if header and header.get("session_id"):
+                chat_buckets.delete_many({"session_id": header["session_id"]})
             if result.deleted_count > 0:
                 st.success("Document deleted!")
             else:
@@ -274,13 +349,17 @@ with tab4:
 
     st.markdown("---")
 
-    # 🔹 Estatísticas de sentimento a partir de chats.messages
+    # 🔹 Mensagens: chat_buckets + sessões antigas ainda em chats.messages
+    legacy_messages = {"$unionWith": {"coll": "chats", "pipeline": [{"$match": {"messages.0": {"$exists": True}}}]}}
+
+    # 🔹 Estatísticas de sentimento
     pipeline_sentiment = [
+        legacy_messages,
         {"$unwind": "$messages"},
         {"$match": {"messages.sentiment": {"$exists": True}}},
         {"$group": {"_id": "$messages.sentiment", "count": {"$sum": 1}}}
     ]
-    sentiment_counts = list(chats.aggregate(pipeline_sentiment))
+    sentiment_counts = list(chat_buckets.aggregate(pipeline_sentiment))
     df_sentiment = pd.DataFrame(sentiment_counts).rename(columns={"_id": "Sentiment", "count": "Count"})
 
     if not df_sentiment.empty:
@@ -293,8 +372,9 @@ with tab4:
     else:
         st.info("No sentiment data available.")
 
-    # 🔹 Estatísticas de intent_tag e feedback a partir de chats.messages
+    # 🔹 Estatísticas de intent_tag e feedback
     pipeline_intents = [
+        legacy_messages,
         {"$unwind": "$messages"},
         {"$match": {"messages.intent_tag": {"$exists": True}}},
         {
@@ -309,7 +389,7 @@ with tab4:
             }
         }
     ]
-    agg_result = list(chats.aggregate(pipeline_intents))
+    agg_result = list(chat_buckets.aggregate(pipeline_intents))
 
     if agg_result:
         data = agg_result[0]
@@ -22,6 +22,13 @@ from services.embeddings import get_bert_embeddings, get_gpt2_embeddings, get_sb
 from sklearn.model_selection import train_test_split
 from services.db import save_embedding_evaluation_results
 from services.evaluation import run_full_evaluation
+from services.answer_cache import answer_cache
+from services.semantic_cache import semantic_cache
+from services.model_registry import model_registry
+from services.enrichment import get_enrichment_worker
+from services.batching import batching_stats
+from services.embedding_cache import embedding_cache
+from services.event_sink import event_sink
 
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -353,6 +360,64 @@ with tab4:
     else:
         st.warning("No logs found for the selected type.")
 
+    st.markdown("### ⚡ Answer Cache")
+    cache_stats = answer_cache.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Hits", cache_stats["hits"])
+    col2.metric("Misses", cache_stats["misses"])
+    col3.metric("Hit ratio", f"{cache_stats['hit_ratio']:.1%}")
+    col4.metric("Entries", f"{cache_stats['size']} / {cache_stats['max_size']}")
+    st.caption(
+        f"Evictions: {cache_stats['evictions']} · Expired: {cache_stats['expirations']} · "
+        f"Invalidations (content edits): {cache_stats['invalidations']} · TTL: {cache_stats['ttl_seconds']:.0f}s"
+    )
+
+    semantic_stats = semantic_cache.stats()
+    st.caption(
+        f"🧠 Semantic AI cache — hits: {semantic_stats['hits']} · misses: {semantic_stats['misses']} · "
+        f"hit ratio: {semantic_stats['hit_ratio']:.1%} · entries: {semantic_stats['size']} / {semantic_stats['max_size']} · "
+        f"threshold: {semantic_stats['threshold']} · purged (👎): {semantic_stats['purged']}"
+    )
+
+    enrich_stats = get_enrichment_worker().stats()
+    st.caption(
+        f"🧵 Background enrichment — queued: {enrich_stats['queued']} / {enrich_stats['max_queue']} · "
+        f"processed: {enrich_stats['processed']} · dropped: {enrich_stats['dropped']} · "
+        f"failed: {enrich_stats['failed']} · last lag: {enrich_stats['last_lag_ms']:.0f} ms"
+    )
+
+    sink_stats = event_sink.stats()
+    st.caption(
+        f"📝 Event sink ({sink_stats['policy']}) — queued: {sink_stats['queued']} / {sink_stats['max_queue']} · "
+        f"flushed: {sink_stats['flushed']} in {sink_stats['batches']} batches · "
+        f"dropped: {sink_stats['dropped']} · failed: {sink_stats['failed']}"
+    )
+
+    emb_stats = embedding_cache.stats()
+    st.caption(
+        f"🧮 Embedding cache — hit ratio: {emb_stats['hit_ratio']:.1%} "
+        f"(memory {emb_stats['memory_hits']}, disk {emb_stats['disk_hits']}, misses {emb_stats['misses']}) · "
+        f"in memory: {emb_stats['memory_size']} / {emb_stats['max_size']} · "
+        f"on disk: {sum(emb_stats['disk_rows'].values())} vectors"
+    )
+
+    batch_stats = batching_stats()
+    if batch_stats:
+        st.markdown("### 📦 Micro-batching")
+        st.dataframe(pd.DataFrame(batch_stats), use_container_width=True)
+
+    st.markdown("### 🧠 Loaded Models")
+    model_stats = model_registry.stats()
+    if model_stats:
+        st.dataframe(pd.DataFrame(model_stats), use_container_width=True)
+    st.caption(
+        f"Total: {model_registry.total_mb():.1f} MB · loads: {model_registry.loads} · "
+        f"unloads: {model_registry.unloads} · idle TTL: {model_registry.idle_ttl:.0f}s"
+    )
+    if st.button("🗑 Unload idle models"):
+        unloaded = model_registry.unload_idle()
+        st.success(f"Unloaded: {', '.join(unloaded) or 'none'}")
+
     st.markdown("---")
 st.subheader("📊 Embeddings Evaluation (On-demand)")
 
@@ -0,0 +1,216 @@
+# services/ann_index.py
+# ===============================
+# Approximate nearest-neighbour search (IVF, inverted file) in pure NumPy.
+#
+# Vectors are L2-normalized and partitioned by a KMeans coarse quantizer
+# (services.ml.train_kmeans_on_vectors). A query only scores the vectors in
+# the `nprobe` lists whose centroids are closest to it, so latency grows with
+# nprobe * N / nlist instead of N. `nprobe` is the recall/latency knob:
+# nprobe == nlist is exact search.
+#
+# Storage is CSR-like (vectors sorted by list + offsets) so each probed list
+# is a contiguous view; adds go to a small pending buffer and replaced or
+# deleted stored vectors to a tombstone set until the next compaction.
+# Indexes persist as a directory of .npy files and can be loaded memory-mapped.
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from services.vector_index import normalize_rows
+
+DEFAULT_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+COMPACT_RATIO = 0.1
+
+
+def default_nlist(n: int) -> int:
+    """Rule of thumb: ~4*sqrt(N) lists, at least 1 and at most N."""
+    return int(max(1, min(n, round(4 * np.sqrt(max(n, 1))))))
+
+
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, nprobe: int = DEFAULT_NPROBE):
+        self.centroids = normalize_rows(centroids)
+        self.nprobe = nprobe
+        dim = self.centroids.shape[1]
+
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._lists = np.zeros(0, dtype=np.int32)
+        self._offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+
+        self._pending_vectors = []
+        self._pending_ids = []
+        self._deleted = set()
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+
+    def __len__(self):
+        stored = len(self._ids)
+        if self._deleted:
+            stored -= int(np.isin(self._ids, self._deleted_array()).sum())
+        return stored + sum(len(i) for i in self._pending_ids)
+
+    def _deleted_array(self) -> np.ndarray:
+        return np.fromiter(self._deleted, dtype=np.int64, count=len(self._deleted))
+
+    # =========================
+    # Build
+    # =========================
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: Optional[int] = None,
+              nprobe: int = DEFAULT_NPROBE, sample_size: int = 100000,
+              random_state: int = 42) -> "IVFIndex":
+        """Fit the coarse quantizer on (a sample of) `vectors`."""
+        from services.ml import train_kmeans_on_vectors
+
+        vectors = normalize_rows(vectors)
+        nlist = nlist or default_nlist(len(vectors))
+        if len(vectors) > sample_size:
+            rng = np.random.default_rng(random_state)
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        logging.info(f"🔹 Training IVF quantizer: nlist={nlist} on {len(vectors)} vectors")
+        kmeans = train_kmeans_on_vectors(vectors, nlist, random_state=random_state)
+        return cls(kmeans.cluster_centers_, nprobe=nprobe)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(normalize_rows(vectors) @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _drop_pending(self, ids: np.ndarray):
+        for pos, pending_ids in enumerate(self._pending_ids):
+            keep = ~np.isin(pending_ids, ids)
+            if not keep.all():
+                self._pending_ids[pos] = pending_ids[keep]
+                self._pending_vectors[pos] = self._pending_vectors[pos][keep]
+
+    def add(self, ids: Iterable[int], vectors: np.ndarray):
+        """Insert or replace vectors; replaced copies are tombstoned."""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if not len(ids):
+            return
+        self._deleted.update(ids.tolist())
+        self._drop_pending(ids)
+        self._pending_ids.append(ids)
+        self._pending_vectors.append(normalize_rows(vectors))
+        if sum(len(i) for i in self._pending_ids) > COMPACT_RATIO * max(len(self._ids), 1000):
+            self.compact()
+
+    def remove(self, ids: Iterable[int]):
+        ids = np.asarray(list(ids), dtype=np.int64)
+        self._deleted.update(ids.tolist())
+        self._drop_pending(ids)
+        if len(self._deleted) > COMPACT_RATIO * max(len(self._ids), 1000):
+            self.compact()
+
+    def compact(self):
+        """Merge pending adds into the sorted lists and drop tombstoned ids."""
+        alive = np.ones(len(self._ids), dtype=bool)
+        if self._deleted:
+            alive = ~np.isin(self._ids, self._deleted_array())
+        vectors, ids, lists = [self._vectors[alive]], [self._ids[alive]], [self._lists[alive]]
+        if self._pending_ids:
+            pending = np.vstack(self._pending_vectors)
+            vectors.append(pending)
+            ids.append(np.concatenate(self._pending_ids))
+            lists.append(self.assign(pending))
+
+        vectors, ids, lists = np.vstack(vectors), np.concatenate(ids), np.concatenate(lists)
+        order = np.argsort(lists, kind="stable")
+        self._vectors = np.ascontiguousarray(vectors[order])
+        self._ids = ids[order]
+        self._lists = lists[order]
+        self._offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self._lists, minlength=self.nlist), out=self._offsets[1:])
+
+        self._pending_vectors, self._pending_ids = [], []
+        self._deleted = set()
+
+    # =========================
+    # Search
+    # =========================
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, scores) of the approximate top-k by cosine similarity."""
+        q = normalize_rows(query)[0]
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+
+        centroid_scores = self.centroids @ q
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        cand_ids, cand_scores = [], []
+        for lst in probe:
+            start, end = self._offsets[lst], self._offsets[lst + 1]
+            if end > start:
+                cand_ids.append(self._ids[start:end])
+                cand_scores.append(self._vectors[start:end] @ q)
+        if cand_ids and self._deleted:
+            ids, scores = np.concatenate(cand_ids), np.concatenate(cand_scores)
+            alive = ~np.isin(ids, self._deleted_array())
+            cand_ids, cand_scores = [ids[alive]], [scores[alive]]
+        for ids, vecs in zip(self._pending_ids, self._pending_vectors):
+            cand_ids.append(ids)
+            cand_scores.append(vecs @ q)
+
+        if not cand_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids, scores = np.concatenate(cand_ids), np.concatenate(cand_scores)
+
+        k = min(k, len(ids))
+        if k == 0:
+            return ids[:0], scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    # =========================
+    # Persistence
+    # =========================
+    def save(self, path):
+        """Write the index as a directory of .npy files plus meta.json."""
+        self.compact()
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "centroids.npy", self.centroids)
+        np.save(path / "vectors.npy", self._vectors)
+        np.save(path / "ids.npy", self._ids)
+        np.save(path / "lists.npy", self._lists)
+        np.save(path / "offsets.npy", self._offsets)
+        with open(path / "meta.json", "w") as f:
+            json.dump({"nlist": self.nlist, "dim": self.dim, "nprobe": self.nprobe, "size": len(self._ids)}, f)
+        logging.info(f"✅ IVF index saved to {path} ({len(self._ids)} vectors)")
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "IVFIndex":
+        path = Path(path)
+        mode = "r" if mmap else None
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        index = cls(np.load(path / "centroids.npy"), nprobe=meta.get("nprobe", DEFAULT_NPROBE))
+        index._vectors = np.load(path / "vectors.npy", mmap_mode=mode)
+        index._ids = np.load(path / "ids.npy", mmap_mode=mode)
+        index._lists = np.load(path / "lists.npy", mmap_mode=mode)
+        index._offsets = np.load(path / "offsets.npy")
+        return index
+
+    def reset(self):
+        """Keep the trained quantizer, drop all stored vectors."""
+        fresh = IVFIndex(self.centroids, nprobe=self.nprobe)
+        self.__dict__.update(fresh.__dict__)
+
+
+def exact_search(matrix: np.ndarray, query: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    """Brute-force reference: rows of a normalized matrix, top-k by dot product."""
+    scores = matrix @ normalize_rows(query)[0]
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top, scores[top]
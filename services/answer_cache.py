@@ -0,0 +1,130 @@
+# services/answer_cache.py
+# ===============================
+# Process-wide cache of final chatbot answers keyed on a normalized question
+# ("Reset password?" and "reset   password" share one entry). Entries are
+# evicted LRU once the cache is full and expire after a TTL. Any write to the
+# faq, knowledge or default_chat collections (services.content_version) clears
+# the cache, so edited content is never shadowed by an old answer; an answer
+# computed from content that changed while it was being generated is not
+# stored at all (put(..., versions=...)).
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from services.content_version import CONTENT_COLLECTIONS, get_versions, subscribe
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Casefold, strip accents and punctuation, collapse whitespace."""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = _PUNCT_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+class AnswerCache:
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()    # key -> (answer, source, versions, expires_at)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+        self.stale_puts = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, question: str) -> Optional[tuple]:
+        """Return (answer, source) for a cached question, or None."""
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                answer, source, versions, expires_at = entry
+                if expires_at <= self._clock():
+                    del self._entries[key]
+                    self.expirations += 1
+                elif versions != get_versions():
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return answer, source
+            self.misses += 1
+            return None
+
+    def put(self, question: str, answer: str, source: str, versions: Optional[tuple] = None):
+        """
+        Cache an answer. `versions` are the content versions taken when the
+        answer's lookup started; if content changed since, it is not stored.
+        """
+        key = normalize_question(question)
+        if not key or not answer:
+            return
+        current = get_versions()
+        if versions is not None and versions != current:
+            with self._lock:
+                self.stale_puts += 1
+            return
+        with self._lock:
+            self._entries[key] = (answer, source, current, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, question: str) -> bool:
+        with self._lock:
+            return self._entries.pop(normalize_question(question), None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
+
+
+# =========================
+# Shared cache
+# =========================
+answer_cache = AnswerCache()
+
+
+def get_answer_cache() -> AnswerCache:
+    return answer_cache
+
+
+def _on_content_change(name, action, doc):
+    answer_cache.clear()
+
+
+for _name in CONTENT_COLLECTIONS:
+    subscribe(_name, _on_content_change)
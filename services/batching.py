@@ -0,0 +1,177 @@
+# services/batching.py
+# ===============================
+# In-process micro-batching for model inference.
+#
+# Every Streamlit session embeds one question at a time, and all of them
+# share the same model. A MicroBatcher collects the requests that
+# arrive within BATCH_MAX_WAIT_MS of each other (up to BATCH_MAX_SIZE), runs
+# them as one padded batch on a single worker thread and resolves each
+# caller's Future with its own row:
+#
+#   vec = get_batcher("bert").submit("reset my password").result()
+#
+# Under load this turns N forward passes of batch 1 into a few passes of
+# batch N; with a single user it adds at most BATCH_MAX_WAIT_MS.
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "true").lower() in ("1", "true", "yes")
+
+_STOP = object()
+
+
+class MicroBatcher:
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], Any],
+                 max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._batch_sizes = deque(maxlen=1000)
+        self._waits_ms = deque(maxlen=1000)
+        self.requests = self.batches = self.errors = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                self._thread.start()
+
+    def submit(self, item) -> Future:
+        """Queue one input; the Future resolves to its row of batch_fn's output."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def map(self, items: List[Any], timeout: Optional[float] = None) -> list:
+        futures = [self.submit(item) for item in items]
+        return [f.result(timeout) for f in futures]
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [b for b in batch if b[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                outputs = self.batch_fn([item for item, _, _ in batch])
+                for (_, future, _), output in zip(batch, outputs):
+                    future.set_result(output)
+            except Exception as e:
+                logging.error(f"❌ Batch {self.name} failed ({len(batch)} items): {e}")
+                with self._lock:
+                    self.errors += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            with self._lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self._batch_sizes.append(len(batch))
+                self._waits_ms.extend((started - t) * 1000 for _, _, t in batch)
+
+    def close(self):
+        self._queue.put(_STOP)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes, waits = list(self._batch_sizes), list(self._waits_ms)
+            return {
+                "batcher": self.name,
+                "requests": self.requests,
+                "batches": self.batches,
+                "errors": self.errors,
+                "avg_batch": round(float(np.mean(sizes)), 2) if sizes else 0.0,
+                "p95_wait_ms": round(float(np.percentile(waits, 95)), 2) if waits else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+# =========================
+# Shared batchers
+# =========================
+def _bert_batch(texts):
+    from services.embeddings import embed_bert_batch
+    return embed_bert_batch(texts)
+
+
+def _sbert_batch(texts):
+    from services.embeddings import get_sbert_embeddings
+    return get_sbert_embeddings(list(texts))
+
+
+BATCH_FUNCTIONS = {
+    "bert": _bert_batch,
+    "sbert": _sbert_batch,
+}
+
+_batchers: Dict[str, MicroBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(name: str) -> MicroBatcher:
+    with _batchers_lock:
+        if name not in _batchers:
+            _batchers[name] = MicroBatcher(name, BATCH_FUNCTIONS[name])
+        return _batchers[name]
+
+
+def batched_embed_fn(name: str) -> Callable:
+    """
+    embed_fn(texts) -> (n, dim) array that sends small requests (the per-query
+    calls of the chat path) through the shared batcher. Lists larger than a
+    batch (index builds) go straight to the model.
+    """
+    def embed(texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        batcher = get_batcher(name)
+        if len(texts) > batcher.max_batch_size:
+            return np.asarray(BATCH_FUNCTIONS[name](list(texts)), dtype=np.float32)
+        return np.stack([np.asarray(v, dtype=np.float32) for v in batcher.map(list(texts))])
+
+    return embed
+
+
+def batching_stats() -> List[dict]:
+    with _batchers_lock:
+        return [b.stats() for b in _batchers.values()]
@@ -0,0 +1,275 @@
+# services/bm25.py
+# ===============================
+# In-process BM25 lexical index over knowledge articles and FAQs.
+#
+# Replaces the unanchored $regex lookups (COLLSCAN, and only matching when the
+# whole user sentence appears verbatim in an article). Postings are compact
+# array-backed lists (doc ids as uint32, term frequencies as uint16) that are
+# scored with NumPy without copying; documents can be added, replaced and
+# deleted incrementally through services.content_version events.
+
+import logging
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from services.content_version import subscribe
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Minimum normalized score (0-1) for a lexical hit to be used as an answer;
+# below it the chatbot falls through to the next tier / the AI model.
+BM25_MIN_SCORE = float(os.getenv("BM25_MIN_SCORE", "0.5"))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset("""
+a an and are as at be but by can could do does for from had has have how i if in is it its
+me my of on or our please so that the their them then there these this to was we were what
+when where which who why will with would you your i'm it's can't don't
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords."""
+    return [t for t in TOKEN_RE.findall(str(text or "").lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1, self.b = k1, b
+        self._postings = {}          # term -> (array('I') doc ids, array('H') tfs)
+        self._df = Counter()         # live document frequency per term
+        self._doc_len = array("I")
+        self._alive = bytearray()
+        self._keys: List[str] = []
+        self._payloads: List[dict] = []
+        self._terms: List[tuple] = []
+        self._doc_of = {}
+        self._total_len = 0
+        self._n_alive = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._n_alive
+
+    def __contains__(self, key):
+        return key in self._doc_of
+
+    def add(self, key: str, text: str, payload: Optional[dict] = None):
+        """Index `text` under `key`, replacing any previous version of it."""
+        counts = Counter(tokenize(text))
+        with self._lock:
+            self._delete_locked(key)
+            doc = len(self._keys)
+            self._keys.append(key)
+            self._payloads.append(payload or {})
+            self._terms.append(tuple(counts))
+            self._doc_of[key] = doc
+            length = sum(counts.values())
+            self._doc_len.append(length)
+            self._alive.append(1)
+            self._total_len += length
+            self._n_alive += 1
+            for term, tf in counts.items():
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = (array("I"), array("H"))
+                posting[0].append(doc)
+                posting[1].append(min(tf, 65535))
+                self._df[term] += 1
+            self._maybe_compact()
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            deleted = self._delete_locked(key)
+            self._maybe_compact()
+            return deleted
+
+    def _delete_locked(self, key: str) -> bool:
+        doc = self._doc_of.pop(key, None)
+        if doc is None:
+            return False
+        self._alive[doc] = 0
+        self._total_len -= self._doc_len[doc]
+        self._n_alive -= 1
+        for term in self._terms[doc]:
+            self._df[term] -= 1
+        return True
+
+    def _maybe_compact(self):
+        dead = len(self._keys) - self._n_alive
+        if dead > 1000 and dead > 0.25 * len(self._keys):
+            self.compact()
+
+    def compact(self):
+        """Rebuild postings without tombstoned documents."""
+        with self._lock:
+            live = [(self._keys[d], d) for d in range(len(self._keys)) if self._alive[d]]
+            old_postings, old_payloads = self._postings, self._payloads
+            fresh = BM25Index(self.k1, self.b)
+            remap = {}
+            for key, d in live:
+                remap[d] = len(fresh._keys)
+                fresh._keys.append(key)
+                fresh._payloads.append(old_payloads[d])
+                fresh._terms.append(self._terms[d])
+                fresh._doc_of[key] = remap[d]
+                fresh._doc_len.append(self._doc_len[d])
+                fresh._alive.append(1)
+            for term, (docs, tfs) in old_postings.items():
+                new_docs, new_tfs = array("I"), array("H")
+                for d, tf in zip(docs, tfs):
+                    if d in remap:
+                        new_docs.append(remap[d])
+                        new_tfs.append(tf)
+                if new_docs:
+                    fresh._postings[term] = (new_docs, new_tfs)
+            fresh._df = +self._df
+            fresh._total_len, fresh._n_alive = self._total_len, self._n_alive
+            lock = self._lock
+            self.__dict__.update(fresh.__dict__)
+            self._lock = lock
+
+    def idf(self, term: str) -> float:
+        df = self._df.get(term, 0)
+        return math.log(1.0 + (self._n_alive - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 5, kind: Optional[str] = None) -> List[dict]:
+        """
+        Ranked hits for `query`. Each hit carries the raw BM25 `score` and a
+        `confidence` in [0, 1]: the score relative to an average-length document
+        containing every query term once (sum of the query idfs), capped at 1.
+        """
+        terms = tokenize(query)
+        with self._lock:
+            n_docs = len(self._keys)
+            if not terms or self._n_alive == 0:
+                return []
+            avg_len = self._total_len / max(self._n_alive, 1)
+            doc_len = np.frombuffer(self._doc_len, dtype=np.uint32, count=n_docs).astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * doc_len / max(avg_len, 1e-9))
+
+            scores = np.zeros(n_docs, dtype=np.float32)
+            max_score = 0.0
+            for term, q_tf in Counter(terms).items():
+                idf = self.idf(term)
+                max_score += q_tf * idf
+                posting = self._postings.get(term)
+                if posting is None:
+                    continue
+                docs = np.frombuffer(posting[0], dtype=np.uint32)
+                tfs = np.frombuffer(posting[1], dtype=np.uint16).astype(np.float32)
+                scores[docs] += q_tf * idf * tfs * (self.k1 + 1.0) / (tfs + norm[docs])
+
+            alive = np.frombuffer(self._alive, dtype=np.uint8, count=n_docs).astype(bool)
+            if kind is not None:
+                alive &= np.fromiter((p.get("kind") == kind for p in self._payloads), dtype=bool, count=n_docs)
+            scores[~alive] = 0.0
+
+            candidates = np.flatnonzero(scores > 0)
+            if not len(candidates):
+                return []
+            k = min(k, len(candidates))
+            top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            top = top[np.argsort(-scores[top])]
+            return [
+                {
+                    "key": self._keys[d],
+                    "score": float(scores[d]),
+                    "confidence": min(1.0, float(scores[d] / max_score)) if max_score else 0.0,
+                    **self._payloads[d],
+                }
+                for d in top
+            ]
+
+
+# =========================
+# FAQ / knowledge documents
+# =========================
+def faq_document(doc: dict):
+    question = str(doc.get("question", "") or "")
+    answer = str(doc.get("answer", "") or "")
+    payload = {"kind": "faq", "question": question, "answer": doc.get("answer")}
+    return f"faq:{doc['_id']}", f"{question} {answer}".strip(), payload
+
+
+def knowledge_document(doc: dict):
+    title = str(doc.get("title", "") or "")
+    content = str(doc.get("content", "") or "")
+    payload = {"kind": "kb", "title": title, "answer": doc.get("content")}
+    return f"kb:{doc['_id']}", f"{title} {content}".strip(), payload
+
+
+DOCUMENT_BUILDERS = {"faq": faq_document, "knowledge": knowledge_document}
+
+
+def index_documents(index: BM25Index, collection: str, docs: Iterable[dict]):
+    for doc in docs:
+        if not doc or doc.get("_id") is None:
+            continue
+        key, text, payload = DOCUMENT_BUILDERS[collection](doc)
+        if text:
+            index.add(key, text, payload)
+        else:
+            # an update that cleared the text must not leave the old postings live
+            index.delete(key)
+
+
+# =========================
+# Shared index
+# =========================
+_lock = threading.Lock()
+_cached = {"collections": None, "index": None, "stale": False}
+
+
+def build_bm25_index(faq_col, knowledge_col) -> BM25Index:
+    index = BM25Index()
+    index_documents(index, "faq", faq_col.find({}, {"question": 1, "answer": 1}))
+    index_documents(index, "knowledge", knowledge_col.find({}, {"title": 1, "content": 1}))
+    logging.info(f"🔹 BM25 index built with {len(index)} documents")
+    return index
+
+
+def get_bm25_index(faq_col, knowledge_col) -> BM25Index:
+    with _lock:
+        cached = _cached["index"]
+        same = _cached["collections"] == (faq_col, knowledge_col)
+        if cached is not None and same and not _cached["stale"]:
+            return cached
+
+    index = build_bm25_index(faq_col, knowledge_col)
+    with _lock:
+        _cached.update(collections=(faq_col, knowledge_col), index=index, stale=False)
+    return index
+
+
+def invalidate_bm25_index():
+    with _lock:
+        _cached.update(collections=None, index=None, stale=False)
+
+
+def _on_content_change(name, action, doc):
+    with _lock:
+        index = _cached["index"]
+    if index is None:
+        return
+    if action in ("insert", "update") and isinstance(doc, dict):
+        index_documents(index, name, [doc])
+    elif action == "delete" and isinstance(doc, dict):
+        prefix = "faq" if name == "faq" else "kb"
+        index.delete(f"{prefix}:{doc['_id']}")
+    elif action == "bulk" and isinstance(doc, list):
+        index_documents(index, name, doc)
+    else:
+        with _lock:
+            _cached["stale"] = True
+
+
+for _name in DOCUMENT_BUILDERS:
+    subscribe(_name, _on_content_change)
@@ -0,0 +1,340 @@
+# services/chat_store.py
+# ===============================
+## python -m services.chat_store --migrate
+## python -m services.chat_store --migrate --batch 200
+#
+# Chat sessions as a small header document plus fixed-size message buckets,
+# instead of one ever-growing chats.messages array:
+#
+#   chats:        {session_id, user_id, start_time, last_updated, bucket_count, layout: "bucketed"}
+#   chat_buckets: {session_id, user_id, created_at, last_updated, count, messages: [...]}
+#                 index (session_id, created_at)
+#
+# An append is one atomic upsert of the session's open bucket ({session_id,
+# count < CHAT_BUCKET_SIZE}: $push + $inc count), which creates a new bucket
+# when the last one is full. The header is only written when that happens
+# ($setOnInsert on the first bucket, $inc bucket_count), so a turn costs a
+# single write. Buckets are read in created_at order and messages in
+# appended_at order; two appends racing to open a bucket may both create one,
+# which only leaves two partially filled buckets. Readers fetch only the
+# buckets they show. Sessions written before the split keep their messages in
+# chats.messages until migrate_to_buckets() runs; readers return those first.
+# The migration copies them into "sealed" buckets dated before the appended
+# ones (appends never go to those) and only then drops chats.messages.
+
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+CHAT_BUCKET_SIZE = int(os.getenv("CHAT_BUCKET_SIZE", "50"))
+# buckets loaded when a session is resumed in the chat page (0 = all)
+CHAT_HISTORY_BUCKETS = int(os.getenv("CHAT_HISTORY_BUCKETS", "2"))
+
+# legacy chats.messages may still carry list embeddings (see services.embedding_store)
+HEADER_PROJECTION = {"messages.bert_embedding": 0}
+
+_collections = None
+
+
+def get_collections():
+    """(chats, chat_buckets) from services.mongo, created on first use."""
+    global _collections
+    if _collections is None:
+        from services.mongo import db
+        _collections = (db["chats"], db["chat_buckets"])
+    return _collections
+
+
+def _resolve(chats_col, buckets_col):
+    if chats_col is None or buckets_col is None:
+        default_chats, default_buckets = get_collections()
+        chats_col = chats_col if chats_col is not None else default_chats
+        buckets_col = buckets_col if buckets_col is not None else default_buckets
+    return chats_col, buckets_col
+
+
+def _buckets(buckets_col):
+    return buckets_col if buckets_col is not None else get_collections()[1]
+
+
+# oldest bucket first; _id breaks created_at ties
+BUCKET_ORDER = [("created_at", 1), ("_id", 1)]
+# migrated buckets of a header without start_time sort before appended ones
+LEGACY_CREATED_AT = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# =========================
+# Writes
+# =========================
+def append_message(session_id: str, message: dict, user_id: Optional[str] = None,
+                   start_time: Optional[datetime] = None, chats_col=None, buckets_col=None,
+                   bucket_size: int = CHAT_BUCKET_SIZE) -> bool:
+    """
+    Append `message` (stamped with message["appended_at"]) to the session's
+    open bucket in one upsert. Returns True when the append opened a new
+    bucket; only then is the session header written (created on first use).
+    """
+    chats_col, buckets_col = _resolve(chats_col, buckets_col)
+    now = datetime.now(timezone.utc)
+    message["appended_at"] = now
+    result = buckets_col.update_one(
+        {"session_id": session_id, "count": {"$lt": bucket_size}, "sealed": {"$exists": False}},
+        {
+            "$push": {"messages": message},
+            "$inc": {"count": 1},
+            "$max": {"last_updated": now},
+            "$setOnInsert": {"user_id": user_id, "created_at": now},
+        },
+        upsert=True,
+    )
+    if result.upserted_id is None:
+        return False
+    chats_col.update_one(
+        {"session_id": session_id},
+        {
+            "$inc": {"bucket_count": 1},
+            "$max": {"last_updated": now},
+            "$set": {"layout": "bucketed"},
+            "$setOnInsert": {"user_id": user_id, "start_time": start_time or now},
+        },
+        upsert=True,
+    )
+    return True
+
+
+def update_message(session_id: str, message_id: str, fields: dict, chats_col=None, buckets_col=None) -> bool:
+    """
+    $set `fields` on one message, wherever it is stored; False if not found.
+    chats.messages is tried before the sealed (migrated) buckets: while a
+    migration copies it, the array stays the copy that edits go to.
+    """
+    chats_col, buckets_col = _resolve(chats_col, buckets_col)
+    update = {"$set": {f"messages.$.{k}": v for k, v in fields.items()}}
+    selector = {"session_id": session_id, "messages.message_id": message_id}
+    if buckets_col.update_one({**selector, "sealed": {"$exists": False}}, update).matched_count:
+        return True
+    if chats_col.update_one(selector, update).matched_count:
+        return True
+    return bool(buckets_col.update_one({**selector, "sealed": True}, update).matched_count)
+
+
+def legacy_message_keys(headers: Iterable[dict]) -> set:
+    """{(session_id, message_id)} of the messages still stored in chats.messages of these headers."""
+    return {
+        (h.get("session_id"), m.get("message_id"))
+        for h in headers for m in (h.get("messages") or []) if m.get("message_id")
+    }
+
+
+def bulk_update_messages(updates: Iterable[Tuple[str, str, dict]], legacy_messages: Iterable[Tuple[str, str]] = (),
+                         chats_col=None, buckets_col=None) -> int:
+    """
+    Apply many (session_id, message_id, fields) edits with one unordered
+    bulk_write per collection: messages in `legacy_messages` (see
+    legacy_message_keys) are still in chats.messages, the rest in
+    chat_buckets. A session can have both until it is migrated. Returns
+    modified messages.
+    """
+    chats_col, buckets_col = _resolve(chats_col, buckets_col)
+    legacy_messages = set(legacy_messages)
+    requests = {"chats": [], "buckets": []}
+    for session_id, message_id, fields in updates:
+        if not fields:
+            continue
+        target = "chats" if (session_id, message_id) in legacy_messages else "buckets"
+        requests[target].append(UpdateOne(
+            {"session_id": session_id, "messages.message_id": message_id},
+            {"$set": {f"messages.$.{k}": v for k, v in fields.items()}}
+        ))
+    modified = 0
+    for target, collection in (("buckets", buckets_col), ("chats", chats_col)):
+        if requests[target]:
+            modified += collection.bulk_write(requests[target], ordered=False).modified_count
+    return modified
+
+
+def delete_session(session_id: str, chats_col=None, buckets_col=None) -> int:
+    """Delete a session's header and buckets; returns the number of buckets removed."""
+    chats_col, buckets_col = _resolve(chats_col, buckets_col)
+    chats_col.delete_one({"session_id": session_id})
+    return buckets_col.delete_many({"session_id": session_id}).deleted_count
+
+
+# =========================
+# Reads
+# =========================
+def _append_order(message: dict):
+    # migrated legacy messages have no appended_at and come first
+    appended_at = message.get("appended_at")
+    return (appended_at is not None, appended_at or 0)
+
+
+def _bucket_messages(cursor) -> List[dict]:
+    """Messages of buckets read in BUCKET_ORDER, in append order."""
+    return sorted((m for doc in cursor for m in doc.get("messages", [])), key=_append_order)
+
+
+def load_messages(session_id: str, header: Optional[dict] = None, last_buckets: int = 0,
+                  chats_col=None, buckets_col=None) -> List[dict]:
+    """
+    Messages of a session in order: legacy chats.messages first, then the
+    buckets (only the last `last_buckets` when > 0). Pass the header if it
+    was already fetched to save a round trip.
+    """
+    chats_col, buckets_col = _resolve(chats_col, buckets_col)
+    if header is None:
+        header = chats_col.find_one({"session_id": session_id}, HEADER_PROJECTION) or {}
+    legacy = header.get("messages") or []
+    if not header.get("bucket_count"):
+        return list(legacy)
+
+    query = {"session_id": session_id}
+    if legacy:
+        query["sealed"] = {"$exists": False}     # copies of chats.messages, mid-migration
+    cursor = buckets_col.find(query)
+    if last_buckets > 0:
+        # newest first, one extra to know whether older buckets were left out
+        docs = list(cursor.sort([(k, -1) for k, _ in BUCKET_ORDER]).limit(last_buckets + 1))
+        if len(docs) > last_buckets:
+            docs, legacy = docs[:last_buckets], []
+        docs.reverse()
+    else:
+        docs = cursor.sort(BUCKET_ORDER)
+    return list(legacy) + _bucket_messages(docs)
+
+
+def first_messages(session_ids: Iterable[str], buckets_col=None) -> Dict[str, List[dict]]:
+    """{session_id: messages of the first bucket} for many sessions in one query (topics, previews)."""
+    buckets_col = _buckets(buckets_col)
+    session_ids = list(session_ids)
+    result = {sid: [] for sid in session_ids}
+    if not session_ids:
+        return result
+    pipeline = [
+        {"$match": {"session_id": {"$in": session_ids}}},
+        {"$sort": {"session_id": 1, **dict(BUCKET_ORDER)}},
+        {"$group": {"_id": "$session_id", "messages": {"$first": "$messages"}}},
+    ]
+    for doc in buckets_col.aggregate(pipeline):
+        result[doc["_id"]] = sorted(doc.get("messages") or [], key=_append_order)
+    return result
+
+
+def messages_for_sessions(headers: Iterable[dict], buckets_col=None) -> Dict[str, List[dict]]:
+    """{session_id: all messages} for already-fetched headers, with one bucket query."""
+    buckets_col = _buckets(buckets_col)
+    headers = list(headers)
+    result = {h.get("session_id"): list(h.get("messages") or []) for h in headers}
+    bucketed = [h["session_id"] for h in headers if h.get("bucket_count")]
+    if bucketed:
+        by_session: Dict[str, list] = {}
+        for doc in buckets_col.find({"session_id": {"$in": bucketed}}).sort([("session_id", 1)] + BUCKET_ORDER):
+            if doc.get("sealed") and result.get(doc["session_id"]):
+                continue        # copy of chats.messages, mid-migration
+            by_session.setdefault(doc["session_id"], []).append(doc)
+        for sid, docs in by_session.items():
+            result[sid] += _bucket_messages(docs)
+    return result
+
+
+def sessions_matching(pattern: str, buckets_col=None, limit: int = 500) -> List[str]:
+    """Session ids with a bucketed question or answer matching `pattern` (case-insensitive)."""
+    buckets_col = _buckets(buckets_col)
+    regex = {"$regex": pattern, "$options": "i"}
+    return list(buckets_col.distinct(
+        "session_id", {"$or": [{"messages.question": regex}, {"messages.answer": regex}]}))[:limit]
+
+
+# =========================
+# Migration from chats.messages
+# =========================
+def _save_legacy_embedding(session_id, message):
+    vector = message.pop("bert_embedding", None)
+    if isinstance(vector, list) and vector:
+        from services.embedding_store import save_embedding
+        save_embedding(message["message_id"], vector, session_id=session_id)
+
+
+def _legacy_buckets(doc: dict, bucket_size: int) -> List[dict]:
+    """chats.messages of a header as sealed buckets, dated before any appended bucket."""
+    session_id = doc["session_id"]
+    legacy = [dict(m) for m in doc.get("messages") or []]
+    for i, message in enumerate(legacy):
+        message.setdefault("message_id", f"{session_id}:{i}")
+        _save_legacy_embedding(session_id, message)
+    base = doc.get("start_time") or LEGACY_CREATED_AT
+    return [
+        {"legacy_chunk": n, "created_at": base + timedelta(milliseconds=n), "count": len(chunk), "messages": chunk}
+        for n, chunk in enumerate(legacy[i:i + bucket_size] for i in range(0, len(legacy), bucket_size))
+    ]
+
+
+def migrate_session(doc: dict, chats_col, buckets_col, bucket_size: int = CHAT_BUCKET_SIZE,
+                    retries: int = 5) -> int:
+    """
+    Copy chats.messages into sealed buckets (upserted per chunk, so a re-run
+    after a crash does not duplicate), then drop it from the header only if
+    it is unchanged since it was read; an edit that landed meanwhile makes
+    it re-read and copy again. Appended buckets are never rewritten, so the
+    app can keep running. Returns the number of legacy messages moved.
+    """
+    session_id = doc["session_id"]
+    for _ in range(retries):
+        original = doc.get("messages")
+        if not original:
+            return 0
+        buckets = _legacy_buckets(doc, bucket_size)
+        for bucket in buckets:
+            buckets_col.update_one(
+                {"session_id": session_id, "legacy_chunk": bucket["legacy_chunk"]},
+                {
+                    "$set": {"messages": bucket["messages"], "count": bucket["count"]},
+                    "$setOnInsert": {"user_id": doc.get("user_id"), "created_at": bucket["created_at"],
+                                     "sealed": True},
+                },
+                upsert=True,
+            )
+        cleared = chats_col.update_one(
+            {"_id": doc["_id"], "messages": original},
+            {"$unset": {"messages": ""}, "$set": {"layout": "bucketed"}, "$inc": {"bucket_count": len(buckets)}},
+        )
+        if cleared.matched_count:
+            return len(original)
+        doc = chats_col.find_one({"_id": doc["_id"]}) or {}
+    logging.warning(f"⚠ Session {session_id} kept changing, left for the next migration run")
+    return 0
+
+
+def migrate_to_buckets(chats_col=None, buckets_col=None, bucket_size: int = CHAT_BUCKET_SIZE,
+                       batch_size: int = 100) -> dict:
+    """Move every chats.messages array into chat_buckets. Safe to re-run and to run while the app is up."""
+    chats_col, buckets_col = _resolve(chats_col, buckets_col)
+    stats = {"sessions": 0, "messages": 0}
+    cursor = chats_col.find({"messages": {"$exists": True}}).batch_size(batch_size)
+    for doc in cursor:
+        if not doc.get("session_id"):
+            logging.warning(f"⚠ Skipping chat {doc.get('_id')} without session_id")
+            continue
+        stats["messages"] += migrate_session(doc, chats_col, buckets_col, bucket_size)
+        stats["sessions"] += 1
+    logging.info(f"✅ Chat bucket migration done: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Bucketed chat message storage.")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Move chats.messages arrays into chat_buckets (safe while the app is running)")
+    parser.add_argument("--bucket-size", type=int, default=CHAT_BUCKET_SIZE)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate_to_buckets(bucket_size=args.bucket_size, batch_size=args.batch)
+    else:
+        parser.print_help()
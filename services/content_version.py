@@ -0,0 +1,63 @@
+# services/content_version.py
+# ===============================
+# Process-wide version counters for the editable content collections
+# (faq, knowledge, default_chat). Writers bump the version after a change;
+# in-memory indexes and caches compare versions (or subscribe) to know when
+# their copy of the content is stale.
+
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+CONTENT_COLLECTIONS = ("faq", "knowledge", "default_chat")
+
+_lock = threading.Lock()
+_versions: Dict[str, int] = defaultdict(int)
+_listeners: Dict[str, List[Callable]] = defaultdict(list)
+
+
+def get_version(name: str) -> int:
+    """Return the current version of a content collection (0 if never bumped)."""
+    with _lock:
+        return _versions[name]
+
+
+def get_versions(names=CONTENT_COLLECTIONS) -> tuple:
+    """Return a tuple with the versions of several collections, in order."""
+    with _lock:
+        return tuple(_versions[n] for n in names)
+
+
+def bump_version(name: str, action: Optional[str] = None, doc: Optional[dict] = None) -> int:
+    """
+    Mark a collection as changed and notify subscribers.
+
+    `action` ("insert", "update", "delete", "bulk") and `doc` are passed to
+    listeners so they can apply the change incrementally; listeners that only
+    care about staleness can ignore them.
+    """
+    with _lock:
+        _versions[name] += 1
+        version = _versions[name]
+        listeners = list(_listeners[name])
+
+    for callback in listeners:
+        try:
+            callback(name, action, doc)
+        except Exception as e:
+            logging.error(f"content_version listener failed for {name}: {e}")
+    return version
+
+
+def subscribe(name: str, callback: Callable) -> None:
+    """Register `callback(name, action, doc)` to run after each bump of `name`."""
+    with _lock:
+        if callback not in _listeners[name]:
+            _listeners[name].append(callback)
+
+
+def unsubscribe(name: str, callback: Callable) -> None:
+    with _lock:
+        if callback in _listeners[name]:
+            _listeners[name].remove(callback)
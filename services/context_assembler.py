@@ -0,0 +1,131 @@
+# services/context_assembler.py
+# ===============================
+# Relevance-selected, token-budgeted context for the AI prompt.
+#
+# Instead of the first 10 FAQs / 5 intents / 5 articles, the prompt gets the
+# FAQ and knowledge snippets ranked by the hybrid retrieval stage
+# (services.hybrid_retrieval) plus the intents closest to the question (BM25
+# over patterns and responses). Snippets are added greedily in rank order
+# until PROMPT_TOKEN_BUDGET is reached, then rendered in the same sections as
+# services.prompt_context.
+
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from services.bm25 import BM25Index
+from services.hybrid_retrieval import RRF_K
+from services.prompt_context import PROMPT_HEADER, render_intents, render_prompt
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+PROMPT_SNIPPET_MAX_TOKENS = int(os.getenv("PROMPT_SNIPPET_MAX_TOKENS", "300"))
+PROMPT_TOP_K = int(os.getenv("PROMPT_TOP_K", "8"))
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+SECTION_TITLES = {"faq": "FAQs", "intent": "Intents", "kb": "Knowledge Articles"}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (no tokenizer download): words and punctuation, with
+    long words counted as several sub-word pieces (~4 chars each).
+    """
+    return sum(max(1, (len(t) + 3) // 4) for t in _TOKEN_RE.findall(str(text or "")))
+
+
+@dataclass
+class AssembledPrompt:
+    prompt: str
+    prompt_tokens: int
+    budget: int
+    snippets: List[str] = field(default_factory=list)    # keys of the snippets used
+
+
+def truncate_to_tokens(text: str, max_tokens: int, count: Callable[[str], int] = estimate_tokens) -> str:
+    if count(text) <= max_tokens:
+        return text
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count(" ".join(words[:mid]) + " ...") <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]) + " ..."
+
+
+def render_snippet(hit: dict) -> str:
+    kind = hit.get("kind")
+    if kind == "faq":
+        return f"Q: {hit.get('question', '')}\nA: {hit.get('answer', '')}"
+    if kind == "kb":
+        return f"Title: {hit.get('title', '')}\nContent: {hit.get('answer', '')}"
+    return render_intents([hit["intent"]])
+
+
+# =========================
+# Intent snippets
+# =========================
+_lock = threading.Lock()
+_intent_cache = {"source": None, "index": None}
+
+
+def get_intent_lexicon(intent_index) -> BM25Index:
+    """BM25 over the intents of a services.intent_index.IntentIndex (cached per index object)."""
+    with _lock:
+        if _intent_cache["source"] is intent_index:
+            return _intent_cache["index"]
+    lexicon = BM25Index()
+    for pos, intent in enumerate(intent_index.intents):
+        text = " ".join(map(str, intent.get("patterns", []) + intent.get("responses", [])))
+        lexicon.add(f"intent:{intent.get('tag') or pos}", text, {"kind": "intent", "intent": intent})
+    with _lock:
+        _intent_cache.update(source=intent_index, index=lexicon)
+    return lexicon
+
+
+# =========================
+# Assembly
+# =========================
+def rank_snippets(hits: List[dict], intent_hits: List[dict]) -> List[dict]:
+    """Interleave retrieval hits (already RRF-ordered) and intent hits by rank fusion score."""
+    ranked = [(h.get("rrf", 1.0 / (RRF_K + r)), h) for r, h in enumerate(hits, start=1)]
+    ranked += [(1.0 / (RRF_K + r), h) for r, h in enumerate(intent_hits, start=1)]
+    ranked.sort(key=lambda x: -x[0])
+    return [h for _, h in ranked]
+
+
+def assemble_prompt(user_input: str, hits: List[dict], intent_hits: Optional[List[dict]] = None,
+                    budget: int = PROMPT_TOKEN_BUDGET,
+                    count: Callable[[str], int] = estimate_tokens) -> AssembledPrompt:
+    """Fill the prompt with the most relevant snippets that fit in `budget` tokens."""
+    sections = {kind: [] for kind in SECTION_TITLES}
+    used = []
+    spent = count(render_prompt(PROMPT_HEADER, user_input))
+
+    for hit in rank_snippets(hits[:PROMPT_TOP_K], (intent_hits or [])[:PROMPT_TOP_K]):
+        kind = hit.get("kind")
+        if kind not in sections:
+            continue
+        snippet = truncate_to_tokens(render_snippet(hit), PROMPT_SNIPPET_MAX_TOKENS, count)
+        cost = count(snippet)
+        if not sections[kind]:
+            cost += count(f"=== {SECTION_TITLES[kind]} ===")
+        if spent + cost > budget:
+            continue
+        sections[kind].append(snippet)
+        used.append(hit["key"])
+        spent += cost
+
+    blocks = [PROMPT_HEADER]
+    for kind, title in SECTION_TITLES.items():
+        if sections[kind]:
+            blocks.append(f"=== {title} ===\n" + "\n".join(sections[kind]))
+    prompt = render_prompt("\n\n".join(blocks), user_input)
+    tokens = count(prompt)
+    logging.info(f"🔹 Prompt assembled: {len(used)} snippets, ~{tokens}/{budget} tokens")
+    return AssembledPrompt(prompt=prompt, prompt_tokens=tokens, budget=budget, snippets=used)
@@ -1,7 +1,16 @@
 # services/db.py
+## python -m services.db --ensure-indexes
+## python -m services.db --verify --explain
+## python -m services.db --ensure-indexes --rebuild
 
+import argparse
+import logging
+import os
 from bson import ObjectId
+import uuid
 from datetime import datetime, timezone
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
 from services.mongo import db
 
 # Coleções
@@ -14,53 +23,84 @@ monitoring_col = db["monitoring"]
 test_results_col = db["test_results"]
 
 # =========================================================
-# Funções de Chat
+# Funções de Chat (legado)
 # =========================================================
+# Collection "chat" with {role, content, feedback} messages, addressed by
+# chat _id. The pages don't use it: their sessions live in chats +
+# chat_buckets, see services.chat_store (append_message, update_message,
+# bulk_update_messages).
 
-def save_chat_message(session_id, role, content, feedback=None):
-    chat_doc = chats_col.find_one({"session_id": session_id})
-    message = {
+def _chat_message(role, content, feedback=None):
+    return {
+        "message_id": str(uuid.uuid4()),
         "role": role,
         "content": content,
         "timestamp": datetime.now(timezone.utc),
         "feedback": feedback or ""
     }
 
-    if chat_doc:
-        chats_col.update_one(
-            {"_id": chat_doc["_id"]},
-            {"$push": {"messages": message}}
-        )
-    else:
-        chats_col.insert_one({
-            "session_id": session_id,
-            "start_time": datetime.now(timezone.utc),
-            "messages": [message]
-        })
+def save_chat_messages(session_id, messages):
+    """Append messages to the session in one upsert (the session is created by the first write)."""
+    if not messages:
+        return
+    chats_col.update_one(
+        {"session_id": session_id},
+        {
+            "$push": {"messages": {"$each": list(messages)}},
+            "$setOnInsert": {"start_time": datetime.now(timezone.utc)}
+        },
+        upsert=True
+    )
 
-def update_chat_message(chat_id, message_index, new_content):
-    chat_doc = chats_col.find_one({"_id": ObjectId(chat_id)})
-    if not chat_doc:
-        return False
+def save_chat_message(session_id, role, content, feedback=None):
+    save_chat_messages(session_id, [_chat_message(role, content, feedback)])
+
+def save_chat_turn(session_id, question, answer, feedback=None):
+    """Question and answer of one turn in a single write."""
+    save_chat_messages(session_id, [
+        _chat_message("user", question),
+        _chat_message("assistant", answer, feedback),
+    ])
+
+def _message_update(chat_id, message, fields):
+    """
+    (filter, update) that $sets `fields` on one message, addressed by its
+    position (int) or its message_id (str), without reading the document.
+    """
+    selector = {"_id": ObjectId(chat_id)}
+    if isinstance(message, int):
+        if message < 0:
+            return None
+        selector[f"messages.{message}"] = {"$exists": True}
+        return selector, {"$set": {f"messages.{message}.{k}": v for k, v in fields.items()}}
+    selector["messages.message_id"] = message
+    return selector, {"$set": {f"messages.$.{k}": v for k, v in fields.items()}}
 
-    messages = chat_doc.get("messages", [])
-    if 0 <= message_index < len(messages):
-        messages[message_index]["content"] = new_content
-        chats_col.update_one({"_id": ObjectId(chat_id)}, {"$set": {"messages": messages}})
-        return True
-    return False
+def update_chat_message(chat_id, message_index, new_content):
+    """message_index: position in messages or a message_id."""
+    update = _message_update(chat_id, message_index, {"content": new_content})
+    return bool(update) and chats_col.update_one(*update).matched_count > 0
 
 def update_message_feedback(chat_id, message_index, feedback):
-    chat_doc = chats_col.find_one({"_id": ObjectId(chat_id)})
-    if not chat_doc:
-        return False
+    """message_index: position in messages or a message_id."""
+    update = _message_update(chat_id, message_index, {"feedback": feedback})
+    return bool(update) and chats_col.update_one(*update).matched_count > 0
 
-    messages = chat_doc.get("messages", [])
-    if 0 <= message_index < len(messages):
-        messages[message_index]["feedback"] = feedback
-        chats_col.update_one({"_id": ObjectId(chat_id)}, {"$set": {"messages": messages}})
-        return True
-    return False
+def bulk_update_chat_messages(changes):
+    """
+    Apply many message edits to the legacy "chat" collection in one unordered bulk_write. changes:
+    [{"chat_id": ..., "message": index or message_id, "content": ..., "feedback": ...}]
+    (content / feedback optional). Returns the number of modified messages.
+    """
+    requests = []
+    for change in changes:
+        fields = {k: change[k] for k in ("content", "feedback") if k in change}
+        update = _message_update(change["chat_id"], change["message"], fields) if fields else None
+        if update:
+            requests.append(UpdateOne(*update))
+    if not requests:
+        return 0
+    return chats_col.bulk_write(requests, ordered=False).modified_count
 
 def get_all_chats():
     return list(chats_col.find().sort("start_time", -1))
@@ -108,3 +148,207 @@ def save_embedding_evaluation_results(results: dict, log_source="embedding_evalu
         if extra_meta:
             doc.update(extra_meta)
         test_results_col.insert_one(doc)
+
+# =========================================================
+# Índices (schema bootstrap)
+# =========================================================
+#
+# Every hot query of the app has an index declared below; ensure_indexes()
+# creates the missing ones (idempotent: same name + same spec is a no-op) and
+# verify_indexes() reports what is missing or declared differently. Home.py
+# runs ensure_indexes() once per process when MONGO_AUTO_INDEX is on.
+
+MONGO_AUTO_INDEX = os.getenv("MONGO_AUTO_INDEX", "true").lower() in ("1", "true", "yes")
+# > 0 turns the monitoring timestamp index into a TTL index (logs expire after N days)
+LOG_TTL_DAYS = int(os.getenv("LOG_TTL_DAYS", "0"))
+
+
+def declared_indexes(log_ttl_days: int = LOG_TTL_DAYS) -> dict:
+    """{collection: [IndexModel]} required by the app's queries."""
+    ttl = {"expireAfterSeconds": log_ttl_days * 86400} if log_ttl_days > 0 else {}
+    return {
+        "chats": [
+            IndexModel([("session_id", ASCENDING)], name="session_id"),
+            IndexModel([("user_id", ASCENDING), ("start_time", DESCENDING)], name="user_id_start_time"),
+            IndexModel([("start_time", DESCENDING)], name="start_time"),
+        ],
+        "chat_buckets": [
+            IndexModel([("session_id", ASCENDING), ("created_at", ASCENDING)], name="session_id_created_at"),
+        ],
+        "chat": [
+            IndexModel([("session_id", ASCENDING)], name="session_id"),
+            IndexModel([("start_time", DESCENDING)], name="start_time"),
+        ],
+        "users": [IndexModel([("email", ASCENDING)], name="email")],
+        "monitoring": [
+            IndexModel([("timestamp", ASCENDING)], name="timestamp", **ttl),
+            IndexModel([("log_source", ASCENDING), ("timestamp", DESCENDING)], name="log_source_timestamp"),
+            IndexModel([("event", ASCENDING), ("timestamp", DESCENDING)], name="event_timestamp"),
+            IndexModel([("model", ASCENDING), ("timestamp", DESCENDING)], name="model_timestamp"),
+        ],
+        "test_results": [
+            IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+            IndexModel([("log_source", ASCENDING), ("model", ASCENDING), ("timestamp", DESCENDING)],
+                       name="log_source_model_timestamp"),
+        ],
+        "unanswered": [
+            IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+            IndexModel([("session_id", ASCENDING)], name="session_id"),
+        ],
+        "faq": [IndexModel([("import_timestamp", DESCENDING)], name="import_timestamp")],
+        "knowledge": [IndexModel([("import_timestamp", DESCENDING)], name="import_timestamp")],
+        "message_embeddings": [IndexModel([("session_id", ASCENDING)], name="session_id")],
+    }
+
+
+# Queries run on every turn / render: (label, collection, filter, sort)
+HOT_QUERIES = [
+    ("chat by session", "chats", {"session_id": "probe"}, None),
+    ("sidebar history", "chats", {"user_id": "probe"}, [("start_time", -1)]),
+    ("dashboard recent chats", "chats", {}, [("start_time", -1)]),
+    ("session buckets", "chat_buckets", {"session_id": "probe"}, [("created_at", 1)]),
+    ("user by email", "users", {"email": "probe"}, None),
+    ("logs by source", "monitoring", {"log_source": "production"}, [("timestamp", -1)]),
+    ("train events", "monitoring", {"event": "train_models"}, None),
+    ("logs by model", "monitoring", {"model": "probe"}, [("timestamp", -1)]),
+    ("simulation results", "test_results", {"log_source": "simulation", "model": "probe"}, [("timestamp", -1)]),
+    ("session embeddings", "message_embeddings", {"session_id": "probe"}, None),
+]
+
+
+def _index_spec(document: dict) -> tuple:
+    """Comparable (keys, options) of an IndexModel.document or index_information() entry."""
+    keys = document["key"]
+    # compared as-is: 1 == 1.0 for ordinary keys, "text" / "hashed" / "2dsphere" stay strings
+    keys = tuple((k, v) for k, v in (keys.items() if isinstance(keys, dict) else keys))
+    options = tuple((k, document[k]) for k in ("unique", "sparse", "expireAfterSeconds") if document.get(k))
+    return keys, options
+
+
+def verify_indexes(database=None, declared: dict = None) -> dict:
+    """{collection: {"missing": [names], "conflicting": [names]}} for declared indexes not in place."""
+    database = database if database is not None else db
+    declared = declared if declared is not None else declared_indexes()
+    report = {}
+    for name, models in declared.items():
+        existing = database[name].index_information()
+        # an identical index under another name (e.g. the default "session_id_1") also counts
+        existing_specs = {_index_spec(info) for info in existing.values()}
+        missing, conflicting = [], []
+        for model in models:
+            doc = model.document
+            if doc["name"] not in existing:
+                if _index_spec(doc) not in existing_specs:
+                    missing.append(doc["name"])
+            elif _index_spec(existing[doc["name"]]) != _index_spec(doc):
+                conflicting.append(doc["name"])
+        if missing or conflicting:
+            report[name] = {"missing": missing, "conflicting": conflicting}
+    return report
+
+
+def ensure_indexes(database=None, declared: dict = None, rebuild: bool = False) -> dict:
+    """
+    Create every declared index that is missing. Indexes whose name exists
+    with another spec are only dropped and recreated with rebuild=True.
+    Returns {"created": [...], "rebuilt": [...], "conflicting": [...], "failed": [...]}.
+    """
+    database = database if database is not None else db
+    declared = declared if declared is not None else declared_indexes()
+    by_name = {name: {m.document["name"]: m for m in models} for name, models in declared.items()}
+    result = {"created": [], "rebuilt": [], "conflicting": [], "failed": []}
+
+    for collection, problems in verify_indexes(database, declared).items():
+        to_create = [by_name[collection][n] for n in problems["missing"]]
+        for index_name in problems["conflicting"]:
+            if rebuild:
+                database[collection].drop_index(index_name)
+                to_create.append(by_name[collection][index_name])
+                result["rebuilt"].append(f"{collection}.{index_name}")
+            else:
+                result["conflicting"].append(f"{collection}.{index_name}")
+        if not to_create:
+            continue
+        try:
+            database[collection].create_indexes(to_create)
+            result["created"] += [f"{collection}.{m.document['name']}" for m in to_create]
+        except OperationFailure as e:
+            # e.g. an index with the same keys under another name
+            logging.error(f"❌ Index creation failed on {collection}: {e}")
+            result["failed"] += [f"{collection}.{m.document['name']}" for m in to_create]
+
+    if result["conflicting"]:
+        logging.warning(f"⚠️ Indexes declared differently (use --rebuild): {result['conflicting']}")
+    logging.info(f"✅ Indexes ensured: {len(result['created'])} created, {len(result['rebuilt'])} rebuilt")
+    return result
+
+
+_indexes_checked = False
+
+
+def ensure_indexes_once():
+    """Startup hook: ensure (or only verify, with MONGO_AUTO_INDEX=false) once per process."""
+    global _indexes_checked
+    if _indexes_checked:
+        return
+    _indexes_checked = True
+    try:
+        if MONGO_AUTO_INDEX:
+            ensure_indexes()
+        else:
+            missing = verify_indexes()
+            if missing:
+                logging.warning(f"⚠️ Missing Mongo indexes (run python -m services.db --ensure-indexes): {missing}")
+    except Exception as e:
+        logging.error(f"❌ Index bootstrap failed: {e}")
+
+
+def plan_stages(plan: dict) -> list:
+    """Every stage name in an explain() plan tree (classic and SBE layouts)."""
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+        if isinstance(plan.get(key), dict):
+            stages += plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+
+def explain_hot_queries(database=None, queries=HOT_QUERIES) -> list:
+    """[{query, collection, stages, collscan}] from each hot query's winning plan."""
+    database = database if database is not None else db
+    report = []
+    for label, collection, query, sort in queries:
+        cursor = database[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            winning = cursor.explain()["queryPlanner"]["winningPlan"]
+        except (OperationFailure, KeyError, NotImplementedError) as e:
+            logging.warning(f"⚠️ explain() failed for '{label}': {e}")
+            continue
+        stages = plan_stages(winning)
+        report.append({"query": label, "collection": collection, "stages": stages,
+                       "collscan": "COLLSCAN" in stages})
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="MongoDB index bootstrap and query plan report.")
+    parser.add_argument("--ensure-indexes", action="store_true", help="Create missing declared indexes")
+    parser.add_argument("--rebuild", action="store_true", help="Drop and recreate indexes declared differently")
+    parser.add_argument("--verify", action="store_true", help="List missing/conflicting indexes")
+    parser.add_argument("--explain", action="store_true", help="Report hot queries that still COLLSCAN")
+    args = parser.parse_args()
+
+    if not (args.ensure_indexes or args.verify or args.explain):
+        parser.print_help()
+    if args.ensure_indexes:
+        print(ensure_indexes(rebuild=args.rebuild))
+    if args.verify:
+        print(verify_indexes() or "✅ All declared indexes present")
+    if args.explain:
+        for row in explain_hot_queries():
+            flag = "❌ COLLSCAN" if row["collscan"] else "✅"
+            print(f"{flag:12} {row['collection']:20} {row['query']:28} {' > '.join(row['stages'])}")
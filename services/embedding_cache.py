@@ -0,0 +1,236 @@
+# services/embedding_cache.py
+# ===============================
+# Content-addressed cache for text embeddings, keyed by (model, sha1(text)).
+#
+#   tier 1: in-memory LRU (EMBED_CACHE_SIZE vectors)
+#   tier 2: per-model append-only float32 file on disk, read through np.memmap,
+#           plus an append-only index of 20-byte sha1 digests (row i of the
+#           .f32 file belongs to digest i). Survives restarts and is shared by
+#           every process using the same EMBED_CACHE_DIR: appends hold a file
+#           lock (<name>.lock) around both writes and first pick up the rows
+#           other processes appended, so rows and digests stay aligned.
+#
+# The same chat questions, KB entries (simulate_chat_tests) and dataset rows
+# (every run_full_evaluation repeat) are then embedded once. Set
+# EMBED_CACHE=false to bypass it, EMBED_CACHE_DIR="" for memory only.
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from filelock import FileLock
+
+EMBED_CACHE = os.getenv("EMBED_CACHE", "true").lower() in ("1", "true", "yes")
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "data/embedding_cache")
+
+_DIGEST = 20
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha1(str(text).encode("utf-8")).digest()
+
+
+# =========================
+# Disk tier
+# =========================
+class DiskVectorStore:
+    """Append-only float32 rows for one model: <name>.<dim>d.f32 + <name>.<dim>d.idx."""
+
+    def __init__(self, directory: Path, model: str, dim: int):
+        self.dim = dim
+        base = f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', model)}.{dim}d"
+        self.data_path, self.index_path = directory / f"{base}.f32", directory / f"{base}.idx"
+        self._rows: Dict[bytes, int] = {}
+        self._indexed = 0                      # rows of the .idx file already in _rows
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        directory.mkdir(parents=True, exist_ok=True)
+        self._file_lock = FileLock(str(directory / f"{base}.lock"))
+        self._load_index()
+
+    @classmethod
+    def find(cls, directory: Path, model: str) -> Optional["DiskVectorStore"]:
+        """Open an existing store for `model` (dimension taken from the file name)."""
+        safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", model)
+        for path in sorted(directory.glob(f"{glob_escape(safe)}.*d.f32")):
+            match = re.fullmatch(re.escape(safe) + r"\.(\d+)d\.f32", path.name)
+            if match:
+                return cls(directory, model, int(match.group(1)))
+        return None
+
+    def _load_index(self):
+        self._rows, self._indexed, self._mmap = {}, 0, None
+        self._sync()
+
+    def _file_rows(self) -> tuple:
+        index_rows = self.index_path.stat().st_size // _DIGEST if self.index_path.exists() else 0
+        data_rows = self.data_path.stat().st_size // (4 * self.dim) if self.data_path.exists() else 0
+        return index_rows, data_rows
+
+    def _sync(self):
+        """Add digests appended since the last read (by this or another process)."""
+        index_rows, data_rows = self._file_rows()
+        # a crash between the two appends leaves unindexed data rows; ignore them
+        rows = min(index_rows, data_rows)
+        if rows < self._indexed:          # files were replaced or cleared
+            self._rows, self._indexed, self._mmap = {}, 0, None
+        if rows == self._indexed:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._indexed * _DIGEST)
+            digests = f.read((rows - self._indexed) * _DIGEST)
+        for i in range(len(digests) // _DIGEST):
+            self._rows.setdefault(digests[i * _DIGEST:(i + 1) * _DIGEST], self._indexed + i)
+        self._indexed += len(digests) // _DIGEST
+
+    def _view(self, row: int) -> Optional[np.memmap]:
+        if self._mmap is None or row >= self._mmap.shape[0]:
+            size = self.data_path.stat().st_size // (4 * self.dim) if self.data_path.exists() else 0
+            if row >= size:
+                return None
+            self._mmap = np.memmap(self.data_path, dtype=np.float32, mode="r", shape=(size, self.dim))
+        return self._mmap
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, digest: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._rows.get(digest)
+            if row is None:
+                self._sync()
+                row = self._rows.get(digest)
+            if row is None:
+                return None
+            view = self._view(row)
+            return None if view is None else np.array(view[row])
+
+    def append(self, digests: List[bytes], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock, self._file_lock:
+            self._sync()
+            new = [(d, v) for d, v in zip(digests, vectors) if d not in self._rows]
+            if not new:
+                return
+            # cut rows/digests left by a writer that crashed mid-append, so the
+            # new rows land at the same position in both files
+            start = min(self._file_rows())
+            with open(self.data_path, "ab") as f:
+                f.truncate(start * 4 * self.dim)
+                f.write(np.stack([v for _, v in new]).tobytes())
+            with open(self.index_path, "ab") as f:
+                f.truncate(start * _DIGEST)
+                f.write(b"".join(d for d, _ in new))
+            for offset, (digest, _) in enumerate(new):
+                self._rows[digest] = start + offset
+            self._indexed = start + len(new)
+
+
+def glob_escape(text: str) -> str:
+    return re.sub(r"([*?\[\]])", r"[\1]", text)
+
+
+# =========================
+# Two-tier cache
+# =========================
+class EmbeddingCache:
+    def __init__(self, max_size: int = EMBED_CACHE_SIZE, directory: Optional[str] = EMBED_CACHE_DIR):
+        self.max_size = max_size
+        self.directory = Path(directory) if directory else None
+        self._lru: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._stores: Dict[str, Optional[DiskVectorStore]] = {}
+        self._lock = threading.Lock()
+        self.memory_hits = self.disk_hits = self.misses = 0
+
+    def _store(self, model: str, dim: Optional[int] = None) -> Optional[DiskVectorStore]:
+        if self.directory is None:
+            return None
+        store = self._stores.get(model)
+        if store is None:
+            store = DiskVectorStore.find(self.directory, model) if dim is None else None
+            if store is None and dim is not None:
+                store = DiskVectorStore(self.directory, model, dim)
+            if store is not None:
+                self._stores[model] = store
+        return store
+
+    def _remember(self, key: tuple, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def embed(self, model: str, embed_fn: Callable[[List[str]], np.ndarray], texts: List[str]) -> np.ndarray:
+        """Embeddings for `texts`, computing only the ones in neither tier (in one embed_fn call)."""
+        digests = [text_digest(t) for t in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            store = self._store(model)
+            for digest in digests:
+                if digest in found:
+                    continue
+                vector = self._lru.get((model, digest))
+                if vector is not None:
+                    self._lru.move_to_end((model, digest))
+                    self.memory_hits += 1
+                    found[digest] = vector
+                    continue
+                vector = store.get(digest) if store is not None else None
+                if vector is not None:
+                    self._remember((model, digest), vector)
+                    self.disk_hits += 1
+                    found[digest] = vector
+
+        missing = list(dict.fromkeys(d for d in digests if d not in found))
+        if missing:
+            text_of = dict(zip(digests, texts))
+            computed = np.asarray(embed_fn([text_of[d] for d in missing]), dtype=np.float32)
+            with self._lock:
+                self.misses += len(missing)
+                for digest, vector in zip(missing, computed):
+                    self._remember((model, digest), vector)
+                    found[digest] = vector
+                try:
+                    store = self._store(model, computed.shape[1])
+                    if store is not None:
+                        store.append(missing, computed)
+                except OSError as e:
+                    logging.warning(f"⚠ Embedding disk cache unavailable: {e}")
+                    self.directory = None
+
+        return np.stack([found[d] for d in digests]) if digests else np.zeros((0, 0), dtype=np.float32)
+
+    def clear_memory(self):
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_hit_ratio": self.memory_hits / lookups if lookups else 0.0,
+                "memory_size": len(self._lru),
+                "max_size": self.max_size,
+                "disk_rows": {m: len(s) for m, s in self._stores.items() if s is not None},
+            }
+
+
+embedding_cache = EmbeddingCache()
+
+
+def cached(model: str, embed_fn: Callable[[List[str]], np.ndarray], texts: List[str]) -> np.ndarray:
+    """embed_fn(texts) through the shared cache (or directly when EMBED_CACHE is off)."""
+    if not EMBED_CACHE or not texts:
+        return embed_fn(texts)
+    return embedding_cache.embed(model, embed_fn, texts)
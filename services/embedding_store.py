@@ -0,0 +1,186 @@
+# services/embedding_store.py
+# ===============================
+## python -m services.embedding_store --migrate
+## python -m services.embedding_store --migrate --dtype int8 --batch 200
+#
+# Message embeddings live in their own collection instead of inside
+# chats.messages, packed as BSON Binary:
+#
+#   {_id: message_id, session_id, model, dtype: "float16" | "int8",
+#    dim, scale, vector: Binary, created_at}
+#
+# float16 keeps 768-d BERT vectors at 1.5 KB (vs ~15-20 KB as a list of
+# doubles); int8 (symmetric, one scale per vector) at 768 bytes. Readers get
+# NumPy views over the stored bytes (np.frombuffer, no copy); as_float32 /
+# dequantizing int8 is the only step that allocates.
+
+import argparse
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from bson.binary import Binary
+
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float16").lower()
+EMBEDDING_MODEL = "bert-base-uncased"
+DTYPES = {"float16": np.float16, "int8": np.int8, "float32": np.float32}
+
+_collection = None
+
+
+def get_collection():
+    global _collection
+    if _collection is None:
+        from services.mongo import db
+        _collection = db["message_embeddings"]
+    return _collection
+
+
+# =========================
+# Packing
+# =========================
+def encode_vector(vector, dtype: str = EMBEDDING_STORE_DTYPE) -> Tuple[Binary, float]:
+    """Pack a 1-D vector as Binary; returns (payload, scale). scale is 1.0 except for int8."""
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+    vec = np.asarray(vector, dtype=np.float32).ravel()
+    scale = 1.0
+    if dtype == "int8":
+        peak = float(np.abs(vec).max()) if vec.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        vec = np.clip(np.rint(vec / scale), -127, 127)
+    return Binary(vec.astype(DTYPES[dtype]).tobytes()), scale
+
+
+def decode_vector(doc: dict, as_float32: bool = False) -> np.ndarray:
+    """
+    Read-only view over doc["vector"] in its stored dtype (zero-copy). int8
+    vectors are always dequantized to float32 since they need their scale.
+    """
+    view = np.frombuffer(doc["vector"], dtype=DTYPES[doc.get("dtype", "float16")])
+    if doc.get("dtype") == "int8":
+        return view.astype(np.float32) * np.float32(doc.get("scale", 1.0))
+    return view.astype(np.float32) if as_float32 else view
+
+
+# =========================
+# Write / read API
+# =========================
+def save_embedding(message_id: str, vector, session_id: Optional[str] = None,
+                   model: str = EMBEDDING_MODEL, dtype: str = EMBEDDING_STORE_DTYPE, collection=None):
+    payload, scale = encode_vector(vector, dtype)
+    (collection if collection is not None else get_collection()).update_one(
+        {"_id": message_id},
+        {"$set": {
+            "session_id": session_id,
+            "model": model,
+            "dtype": dtype,
+            "dim": int(np.asarray(vector).size),
+            "scale": scale,
+            "vector": payload,
+            "created_at": datetime.now(timezone.utc),
+        }},
+        upsert=True
+    )
+
+
+def get_embedding(message_id: str, as_float32: bool = False, collection=None) -> Optional[np.ndarray]:
+    doc = (collection if collection is not None else get_collection()).find_one({"_id": message_id})
+    return decode_vector(doc, as_float32) if doc else None
+
+
+def get_embeddings(message_ids: Iterable[str], as_float32: bool = False, collection=None) -> Dict[str, np.ndarray]:
+    """{message_id: vector} for the ids that have an embedding (one query)."""
+    cursor = (collection if collection is not None else get_collection()).find({"_id": {"$in": list(message_ids)}})
+    return {doc["_id"]: decode_vector(doc, as_float32) for doc in cursor}
+
+
+def load_matrix(query: Optional[dict] = None, collection=None) -> Tuple[list, np.ndarray]:
+    """
+    (message_ids, float32 matrix) for every stored embedding matching `query`,
+    e.g. {"session_id": ...}. The packed bytes are joined once and viewed with
+    np.frombuffer, so the only full-size allocation is the float32 result.
+    """
+    cursor = (collection if collection is not None else get_collection()).find(query or {})
+    ids, chunks, dtype, dim, scales = [], [], None, None, []
+    for doc in cursor:
+        if dtype is None:
+            dtype, dim = doc.get("dtype", "float16"), doc["dim"]
+        if doc.get("dtype", "float16") != dtype or doc["dim"] != dim:
+            logging.warning(f"⚠ Skipping embedding {doc['_id']} with a different dtype/dim")
+            continue
+        ids.append(doc["_id"])
+        chunks.append(bytes(doc["vector"]))
+        scales.append(doc.get("scale", 1.0))
+    if not ids:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    matrix = np.frombuffer(b"".join(chunks), dtype=DTYPES[dtype]).reshape(len(ids), dim).astype(np.float32)
+    if dtype == "int8":
+        matrix *= np.asarray(scales, dtype=np.float32)[:, None]
+    return ids, matrix
+
+
+def delete_session_embeddings(session_id: str, collection=None) -> int:
+    return (collection if collection is not None else get_collection()).delete_many(
+        {"session_id": session_id}).deleted_count
+
+
+# =========================
+# Migration from chats.messages[].bert_embedding
+# =========================
+def migrate_chat_embeddings(chats_col=None, store_col=None, dtype: str = EMBEDDING_STORE_DTYPE,
+                            batch_size: int = 100) -> dict:
+    """
+    Move list-valued messages[].bert_embedding into the store and $unset them
+    from the chat documents. Safe to re-run: migrated messages no longer match.
+    """
+    if chats_col is None:
+        from services.mongo import db
+        chats_col = db["chats"]
+    store_col = store_col if store_col is not None else get_collection()
+    stats = {"sessions": 0, "embeddings": 0, "skipped": 0}
+
+    cursor = chats_col.find({"messages.bert_embedding": {"$exists": True}},
+                            {"session_id": 1, "messages": 1}).batch_size(batch_size)
+    for doc in cursor:
+        session_id = doc.get("session_id")
+        unset, ids = {}, {}
+        for i, message in enumerate(doc.get("messages", [])):
+            if "bert_embedding" not in message:
+                continue
+            unset[f"messages.{i}.bert_embedding"] = ""
+            vector = message["bert_embedding"]
+            if not vector or not isinstance(vector, list):
+                stats["skipped"] += 1
+                continue
+            message_id = message.get("message_id")
+            if not message_id:
+                # the store is keyed by message_id: write the synthesized id back too
+                message_id = ids[f"messages.{i}.message_id"] = f"{session_id}:{i}"
+            save_embedding(message_id, vector, session_id=session_id, dtype=dtype, collection=store_col)
+            stats["embeddings"] += 1
+        if unset:
+            update = {"$unset": unset}
+            if ids:
+                update["$set"] = ids
+            chats_col.update_one({"_id": doc["_id"]}, update)
+            stats["sessions"] += 1
+
+    logging.info(f"✅ Embedding migration done: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Binary embedding store for chat messages.")
+    parser.add_argument("--migrate", action="store_true", help="Move chats.messages[].bert_embedding to the store")
+    parser.add_argument("--dtype", choices=sorted(DTYPES), default=EMBEDDING_STORE_DTYPE)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate_chat_embeddings(dtype=args.dtype, batch_size=args.batch)
+    else:
+        parser.print_help()
@@ -3,13 +3,14 @@
 ## python -m services.embeddings
 
 import logging
-from functools import lru_cache
+import os
 from typing import Union, List
 import numpy as np
 import torch
-from transformers import BertTokenizer, BertModel, GPT2Tokenizer, GPT2Model
-from sentence_transformers import SentenceTransformer
 import matplotlib.pyplot as plt
+from services.inference_profile import resolve_profile
+from services import model_registry
+from services.embedding_cache import cached
 
 logging.basicConfig(level=logging.INFO)
 
@@ -19,6 +20,12 @@ logging.basicConfig(level=logging.INFO)
 DEFAULT_DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 logging.info(f"🔹 Using device: {DEFAULT_DEVICE}")
 
+# Chunked inference: at most EMBED_BATCH_SIZE texts and EMBED_MAX_TOKENS
+# (rows x padded length) per forward pass, which bounds activation memory
+# regardless of how many texts are passed in.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_TOKENS = int(os.getenv("EMBED_MAX_TOKENS", "8192"))
+
 # =========================
 # Auxiliary function: truncation warning
 # =========================
@@ -31,63 +38,114 @@ def check_truncation(tokenizer, texts: List[str], max_length: int):
 # =========================
 # Lazy Load - HuggingFace BERT
 # =========================
-@lru_cache(maxsize=1)
-def load_bert(device=DEFAULT_DEVICE):
-    logging.info("🔹 Loading model BERT...")
-    tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
-    model = BertModel.from_pretrained("bert-base-uncased")
-    model.eval()
-    return tokenizer, model
+def load_bert(device=DEFAULT_DEVICE, profile="fp32"):
+    """Shared (tokenizer, model) from services.model_registry."""
+    return model_registry.get_bert(profile)
 
 
-def get_bert_embeddings(texts: Union[str, List[str]], device=DEFAULT_DEVICE) -> np.ndarray:
+def get_bert_embeddings(texts: Union[str, List[str]], device=DEFAULT_DEVICE, profile=None) -> np.ndarray:
     if isinstance(texts, str):
         texts = [texts]
     texts = [str(t) for t in texts]
-    tokenizer, model = load_bert()
-    inputs = tokenizer(texts, return_tensors="pt", truncation=True, padding=True)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    return outputs.last_hidden_state.mean(dim=1).cpu().numpy()
+    profile = resolve_profile(profile)
+    return cached(f"bert-base-uncased@{profile}",
+                  lambda batch: encode_in_chunks(*load_bert(profile=profile), batch), texts)
+
+
+def mean_pool(hidden: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """Mean over real tokens only, so a padded row equals the same text embedded alone."""
+    mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+    return (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+
+def embed_bert_batch(texts: List[str], profile=None) -> np.ndarray:
+    """BERT embeddings for a micro-batch of independent requests (services.batching)."""
+    return get_bert_embeddings(list(texts), profile=profile)
+
+
+# =========================
+# Chunked, length-sorted inference
+# =========================
+def plan_chunks(lengths: List[int], batch_size: int = EMBED_BATCH_SIZE,
+                max_tokens: int = EMBED_MAX_TOKENS) -> List[List[int]]:
+    """
+    Group text indices into chunks of similar length (sorted, longest first)
+    with at most batch_size rows and rows * longest <= max_tokens.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    chunks, current = [], []
+    for i in order:
+        width = lengths[current[0]] if current else lengths[i]
+        if current and (len(current) >= batch_size or (len(current) + 1) * width > max_tokens):
+            chunks.append(current)
+            current = []
+        current.append(i)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def encode_in_chunks(tokenizer, model, texts: List[str], batch_size: int = EMBED_BATCH_SIZE,
+                     max_tokens: int = EMBED_MAX_TOKENS) -> np.ndarray:
+    """
+    Tokenize once, run the model over length-sorted chunks padded only to the
+    chunk's longest text, mean-pool over real tokens and write each row back
+    at its input position.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    input_ids = [list(ids) for ids in tokenizer(texts, truncation=True)["input_ids"]]
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+    out = None
+    for chunk in plan_chunks([len(ids) for ids in input_ids], batch_size, max_tokens):
+        width = max(len(input_ids[i]) for i in chunk)
+        ids = torch.tensor([input_ids[i] + [pad_id] * (width - len(input_ids[i])) for i in chunk])
+        mask = torch.tensor([[1] * len(input_ids[i]) + [0] * (width - len(input_ids[i])) for i in chunk])
+        with torch.no_grad():
+            hidden = model(input_ids=ids, attention_mask=mask).last_hidden_state
+        pooled = mean_pool(hidden, mask).float().cpu().numpy()
+        if out is None:
+            out = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+        out[chunk] = pooled
+    return out
 
 
 # =========================
 # Lazy Load - HuggingFace GPT-2
 # =========================
-@lru_cache(maxsize=1)
-def load_gpt2():
-    logging.info("🔹 Loading model GPT-2 (embeddings de hidden states)...")
-    tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
-    model = GPT2Model.from_pretrained("gpt2")
-    tokenizer.pad_token = tokenizer.eos_token
-    model.eval()
-    return tokenizer, model
+def load_gpt2(profile="fp32"):
+    """GPT-2 base model shared with the chat LM head (embeddings de hidden states)."""
+    return model_registry.get_gpt2(profile)
 
 
-def get_gpt2_embeddings(texts: Union[str, List[str]], device=DEFAULT_DEVICE) -> np.ndarray:
+def get_gpt2_embeddings(texts: Union[str, List[str]], device=DEFAULT_DEVICE, profile=None) -> np.ndarray:
     if isinstance(texts, str):
         texts = [texts]
-    tokenizer, model = load_gpt2()
-    inputs = tokenizer(texts, return_tensors="pt", truncation=True, padding=True)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    return outputs.last_hidden_state.mean(dim=1).cpu().numpy()
+    texts = [str(t) for t in texts]
+    profile = resolve_profile(profile)
+    return cached(f"gpt2@{profile}",
+                  lambda batch: encode_in_chunks(*load_gpt2(profile=profile), batch), texts)
 
 
 # =========================
 # Lazy Load - Sentence-BERT (SBERT)
 # =========================
-@lru_cache(maxsize=1)
-def load_sbert():
-    logging.info("🔹 Loading model SBERT...")
-    return SentenceTransformer("all-MiniLM-L6-v2")
+def load_sbert(profile="fp32"):
+    return model_registry.get_sbert(profile)
 
 
-def get_sbert_embeddings(texts: Union[str, List[str]], device=DEFAULT_DEVICE) -> np.ndarray:
+def get_sbert_embeddings(texts: Union[str, List[str]], device=DEFAULT_DEVICE, profile=None) -> np.ndarray:
     if isinstance(texts, str):
         texts = [texts]
-    model = load_sbert()
-    return np.array(model.encode(texts, convert_to_numpy=True))
+    texts = [str(t) for t in texts]
+    profile = resolve_profile(profile)
+
+    def encode(batch):
+        # sentence-transformers already sorts by length and restores the order
+        model = load_sbert(profile=profile)
+        return np.asarray(model.encode(batch, batch_size=EMBED_BATCH_SIZE, convert_to_numpy=True), dtype=np.float32)
+
+    return cached(f"all-MiniLM-L6-v2@{profile}", encode, texts)
 
 
 # =========================
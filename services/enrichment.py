@@ -0,0 +1,202 @@
+# services/enrichment.py
+# ===============================
+# Background enrichment of saved chat messages.
+#
+# Sentiment, priority and the question's BERT embedding are not needed to
+# show an answer, so the chat page only saves the question and submits
+# (session_id, message_id, question) here. A small pool of worker threads
+# drains the bounded queue in batches, runs every enricher once per batch and
+# writes the results back with a positional $set on the message's bucket
+# (services.chat_store):
+#
+#   {"session_id": ..., "messages.message_id": ...}
+#   {"$set": {"messages.$.sentiment": ..., "messages.$.priority": ..., ...}}
+#
+# Fields with a sink (bert_embedding -> services.embedding_store) are handed
+# to the sink instead of being $set on the chat document. An enricher keyed by
+# a tuple of fields returns {field: values} (sentiment and priority come from
+# one call, which vectorizes once when the fused multi-head model is trained).
+# When the queue is full new jobs are dropped (and counted) instead of
+# blocking the chat.
+
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+ENRICH_QUEUE_SIZE = int(os.getenv("ENRICH_QUEUE_SIZE", "1000"))
+ENRICH_BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "16"))
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "1"))
+
+
+@dataclass
+class EnrichmentJob:
+    session_id: str
+    message_id: str
+    text: str
+    submitted_at: float = 0.0
+
+
+# =========================
+# Default enrichers: fn(texts) -> one value per text
+# =========================
+def enrich_labels(texts: List[str]) -> Dict[str, List[str]]:
+    from services.ml import predict_labels
+    return predict_labels(texts, ("sentiment", "priority"))
+
+
+def enrich_bert_embedding(texts: List[str]) -> List[Optional[list]]:
+    from services.embeddings import get_bert_embeddings
+    return get_bert_embeddings(list(texts)).tolist()
+
+
+def store_bert_embedding(job: "EnrichmentJob", vector):
+    from services.embedding_store import save_embedding
+    save_embedding(job.message_id, vector, session_id=job.session_id)
+
+
+DEFAULT_ENRICHERS = {
+    ("sentiment", "priority"): enrich_labels,
+    "bert_embedding": enrich_bert_embedding,
+}
+DEFAULT_SINKS = {"bert_embedding": store_bert_embedding}
+
+
+# =========================
+# Worker
+# =========================
+class EnrichmentWorker:
+    def __init__(self, collection, enrichers: Optional[Dict[Union[str, Tuple[str, ...]], Callable]] = None,
+                 maxsize: int = ENRICH_QUEUE_SIZE, batch_size: int = ENRICH_BATCH_SIZE,
+                 workers: int = ENRICH_WORKERS,
+                 sinks: Optional[Dict[str, Callable[[EnrichmentJob, object], None]]] = None):
+        self.collection = collection
+        self.enrichers = dict(DEFAULT_ENRICHERS if enrichers is None else enrichers)
+        self.sinks = dict(sinks or {})
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.submitted = self.processed = self.dropped = self.failed = self.batches = 0
+        self.lag_ms = 0.0
+
+    def start(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._run, name=f"enrichment-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, session_id: str, message_id: str, text: str) -> bool:
+        """Queue a message for enrichment; False if it was dropped (queue full or no ids)."""
+        if not session_id or not message_id:
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait(EnrichmentJob(session_id, message_id, str(text or ""), time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logging.warning(f"⚠ Enrichment queue full, skipping message {message_id}")
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.process(batch)
+            except Exception as e:
+                with self._lock:
+                    self.failed += len(batch)
+                logging.error(f"❌ Enrichment batch failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def process(self, batch: List[EnrichmentJob]):
+        """Run every enricher once over the batch, then $set the results on each message."""
+        texts = [job.text for job in batch]
+        updates = [{} for _ in batch]
+        for key, enrich in self.enrichers.items():
+            try:
+                values = enrich(texts)
+            except Exception as e:
+                logging.error(f"Enricher {key} failed: {e}")
+                continue
+            # a tuple key means one call producing several fields: {field: values}
+            outputs = {field: values[field] for field in key} if isinstance(key, tuple) else {key: values}
+            for field, field_values in outputs.items():
+                sink = self.sinks.get(field)
+                for job, update, value in zip(batch, updates, field_values):
+                    if sink is None:
+                        update[f"messages.$.{field}"] = value
+                    elif value is not None:
+                        sink(job, value)
+
+        for job, update in zip(batch, updates):
+            if update:
+                self.collection.update_one(
+                    {"session_id": job.session_id, "messages.message_id": job.message_id},
+                    {"$set": update}
+                )
+        now = time.monotonic()
+        with self._lock:
+            self.processed += len(batch)
+            self.batches += 1
+            self.lag_ms = max((now - job.submitted_at) * 1000 for job in batch)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued job has been written; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "max_queue": self._queue.maxsize,
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+                "last_lag_ms": round(self.lag_ms, 1),
+            }
+
+
+# =========================
+# Shared worker
+# =========================
+_worker: Optional[EnrichmentWorker] = None
+_worker_lock = threading.Lock()
+
+
+def get_enrichment_worker(collection=None) -> EnrichmentWorker:
+    """Process-wide worker (the chat page is re-executed on every rerun)."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            if collection is None:
+                from services.mongo import db
+                collection = db["chat_buckets"]
+            _worker = EnrichmentWorker(collection, sinks=DEFAULT_SINKS)
+        return _worker
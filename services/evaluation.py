@@ -107,7 +107,8 @@ def run_full_evaluation(
     n_clusters: int = 8,
     repeats: int = 1,
     sample_size: int = None,
-    device: str = "cpu"
+    device: str = "cpu",
+    plot: bool = True
 ) -> dict:
     results = {}
 
@@ -144,9 +145,50 @@ def run_full_evaluation(
             "clustering": {k: agg_metric(clu_scores, k) for k in clu_scores[0].keys()}
         }
 
-    plot_results(results)
+    if plot:
+        plot_results(results)
     return results
 
+
+# =========================
+# Drift entre perfis de inferência (fp32 vs int8/bf16)
+# =========================
+def evaluate_profile_drift(
+    embed_fns: Dict[str, Callable[..., np.ndarray]],
+    dataset: dict,
+    profile: str = "int8",
+    baseline: str = "fp32",
+    **kwargs
+) -> dict:
+    """
+    Run the full evaluation with the baseline and the candidate inference
+    profile and report, per model, the metric deltas (candidate - baseline)
+    and the cosine agreement between both embeddings of the same texts.
+    `embed_fns` take (texts, profile=...) like services.embeddings.get_*_embeddings.
+    """
+    kwargs.setdefault("plot", False)
+    runs = {
+        p: run_full_evaluation({name: (lambda texts, fn=fn, p=p: fn(texts, profile=p))
+                                for name, fn in embed_fns.items()}, dataset, **kwargs)
+        for p in (baseline, profile)
+    }
+
+    drift = {}
+    for name, fn in embed_fns.items():
+        a = np.asarray(fn(dataset["texts"], profile=baseline), dtype=np.float32)
+        b = np.asarray(fn(dataset["texts"], profile=profile), dtype=np.float32)
+        cos = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-8)
+        deltas = {
+            f"{group}.{metric}": runs[profile][name][group][metric]["mean"] - runs[baseline][name][group][metric]["mean"]
+            for group in ("classification", "clustering")
+            for metric in runs[baseline][name][group]
+        }
+        drift[name] = {"cosine_mean": float(cos.mean()), "cosine_min": float(cos.min()), "deltas": deltas}
+        logging.info(f"{name} {profile} vs {baseline}: cosine={cos.mean():.4f} "
+                     f"Δaccuracy={deltas['classification.accuracy']:+.4f}")
+
+    return {"baseline": baseline, "profile": profile, "results": runs, "drift": drift}
+
 # =========================
 # Visualização
 # =========================
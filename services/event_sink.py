@@ -0,0 +1,209 @@
+# services/event_sink.py
+# ===============================
+# Write-behind sink for monitoring events.
+#
+# log_event / log_user_interaction / log_error / log_execution used to do one
+# insert_one (and CSV append) per event on the request path. They now call
+#
+#   event_sink.emit(monitoring_col, doc)
+#
+# which only enqueues (collection, doc). A background thread drains the
+# bounded queue and writes each collection's events with one unordered
+# insert_many (CSV targets with one append) as soon as EVENT_SINK_BATCH_SIZE
+# events are waiting, otherwise every EVENT_SINK_FLUSH_MS, on flush() and at
+# interpreter exit (EVENT_SINK_FLUSH_MS=0: only on batch size, flush() and
+# exit). When the queue is full, EVENT_SINK_POLICY=drop
+# discards the event (counted); "block" waits up to
+# EVENT_SINK_BLOCK_TIMEOUT_MS for room first. EVENT_SINK=false writes
+# synchronously as before.
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+from pymongo.errors import BulkWriteError
+
+EVENT_SINK = os.getenv("EVENT_SINK", "true").lower() in ("1", "true", "yes")
+EVENT_SINK_QUEUE_SIZE = int(os.getenv("EVENT_SINK_QUEUE_SIZE", "10000"))
+EVENT_SINK_BATCH_SIZE = int(os.getenv("EVENT_SINK_BATCH_SIZE", "500"))
+EVENT_SINK_FLUSH_MS = float(os.getenv("EVENT_SINK_FLUSH_MS", "1000"))
+EVENT_SINK_POLICY = os.getenv("EVENT_SINK_POLICY", "drop").lower()
+EVENT_SINK_BLOCK_TIMEOUT_MS = float(os.getenv("EVENT_SINK_BLOCK_TIMEOUT_MS", "100"))
+
+POLICIES = ("drop", "block")
+
+
+# =========================
+# CSV targets
+# =========================
+class CsvFile:
+    """Append-only CSV target; the header is written when the file is created."""
+
+    def __init__(self, path: str):
+        self.path = str(path)
+
+    def append(self, rows: List[dict]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        exists = os.path.exists(self.path)
+        pd.DataFrame(rows).to_csv(self.path, mode="a" if exists else "w", header=not exists, index=False)
+
+
+_csv_files: Dict[str, CsvFile] = {}
+_csv_lock = threading.Lock()
+
+
+def csv_file(path) -> CsvFile:
+    """Shared CsvFile per path, so events for the same file are batched together."""
+    with _csv_lock:
+        return _csv_files.setdefault(str(path), CsvFile(path))
+
+
+def write_batch(target, items: List[dict]) -> int:
+    """Write items to a collection (unordered insert_many, insert_one for one) or CsvFile; returns how many were written."""
+    if isinstance(target, CsvFile):
+        target.append(items)
+        return len(items)
+    if len(items) == 1:
+        target.insert_one(items[0])
+        return 1
+    try:
+        return len(target.insert_many(items, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        # unordered: everything except the failed documents was inserted
+        return e.details.get("nInserted", 0)
+
+
+# =========================
+# Sink
+# =========================
+class EventSink:
+    def __init__(self, maxsize: int = EVENT_SINK_QUEUE_SIZE, batch_size: int = EVENT_SINK_BATCH_SIZE,
+                 flush_ms: float = EVENT_SINK_FLUSH_MS, policy: str = EVENT_SINK_POLICY,
+                 block_timeout_ms: float = EVENT_SINK_BLOCK_TIMEOUT_MS, enabled: bool = EVENT_SINK):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown event sink policy: {policy}")
+        self.batch_size = max(1, batch_size)
+        # 0 = no timed flush (a zero wait would spin the writer thread)
+        self.flush_interval = flush_ms / 1000 if flush_ms > 0 else None
+        self.policy = policy
+        self.block_timeout = max(0.0, block_timeout_ms) / 1000
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._flush_now = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.enqueued = self.flushed = self.dropped = self.failed = self.batches = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="event-sink", daemon=True)
+                self._thread.start()
+
+    def emit(self, target, doc: dict) -> bool:
+        """Queue one event for `target`; False if it was dropped."""
+        if not self.enabled or self._closed:
+            self._write(target, [doc])
+            return True
+        self._ensure_started()
+        try:
+            if self.policy == "block":
+                self._queue.put((target, doc), timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait((target, doc))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._flush_now.set()
+        return True
+
+    def _write(self, target, items: List[dict]):
+        try:
+            written = write_batch(target, items)
+        except Exception as e:
+            logging.error(f"❌ Event sink write failed ({len(items)} events): {e}")
+            written = 0
+        with self._lock:
+            self.flushed += written
+            self.failed += len(items) - written
+            self.batches += 1
+
+    def _drain(self) -> int:
+        """Write everything queued right now, grouped by target. Returns the number of events taken."""
+        groups: Dict[int, tuple] = {}
+        taken = 0
+        while True:
+            try:
+                target, doc = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            groups.setdefault(id(target), (target, []))[1].append(doc)
+            taken += 1
+        try:
+            for target, items in groups.values():
+                for i in range(0, len(items), self.batch_size):
+                    self._write(target, items[i:i + self.batch_size])
+        finally:
+            for _ in range(taken):
+                self._queue.task_done()
+        return taken
+
+    def _run(self):
+        while True:
+            # sleep until the batch is full, the interval is over or flush() asks
+            self._flush_now.wait(self.flush_interval)
+            self._flush_now.clear()
+            self._drain()
+            if self._closed and self._queue.empty():
+                return
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write every queued event now; False if that did not finish within `timeout`."""
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+            return True
+        self._flush_now.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Flush and stop the background thread; later emits are written synchronously."""
+        self._closed = True
+        self.flush(timeout)
+        self._flush_now.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "max_queue": self._queue.maxsize,
+                "enqueued": self.enqueued,
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+                "policy": self.policy,
+                "enabled": self.enabled,
+            }
+
+
+event_sink = EventSink()
+atexit.register(event_sink.close)
@@ -0,0 +1,117 @@
+# services/hybrid_retrieval.py
+# ===============================
+# Unified FAQ + knowledge retrieval: BM25 (services.bm25) and the dense index
+# (services.vector_index) are queried in parallel over the same corpus and
+# their rankings are merged with reciprocal rank fusion (RRF).
+#
+# RRF only uses ranks, so the two score scales never have to be compared. The
+# answer is the best fused hit that at least one retriever scored above its
+# own calibrated threshold; that score is reported as the confidence.
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from services.bm25 import BM25_MIN_SCORE
+from services.vector_index import FAQ_MIN_SCORE, KB_MIN_SCORE
+
+RRF_K = int(os.getenv("RRF_K", "60"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "10"))
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "5"))
+
+DENSE_MIN_SCORES = {"faq": FAQ_MIN_SCORE, "kb": KB_MIN_SCORE}
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+
+
+@dataclass
+class RetrievalResult:
+    answer: Optional[str] = None
+    confidence: float = 0.0
+    retriever: Optional[str] = None      # "lexical", "dense" or "hybrid" (both ranked it first)
+    key: Optional[str] = None
+    kind: Optional[str] = None           # "faq" or "kb"
+    hits: List[dict] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def rrf_fuse(rankings: Dict[str, List[dict]], k: int = RRF_K) -> List[dict]:
+    """
+    Merge ranked hit lists ({retriever: [hit, ...]}) by sum of 1 / (k + rank).
+    Each fused hit keeps the payload fields (first retriever wins) plus
+    `ranks` and `scores` per retriever.
+    """
+    fused = {}
+    for name, hits in rankings.items():
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.get(hit["key"])
+            if entry is None:
+                entry = fused[hit["key"]] = {"rrf": 0.0, "ranks": {}, "scores": {}}
+            for field_name, value in hit.items():
+                if field_name not in ("score", "confidence"):
+                    entry.setdefault(field_name, value)
+            entry["rrf"] += 1.0 / (k + rank)
+            entry["ranks"][name] = rank
+            entry["scores"][name] = hit.get("confidence", hit.get("score", 0.0))
+    return sorted(fused.values(), key=lambda e: (-e["rrf"], min(e["ranks"].values())))
+
+
+def passes_threshold(name: str, hit: dict) -> bool:
+    score = hit["scores"].get(name)
+    if score is None:
+        return False
+    if name == "lexical":
+        return score >= BM25_MIN_SCORE
+    return score >= DENSE_MIN_SCORES.get(hit.get("kind"), KB_MIN_SCORE)
+
+
+class HybridRetriever:
+    def __init__(self, lexical_index=None, dense_index=None, k: int = RETRIEVAL_TOP_K):
+        self.lexical_index = lexical_index
+        self.dense_index = dense_index
+        self.k = k
+
+    def _run(self, name, text):
+        start = time.perf_counter()
+        try:
+            if name == "lexical":
+                hits = self.lexical_index.search(text, k=self.k)
+            else:
+                hits = self.dense_index.search_text(text, k=self.k)
+        except Exception as e:
+            logging.error(f"{name} retriever failed: {e}")
+            hits = []
+        return hits, (time.perf_counter() - start) * 1000
+
+    def retrieve(self, text: str) -> RetrievalResult:
+        retrievers = [
+            name for name, index in (("lexical", self.lexical_index), ("dense", self.dense_index))
+            if index is not None and len(index)
+        ]
+        futures = {name: _executor.submit(self._run, name, text) for name in retrievers}
+
+        rankings, timings = {}, {}
+        for name, future in futures.items():
+            try:
+                rankings[name], timings[name] = future.result(timeout=RETRIEVAL_TIMEOUT)
+            except Exception as e:
+                logging.error(f"{name} retriever timed out: {e}")
+                rankings[name] = []
+
+        fused = rrf_fuse(rankings)
+        result = RetrievalResult(hits=fused, timings=timings)
+        for hit in fused:
+            accepted = [name for name in hit["ranks"] if passes_threshold(name, hit)]
+            if not accepted:
+                continue
+            # only retrievers whose score passed count towards the label
+            firsts = [name for name in accepted if hit["ranks"][name] == 1]
+            result.answer = hit["answer"]
+            result.confidence = float(min(1.0, max(hit["scores"][name] for name in accepted)))
+            result.retriever = "hybrid" if len(firsts) > 1 else min(accepted, key=hit["ranks"].get)
+            result.key, result.kind = hit["key"], hit.get("kind")
+            break
+        return result
@@ -4,6 +4,7 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timezone
 import json
+from services.content_version import bump_version
 
 def insert_data_streamlit(request_col, default_chat_col, knowledge_col=None):
     st.subheader("📥 Import Data into Database")
@@ -63,6 +64,7 @@ def insert_data_streamlit(request_col, default_chat_col, knowledge_col=None):
                         record["question"] = question
                         record["answer"] = answer
                         request_col.insert_one(record)
+                        bump_version("faq", "insert", record)
                         st.success("✅ FAQ added!")
 
         elif data_type == "Default Messages":
@@ -75,6 +77,7 @@ def insert_data_streamlit(request_col, default_chat_col, knowledge_col=None):
                         record["type"] = msg_type.lower()
                         record["message"] = message
                         default_chat_col.insert_one(record)
+                        bump_version("default_chat", "insert", record)
                         st.success("✅ Default message added!")
 
         elif data_type == "Knowledge Articles":
@@ -87,6 +90,7 @@ def insert_data_streamlit(request_col, default_chat_col, knowledge_col=None):
                         record["title"] = title
                         record["content"] = content
                         knowledge_col.insert_one(record)
+                        bump_version("knowledge", "insert", record)
                         st.success("✅ Knowledge article added!")
 
 
@@ -114,10 +118,13 @@ def import_from_dataframe(df, data_type, request_col, default_chat_col, knowledg
 
     if data_type == "FAQs / Tutorials":
         request_col.insert_many(data)
+        bump_version("faq", "bulk", data)
     elif data_type == "Default Messages":
         default_chat_col.insert_many(data)
+        bump_version("default_chat", "bulk", None)
     elif data_type == "Knowledge Articles" and knowledge_col is not None:
         knowledge_col.insert_many(data)
+        bump_version("knowledge", "bulk", data)
     st.success(f"✅ Imported {len(data)} items to {data_type}!")
 
 
@@ -127,8 +134,11 @@ def import_from_list(data, data_type, request_col, default_chat_col, knowledge_c
 
     if data_type == "FAQs / Tutorials":
         request_col.insert_many(data)
+        bump_version("faq", "bulk", data)
     elif data_type == "Default Messages":
         default_chat_col.insert_many(data)
+        bump_version("default_chat", "bulk", None)
     elif data_type == "Knowledge Articles" and knowledge_col is not None:
         knowledge_col.insert_many(data)
+        bump_version("knowledge", "bulk", data)
     st.success(f"✅ Imported {len(data)} items to {data_type}!")
\ No newline at end of file
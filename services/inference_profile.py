@@ -0,0 +1,76 @@
+# services/inference_profile.py
+# ===============================
+# CPU inference profiles for the transformer models (BERT, GPT-2, SBERT).
+#
+#   fp32  the original weights (default)
+#   int8  dynamic quantization of every nn.Linear: weights stored as int8,
+#         activations quantized on the fly; ~4x smaller Linear weights and
+#         faster matmuls on x86/ARM CPUs.
+#   bf16  weights and activations in bfloat16; halves memory, fast on CPUs
+#         with AVX512-BF16 / AMX, otherwise mostly a memory saving.
+#
+# GPT-2 implements its projections with transformers' Conv1D (a transposed
+# Linear) which quantize_dynamic ignores, so they are converted to nn.Linear
+# first. Select with INFERENCE_PROFILE=int8|bf16|fp32.
+
+import logging
+import os
+from typing import Optional
+
+import torch
+from torch import nn
+
+PROFILES = ("fp32", "int8", "bf16")
+INFERENCE_PROFILE = os.getenv("INFERENCE_PROFILE", "fp32").lower()
+
+
+def resolve_profile(profile: Optional[str] = None) -> str:
+    profile = (profile or INFERENCE_PROFILE).lower()
+    if profile not in PROFILES:
+        logging.warning(f"⚠ Unknown inference profile {profile!r}, using fp32")
+        return "fp32"
+    return profile
+
+
+def conv1d_to_linear(model: nn.Module) -> nn.Module:
+    """Replace transformers Conv1D layers (GPT-2) with equivalent nn.Linear, in place."""
+    from transformers.pytorch_utils import Conv1D
+
+    for name, child in list(model.named_children()):
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features)
+            with torch.no_grad():
+                linear.weight.copy_(child.weight.t())
+                linear.bias.copy_(child.bias)
+            setattr(model, name, linear)
+        else:
+            conv1d_to_linear(child)
+    return model
+
+
+def apply_inference_profile(model: nn.Module, profile: Optional[str] = None) -> nn.Module:
+    """Return `model` prepared for CPU inference with the given profile (eval mode)."""
+    profile = resolve_profile(profile)
+    model.eval()
+    if profile == "int8":
+        conv1d_to_linear(model)
+        model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    elif profile == "bf16":
+        model = model.to(torch.bfloat16)
+    logging.info(f"🔹 {type(model).__name__} ready with inference profile {profile} ({model_size_mb(model):.1f} MB)")
+    return model
+
+
+def model_size_mb(model: nn.Module) -> float:
+    """Parameter + buffer memory, including packed int8 weights of quantized Linear layers."""
+    total = sum(t.numel() * t.element_size() for t in model.parameters())
+    total += sum(t.numel() * t.element_size() for t in model.buffers())
+    for module in model.modules():
+        packed = getattr(module, "_packed_params", None)
+        if packed is not None and hasattr(packed, "_weight_bias"):
+            weight, bias = packed._weight_bias()
+            total += weight.numel() * weight.element_size()
+            if bias is not None:
+                total += bias.numel() * bias.element_size()
+    return total / (1024 ** 2)
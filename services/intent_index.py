@@ -0,0 +1,141 @@
+# services/intent_index.py
+# ===============================
+# Character-trigram inverted index over the `default_chat` intent patterns.
+#
+# `find_default_answer` used to run SequenceMatcher against every pattern of
+# every intent. The index keeps the exact same rule (first pattern, in intent
+# order, whose SequenceMatcher ratio is > threshold) but only scores the
+# patterns that can possibly pass it:
+#
+#   * length filter:  ratio <= 2*min(la, lb) / (la + lb)
+#   * count filter:   SequenceMatcher matches M <= LCS, so a ratio > t implies
+#                     an edit distance k < (1 - t) * (la + lb); by the q-gram
+#                     lemma both strings then share at least
+#                     max(la, lb) - q + 1 - k*q trigrams.
+#
+# Both bounds (and SequenceMatcher.quick_ratio) are upper bounds on the ratio,
+# so no true match is ever dropped.
+
+import logging
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from services.content_version import get_version
+
+Q = 3
+INTENT_SIM_THRESHOLD = 0.85
+
+
+def trigrams(text: str) -> Counter:
+    """Multiset of character trigrams of `text` (already normalized)."""
+    return Counter(text[i:i + Q] for i in range(len(text) - Q + 1))
+
+
+class IntentIndex:
+    def __init__(self, intents: List[dict]):
+        self.intents = list(intents or [])
+
+        patterns, owners = [], []
+        for intent_pos, intent in enumerate(self.intents):
+            for pattern in intent.get("patterns", []) or []:
+                if pattern is None:
+                    continue
+                patterns.append(str(pattern).lower())
+                owners.append(intent_pos)
+
+        self.patterns = patterns
+        self.owners = np.asarray(owners, dtype=np.int32)
+        self.lengths = np.asarray([len(p) for p in patterns], dtype=np.int32)
+
+        postings = {}
+        for pid, pattern in enumerate(patterns):
+            for gram, count in trigrams(pattern).items():
+                postings.setdefault(gram, ([], []))
+                postings[gram][0].append(pid)
+                postings[gram][1].append(count)
+        self.postings = {
+            gram: (np.asarray(ids, dtype=np.int32), np.asarray(counts, dtype=np.int32))
+            for gram, (ids, counts) in postings.items()
+        }
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def candidates(self, text: str, threshold: float = INTENT_SIM_THRESHOLD) -> np.ndarray:
+        """Pattern ids (ascending) that may have a similarity ratio > threshold."""
+        n = len(self.patterns)
+        if n == 0:
+            return np.empty(0, dtype=np.int32)
+
+        la = len(text)
+        lb = self.lengths
+        total = la + lb
+
+        if la == 0:
+            # SequenceMatcher("", "").ratio() == 1.0, anything else is 0.0
+            return np.flatnonzero(lb == 0).astype(np.int32)
+
+        length_ok = 2 * np.minimum(la, lb) > threshold * total
+
+        ids, weights = [], []
+        for gram, q_count in trigrams(text).items():
+            posting = self.postings.get(gram)
+            if posting is None:
+                continue
+            ids.append(posting[0])
+            weights.append(np.minimum(posting[1], q_count))
+
+        if ids:
+            shared = np.bincount(
+                np.concatenate(ids), weights=np.concatenate(weights), minlength=n)
+        else:
+            shared = np.zeros(n)
+
+        max_edits = np.floor((1.0 - threshold) * total)
+        required = np.maximum(la, lb) - Q + 1 - Q * max_edits
+        return np.flatnonzero(length_ok & (shared >= required)).astype(np.int32)
+
+    def match(self, text: str, threshold: float = INTENT_SIM_THRESHOLD) -> Optional[Tuple[dict, str]]:
+        """Return (intent, pattern) for the first pattern similar to `text`, or None."""
+        text = str(text).lower()
+        for pid in self.candidates(text, threshold):
+            matcher = SequenceMatcher(None, self.patterns[pid], text)
+            if matcher.quick_ratio() > threshold and matcher.ratio() > threshold:
+                return self.intents[self.owners[pid]], self.patterns[pid]
+        return None
+
+
+# =========================
+# Shared index, rebuilt when default_chat changes
+# =========================
+_lock = threading.Lock()
+_cached = {"collection": None, "version": None, "index": None}
+
+
+def build_intent_index(default_chat_col) -> IntentIndex:
+    doc = default_chat_col.find_one({"intents": {"$exists": True}}) or {}
+    index = IntentIndex(doc.get("intents", []))
+    logging.info(f"🔹 Intent index built with {len(index)} patterns")
+    return index
+
+
+def get_intent_index(default_chat_col) -> IntentIndex:
+    """Return the shared index, rebuilding it only if `default_chat` was bumped."""
+    version = get_version("default_chat")
+    with _lock:
+        if _cached["collection"] is default_chat_col and _cached["version"] == version:
+            return _cached["index"]
+
+    index = build_intent_index(default_chat_col)
+    with _lock:
+        _cached.update(collection=default_chat_col, version=version, index=index)
+    return index
+
+
+def invalidate_intent_index():
+    with _lock:
+        _cached.update(collection=None, version=None, index=None)
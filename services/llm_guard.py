@@ -0,0 +1,274 @@
+# services/llm_guard.py
+# ===============================
+# Deadline, hedging and circuit breaking for LLM calls.
+#
+#   * deadline: every call gets a latency budget (LLM_DEADLINE_S); when it
+#     runs out the caller gets DeadlineExceeded and can fall back to GPT-2.
+#   * hedging: if the first attempt hasn't answered after the observed p95
+#     latency, a second identical request is sent and the first to succeed wins.
+#   * circuit breaker: after LLM_BREAKER_FAILURES consecutive failures calls
+#     are rejected immediately (CircuitOpenError) for LLM_BREAKER_RESET_S, then
+#     one probe is let through (half-open). State changes and trip counts are
+#     written to the `monitoring` collection.
+#
+# HttpLLM talks to a plain HTTP text-generation endpoint with the same
+# start_chat().send_message() shape as the Gemini SDK, used with the fake
+# server in simulation/fake_llm_server.py (or a self-hosted model).
+
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+import numpy as np
+
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "20"))
+LLM_HEDGE_MIN_S = float(os.getenv("LLM_HEDGE_MIN_S", "1.0"))
+LLM_HEDGE_DEFAULT_S = float(os.getenv("LLM_HEDGE_DEFAULT_S", "4.0"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "2"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_WORKERS", "16")), thread_name_prefix="llm")
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+# =========================
+# Latency tracking
+# =========================
+class LatencyTracker:
+    """Rolling window of successful call latencies (seconds)."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, default: Optional[float] = None) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < 10:
+                return default
+            return float(np.percentile(self._samples, q))
+
+    def hedge_delay(self) -> float:
+        return max(LLM_HEDGE_MIN_S, self.percentile(95, LLM_HEDGE_DEFAULT_S))
+
+
+# =========================
+# Circuit breaker
+# =========================
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_timeout: float = LLM_BREAKER_RESET_S,
+                 on_state_change: Optional[Callable] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+        self._clock = clock
+        self._lock = threading.RLock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def _set_state(self, state: str):
+        old, self.state = self.state, state
+        if old != state and self.on_state_change is not None:
+            try:
+                self.on_state_change(self, old, state)
+            except Exception as e:
+                logging.error(f"Circuit breaker state callback failed: {e}")
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self._opened_at = self._clock()
+                self._set_state(self.OPEN)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "breaker": self.name,
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+def record_breaker_state(breaker: CircuitBreaker, old_state: str, new_state: str):
+    """Default on_state_change: write the transition to the monitoring collection."""
+    from services.monitoring import log_circuit_breaker
+    log_circuit_breaker(breaker.snapshot(), old_state)
+
+
+# =========================
+# Guarded call
+# =========================
+class LLMGuard:
+    def __init__(self, breaker: CircuitBreaker, latency: Optional[LatencyTracker] = None,
+                 deadline: float = LLM_DEADLINE_S, max_attempts: int = LLM_MAX_ATTEMPTS,
+                 executor=None):
+        self.breaker = breaker
+        self.latency = latency or LatencyTracker()
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self._executor = executor or _executor
+        self.hedges = self.hedge_wins = self.deadline_misses = 0
+
+    def call(self, fn: Callable, *args, deadline: Optional[float] = None, **kwargs):
+        """
+        Run fn(*args, **kwargs) within the deadline, hedging after the p95 delay.
+        Raises CircuitOpenError, DeadlineExceeded or the last attempt's error.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.breaker.name} circuit is open")
+
+        budget = self.deadline if deadline is None else deadline
+        start = time.monotonic()
+        end = start + budget
+        hedge_at = start + self.latency.hedge_delay()
+        attempts = {self._executor.submit(fn, *args, **kwargs): 0}
+        launched, last_error = 1, None
+
+        while time.monotonic() < end:
+            now = time.monotonic()
+            wake = min(hedge_at, end) if launched < self.max_attempts else end
+            done, _ = wait(list(attempts), timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                attempt = attempts.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                for other in attempts:
+                    other.cancel()
+                self.latency.record(time.monotonic() - start)
+                self.breaker.record_success()
+                if attempt > 0:
+                    self.hedge_wins += 1
+                return result
+
+            now = time.monotonic()
+            if launched < self.max_attempts and now < end and (not attempts or now >= hedge_at):
+                # hedge a slow attempt, or retry straight away after a fast failure
+                attempts[self._executor.submit(fn, *args, **kwargs)] = launched
+                launched += 1
+                self.hedges += 1
+            elif not attempts:
+                break
+
+        self.breaker.record_failure()
+        for future in attempts:
+            future.cancel()
+        if attempts or last_error is None:
+            self.deadline_misses += 1
+            raise DeadlineExceeded(f"LLM call exceeded {budget:.1f}s deadline")
+        raise last_error
+
+    def stats(self) -> dict:
+        return {
+            **self.breaker.snapshot(),
+            "p95_s": self.latency.percentile(95),
+            "hedge_delay_s": round(self.latency.hedge_delay(), 3),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "deadline_misses": self.deadline_misses,
+        }
+
+
+def open_stream(chat_factory: Callable, prompt: str):
+    """
+    Start a streaming request and wait for its first chunk, so that the guard's
+    deadline/hedging covers time-to-first-token. Returns (first_text, iterator).
+    """
+    iterator = iter(chat_factory().send_message(prompt, stream=True))
+    for chunk in iterator:
+        text = chunk.text
+        if text:
+            return text, iterator
+    return "", iterator
+
+
+# =========================
+# HTTP backend
+# =========================
+class HttpLLM:
+    """Minimal Gemini-like client for a POST {url}/generate text endpoint."""
+
+    def __init__(self, url: str, timeout: float = LLM_DEADLINE_S):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def start_chat(self, history=None):
+        return self
+
+    def send_message(self, prompt: str, stream: bool = False):
+        body = json.dumps({"prompt": prompt, "stream": stream}).encode("utf-8")
+        request = urllib.request.Request(f"{self.url}/generate", data=body,
+                                         headers={"Content-Type": "application/json"})
+        response = urllib.request.urlopen(request, timeout=self.timeout)
+        if not stream:
+            with response:
+                return SimpleNamespace(text=json.loads(response.read())["text"])
+        return self._iter_lines(response)
+
+    @staticmethod
+    def _iter_lines(response):
+        with response:
+            for line in response:
+                line = line.decode("utf-8").strip()
+                if line:
+                    yield SimpleNamespace(text=json.loads(line)["text"])
+
+
+# =========================
+# Shared guard
+# =========================
+llm_guard = LLMGuard(CircuitBreaker("llm", on_state_change=record_breaker_state))
@@ -1,62 +1,133 @@
 # services/ml.py
 
 import os
+import logging
 import joblib
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LogisticRegression
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.pipeline import make_pipeline
 from sklearn.feature_extraction.text import TfidfVectorizer
+from services.model_registry import get_pipeline, model_registry
 
 # Caminho base dos modelos
 MODELS_DIR = Path("ml/models")
 MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
-# Variáveis para lazy load
-_priority_model = None
-_sentiment_model = None
+# "separate": one TF-IDF + LogisticRegression pipeline per label (default)
+# "fused": one shared TF-IDF with a linear head per label (multihead_pipeline.joblib)
+ML_TRAIN_MODE = os.getenv("ML_TRAIN_MODE", "separate").lower()
+LABEL_FALLBACKS = {"sentiment": "unknown", "priority": "Low"}
 
 # =========================================================
-# Lazy Load Models
+# Fused multi-head classifier
+# =========================================================
+
+class MultiHeadClassifier:
+    """
+    One TfidfVectorizer shared by several linear heads (sentiment, priority,
+    optionally a KMeans cluster head): a message is tokenized and vectorized
+    once and every label comes out of the same sparse matrix.
+    """
+
+    def __init__(self, vectorizer=None):
+        self.vectorizer = vectorizer or TfidfVectorizer()
+        self.heads = {}
+
+    def fit(self, texts, labels: dict, n_clusters=None):
+        texts = pd.Series(texts).astype(str).reset_index(drop=True)
+        X = self.vectorizer.fit_transform(texts)
+        for name, y in labels.items():
+            y = pd.Series(y).reset_index(drop=True)
+            known = y.notna().to_numpy()
+            self.heads[name] = LogisticRegression(max_iter=1000).fit(X[known], y[known])
+        if n_clusters:
+            self.heads["cluster"] = KMeans(n_clusters=n_clusters, random_state=42, n_init=3).fit(X)
+        return self
+
+    def transform(self, texts):
+        return self.vectorizer.transform([str(t) for t in texts])
+
+    def predict_all(self, texts, heads=None) -> dict:
+        X = self.transform(texts)
+        return {name: self.heads[name].predict(X) for name in (heads or self.heads)}
+
+    def predict(self, texts, head: str):
+        return self.predict_all(texts, [head])[head]
+
+    def score(self, texts, labels: dict) -> dict:
+        predictions = self.predict_all(texts, list(labels))
+        return {name: float(np.mean(np.asarray(predictions[name]) == np.asarray(y))) for name, y in labels.items()}
+
+# =========================================================
+# Lazy Load Models (shared via services.model_registry)
 # =========================================================
 
 def load_priority_model():
-    global _priority_model
-    if _priority_model is None:
-        path = MODELS_DIR / "priority_pipeline.joblib"
-        if not path.exists():
-            raise FileNotFoundError(f"Priority model not found at {path}")
-        _priority_model = joblib.load(path)
-    return _priority_model
+    return get_pipeline("priority")
 
 def load_sentiment_model():
-    global _sentiment_model
-    if _sentiment_model is None:
-        path = MODELS_DIR / "sentiment_pipeline.joblib"
-        if not path.exists():
-            raise FileNotFoundError(f"Sentiment model not found at {path}")
-        _sentiment_model = joblib.load(path)
-    return _sentiment_model
+    return get_pipeline("sentiment")
+
+def load_multihead_model():
+    """Fused model if one was trained, else None (callers use the separate pipelines)."""
+    try:
+        return get_pipeline("multihead")
+    except FileNotFoundError:
+        return None
 
 # =========================================================
 # Prediction Wrappers
 # =========================================================
 
 def predict_priority(texts):
+    fused = load_multihead_model()
+    if fused is not None and "priority" in fused.heads:
+        return fused.predict(texts, "priority")
     model = load_priority_model()
     return model.predict(texts)
 
 def predict_sentiment(texts):
+    fused = load_multihead_model()
+    if fused is not None and "sentiment" in fused.heads:
+        return fused.predict(texts, "sentiment")
     model = load_sentiment_model()
     return model.predict(texts)
 
+def predict_labels(texts, labels=("sentiment", "priority")) -> dict:
+    """
+    {label: [prediction per text]}: one vectorization with the fused model,
+    otherwise one call per separate pipeline. Labels that fail fall back to
+    LABEL_FALLBACKS.
+    """
+    texts = [str(t) for t in texts]
+    fused = load_multihead_model()
+    if fused is not None and all(label in fused.heads for label in labels):
+        return {k: [str(v) for v in preds] for k, preds in fused.predict_all(texts, list(labels)).items()}
+
+    predictors = {"sentiment": predict_sentiment, "priority": predict_priority}
+    results = {}
+    for label in labels:
+        try:
+            results[label] = [str(p) for p in predictors[label](texts)]
+        except Exception as e:
+            logging.error("predict_%s error: %s", label, e)
+            results[label] = [LABEL_FALLBACKS.get(label, "unknown")] * len(texts)
+    return results
+
 # =========================================================
 # Treinamento e Salvamento
 # =========================================================
 
-def train_and_save_models_from_csv(csv_path):
+def train_and_save_models_from_csv(csv_path, mode=None, n_clusters=None):
+    """
+    Train the label models from a CSV with a 'text' or 'description' column.
+    mode="separate" (default, ML_TRAIN_MODE) saves one pipeline per label;
+    mode="fused" saves a MultiHeadClassifier (optionally with a KMeans head).
+    """
     df = pd.read_csv(csv_path)
 
     if "text" in df.columns:
@@ -66,6 +137,12 @@ def train_and_save_models_from_csv(csv_path):
     else:
         raise ValueError("CSV must contain 'text' or 'description' column")
 
+    mode = (mode or ML_TRAIN_MODE).lower()
+    if mode == "fused":
+        return train_and_save_multihead(texts, df, n_clusters=n_clusters)
+    if mode != "separate":
+        raise ValueError(f"Unknown training mode: {mode}")
+
     # --- Priority Model ---
     if "priority" in df.columns:
         X_train, X_test, y_train, y_test = train_test_split(
@@ -77,6 +154,7 @@ def train_and_save_models_from_csv(csv_path):
         )
         priority_model.fit(X_train, y_train)
         joblib.dump(priority_model, MODELS_DIR / "priority_pipeline.joblib")
+        model_registry.unload("pipeline:priority")
 
     # --- Sentiment Model ---
     if "sentiment" in df.columns:
@@ -89,6 +167,30 @@ def train_and_save_models_from_csv(csv_path):
         )
         sentiment_model.fit(X_train, y_train)
         joblib.dump(sentiment_model, MODELS_DIR / "sentiment_pipeline.joblib")
+        model_registry.unload("pipeline:sentiment")
+
+    # a stale fused model would otherwise keep answering predict_sentiment/priority
+    (MODELS_DIR / "multihead_pipeline.joblib").unlink(missing_ok=True)
+    model_registry.unload("pipeline:multihead")
+
+def train_and_save_multihead(texts, df, n_clusters=None):
+    label_cols = [c for c in ("sentiment", "priority") if c in df.columns]
+    if not label_cols:
+        raise ValueError("CSV must contain a 'sentiment' or 'priority' column")
+
+    X_train, X_test, idx_train, idx_test = train_test_split(
+        texts, df.index, test_size=0.2, random_state=42
+    )
+    model = MultiHeadClassifier().fit(
+        X_train, {c: df.loc[idx_train, c] for c in label_cols}, n_clusters=n_clusters
+    )
+    known = {c: df.loc[idx_test, c].notna().to_numpy() for c in label_cols}
+    scores = {c: model.score(X_test[known[c]], {c: df.loc[idx_test, c][known[c]]})[c] for c in label_cols}
+    logging.info(f"✅ Multi-head model trained: heads={list(model.heads)} test accuracy={scores}")
+
+    joblib.dump(model, MODELS_DIR / "multihead_pipeline.joblib")
+    model_registry.unload("pipeline:multihead")
+    return scores
 
 def train_and_save_kmeans_from_csv(csv_path, n_clusters=3):
     df = pd.read_csv(csv_path)
@@ -106,3 +208,19 @@ def train_and_save_kmeans_from_csv(csv_path, n_clusters=3):
     kmeans = KMeans(n_clusters=n_clusters, random_state=42)
     kmeans.fit(X_vectors)
     joblib.dump((kmeans, vectorizer), MODELS_DIR / "kmeans_model.joblib")
+
+
+def train_kmeans_on_vectors(vectors, n_clusters, batch_threshold=20000, random_state=42):
+    """
+    KMeans over dense vectors (e.g. embeddings). Large inputs use
+    MiniBatchKMeans so training stays tractable for big knowledge bases.
+    """
+    if len(vectors) >= batch_threshold:
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters, random_state=random_state,
+            batch_size=4096, n_init=3
+        )
+    else:
+        kmeans = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=3)
+    kmeans.fit(vectors)
+    return kmeans
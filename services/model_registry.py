@@ -0,0 +1,229 @@
+# services/model_registry.py
+# ===============================
+# One process-wide home for every model the app loads.
+#
+# Pages (re-executed on every Streamlit rerun), services and ml/ helpers all
+# ask the registry instead of calling from_pretrained / joblib.load
+# themselves, so each model is loaded once per process:
+#
+#   bert:<profile>        BertTokenizer + BertModel
+#   gpt2-lm:<profile>     GPT2Tokenizer + GPT2LMHeadModel (chat fallback)
+#   gpt2:<profile>        GPT-2 hidden-state embeddings; this is lm.transformer,
+#                         i.e. the same weights as gpt2-lm, not a second copy
+#   sbert:<profile>       SentenceTransformer all-MiniLM-L6-v2
+#   pipeline:<name>       joblib pipelines from ml/models (priority, sentiment)
+#
+# Every entry records its load time, last use and memory; models unused for
+# MODEL_IDLE_TTL seconds are unloaded on a later get() or with unload_idle()
+# (a shared entry stays loaded while anything derived from it is in use).
+# MODEL_IDLE_TTL=0 disables the automatic sweep.
+
+import gc
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from services.inference_profile import apply_inference_profile, model_size_mb, resolve_profile
+
+MODEL_IDLE_TTL = float(os.getenv("MODEL_IDLE_TTL", "1800"))
+PIPELINES_DIR = Path("ml/models")
+
+
+@dataclass
+class ModelEntry:
+    name: str
+    value: Any
+    size_mb: float
+    loaded_at: float
+    last_used: float
+    parent: Optional[str] = None      # entry whose weights this one shares
+    hits: int = 0
+
+
+def estimate_size_mb(value: Any) -> float:
+    """Memory of a torch module (or the modules inside a tuple); 0 for other objects."""
+    from torch import nn
+
+    items = value if isinstance(value, tuple) else (value,)
+    return sum(model_size_mb(v) for v in items if isinstance(v, nn.Module))
+
+
+class ModelRegistry:
+    def __init__(self, idle_ttl: float = MODEL_IDLE_TTL, clock: Callable[[], float] = time.monotonic):
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._entries: Dict[str, ModelEntry] = {}
+        self._lock = threading.RLock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._last_sweep = clock()
+        self.loads = 0
+        self.unloads = 0
+
+    def get(self, name: str, loader: Callable[[], Any], parent: Optional[str] = None) -> Any:
+        """Return the model called `name`, loading it once with `loader()`."""
+        value = self._get(name, loader, parent)
+        self._maybe_sweep()
+        return value
+
+    def _get(self, name, loader, parent):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                return self._touch(entry)
+            load_lock = self._loading.setdefault(name, threading.Lock())
+
+        # one loader per name; other names keep loading in parallel
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None:
+                    return self._touch(entry)
+            start = time.perf_counter()
+            value = loader()
+            size = 0.0 if parent else estimate_size_mb(value)
+            now = self._clock()
+            with self._lock:
+                self._entries[name] = ModelEntry(name, value, size, now, now, parent)
+                self.loads += 1
+            logging.info(f"📦 Model {name} loaded in {time.perf_counter() - start:.1f}s ({size:.1f} MB)")
+            return value
+
+    def _touch(self, entry: ModelEntry):
+        entry.last_used = self._clock()
+        entry.hits += 1
+        if entry.parent in self._entries:
+            self._entries[entry.parent].last_used = entry.last_used
+        return entry.value
+
+    def _maybe_sweep(self):
+        """Opportunistic idle unload, at most every idle_ttl / 4 seconds."""
+        if self.idle_ttl <= 0:
+            return
+        now = self._clock()
+        with self._lock:
+            if now - self._last_sweep < self.idle_ttl / 4:
+                return
+            self._last_sweep = now
+        self.unload_idle()
+
+    def loaded(self, name: str) -> bool:
+        with self._lock:
+            return name in self._entries
+
+    def unload(self, name: str) -> bool:
+        """Drop `name` and anything sharing its weights; returns False if it wasn't loaded."""
+        with self._lock:
+            if name not in self._entries:
+                return False
+            for child in [e.name for e in self._entries.values() if e.parent == name]:
+                self._entries.pop(child, None)
+            del self._entries[name]
+            self.unloads += 1
+        gc.collect()
+        logging.info(f"🗑 Model {name} unloaded")
+        return True
+
+    def unload_prefix(self, prefix: str) -> List[str]:
+        with self._lock:
+            names = [n for n in self._entries if n.startswith(prefix)]
+        return [n for n in names if self.unload(n)]
+
+    def unload_idle(self, max_idle: Optional[float] = None) -> List[str]:
+        """Unload models not used for `max_idle` seconds (default idle_ttl)."""
+        max_idle = self.idle_ttl if max_idle is None else max_idle
+        now = self._clock()
+        with self._lock:
+            idle = [e.name for e in self._entries.values()
+                    if e.parent is None and now - e.last_used >= max_idle]
+        return [n for n in idle if self.unload(n)]
+
+    def clear(self):
+        with self._lock:
+            names = [e.name for e in self._entries.values() if e.parent is None]
+        for name in names:
+            self.unload(name)
+
+    def stats(self) -> List[dict]:
+        now = self._clock()
+        with self._lock:
+            return [{
+                "model": e.name,
+                "size_mb": round(e.size_mb, 1),
+                "shares": e.parent,
+                "hits": e.hits,
+                "idle_s": round(now - e.last_used, 1),
+                "age_s": round(now - e.loaded_at, 1),
+            } for e in self._entries.values()]
+
+    def total_mb(self) -> float:
+        with self._lock:
+            return sum(e.size_mb for e in self._entries.values())
+
+
+model_registry = ModelRegistry()
+
+
+# =========================
+# Loaders
+# =========================
+def get_bert(profile: Optional[str] = None):
+    """(BertTokenizer, BertModel) for the given inference profile."""
+    profile = resolve_profile(profile)
+
+    def load():
+        from transformers import BertModel, BertTokenizer
+        tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
+        return tokenizer, apply_inference_profile(BertModel.from_pretrained("bert-base-uncased"), profile)
+
+    return model_registry.get(f"bert:{profile}", load)
+
+
+def get_gpt2_lm(profile: Optional[str] = None):
+    """(GPT2Tokenizer, GPT2LMHeadModel) used for text generation."""
+    profile = resolve_profile(profile)
+
+    def load():
+        from transformers import GPT2LMHeadModel, GPT2Tokenizer
+        tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
+        tokenizer.pad_token = tokenizer.eos_token
+        return tokenizer, apply_inference_profile(GPT2LMHeadModel.from_pretrained("gpt2"), profile)
+
+    return model_registry.get(f"gpt2-lm:{profile}", load)
+
+
+def get_gpt2(profile: Optional[str] = None):
+    """(GPT2Tokenizer, GPT2Model) for embeddings: the LM's own transformer, no extra weights."""
+    profile = resolve_profile(profile)
+    lm_name = f"gpt2-lm:{profile}"
+
+    def load():
+        tokenizer, lm = get_gpt2_lm(profile)
+        return tokenizer, lm.transformer
+
+    return model_registry.get(f"gpt2:{profile}", load, parent=lm_name)
+
+
+def get_sbert(profile: Optional[str] = None):
+    profile = resolve_profile(profile)
+
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return apply_inference_profile(SentenceTransformer("all-MiniLM-L6-v2", device="cpu"), profile)
+
+    return model_registry.get(f"sbert:{profile}", load)
+
+
+def get_pipeline(name: str):
+    """joblib pipeline ml/models/<name>_pipeline.joblib (priority, sentiment, ...)."""
+    def load():
+        import joblib
+        path = PIPELINES_DIR / f"{name}_pipeline.joblib"
+        if not path.exists():
+            raise FileNotFoundError(f"{name.capitalize()} model not found at {path}")
+        return joblib.load(path)
+
+    return model_registry.get(f"pipeline:{name}", load)
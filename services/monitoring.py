@@ -5,6 +5,7 @@ import bson
 import pandas as pd
 from datetime import datetime, timezone
 from services.mongo import db
+from services.event_sink import event_sink, csv_file
 
 timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
 
@@ -70,7 +71,7 @@ def log_user_interaction(user_id, question, answer, intent_tag, sentiment, prior
         "model_version": MODEL_VERSION,
         "timestamp": datetime.now(timezone.utc)
     }
-    monitoring_col.insert_one(doc)
+    event_sink.emit(monitoring_col, doc)
 
     logging.info(
         f"user_id={user_id} | intent={intent_tag} | priority={priority} | sentiment={sentiment} | "
@@ -87,10 +88,25 @@ def log_error(user_id, error):
         "error_msg": str(error),
         "timestamp": datetime.now(timezone.utc)
     }
-    monitoring_col.insert_one(doc)
+    event_sink.emit(monitoring_col, doc)
     logging.error(f"user_id={user_id} | Exception type={err_type}: {error}")
 
 
+def log_circuit_breaker(snapshot, previous_state):
+    """Record a circuit breaker state change (and its trip count) in monitoring."""
+    doc = {
+        "event": "circuit_breaker",
+        "previous_state": previous_state,
+        **snapshot,
+        "timestamp": datetime.now(timezone.utc)
+    }
+    event_sink.emit(monitoring_col, doc)
+    logging.warning(
+        f"circuit_breaker={snapshot.get('breaker')} | {previous_state} -> {snapshot.get('state')} | "
+        f"trips={snapshot.get('trips')} | failures={snapshot.get('consecutive_failures')}"
+    )
+
+
 def generate_report():
     total_responses = monitoring_col.count_documents({"intent_tag": {"$exists": True}})
     if total_responses == 0:
@@ -146,7 +162,6 @@ def log_execution(
     gpt2_response=None,
     bert_response=None
 ):
-    os.makedirs(LOG_DIR, exist_ok=True)
     filename = os.path.join(LOG_DIR, f"{execution_type}_log.csv")
     all_log_file = os.path.join(LOG_DIR, "all_log.csv")
 
@@ -183,17 +198,16 @@ def log_execution(
     if bert_response: 
         log_entry_bert["response"] = bert_response
 
-    # Salva no MongoDB
-    test_results_col.insert_one(log_entry_gpt2)
-    test_results_col.insert_one(log_entry_bert)
-
-    df = pd.DataFrame([log_entry_gpt2, log_entry_bert])
+    # Mongo + CSV via the write-behind sink (batched insert_many / appends);
+    # _id assigned here so the CSV rows keep the same _id column as the documents
+    for entry in (log_entry_gpt2, log_entry_bert):
+        entry["_id"] = bson.ObjectId()
     for file in [filename, all_log_file]:
-        if os.path.exists(file):
-            df.to_csv(file, mode="a", header=False, index=False)
-        else:
-            df.to_csv(file, index=False)
-    
+        for entry in (log_entry_gpt2, log_entry_bert):
+            event_sink.emit(csv_file(file), dict(entry))
+    event_sink.emit(test_results_col, log_entry_gpt2)
+    event_sink.emit(test_results_col, log_entry_bert)
+
     logging.info(
         f"Execução registrada: GPT-2 (t={gpt2_time}s, score={gpt2_score}) | "
         f"BERT (t={bert_time}s, score={bert_score}) | query={query}"
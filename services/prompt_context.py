@@ -0,0 +1,107 @@
+# services/prompt_context.py
+# ===============================
+# Rendered FAQ / intents / knowledge context block for the AI prompt.
+#
+# The block only changes when an admin edits content, so it is built once
+# (3 Mongo reads + string formatting) and shared by every session until the
+# services.content_version tuple for faq/knowledge/default_chat changes. A TTL
+# also refreshes it, to pick up edits made by another process.
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from services.content_version import get_versions
+
+PROMPT_CONTEXT_TTL = float(os.getenv("PROMPT_CONTEXT_TTL", "300"))
+PROMPT_FAQ_LIMIT = 10
+PROMPT_INTENT_LIMIT = 5
+PROMPT_KB_LIMIT = 5
+
+PROMPT_HEADER = """You are a support assistant for TechFix Solutions.
+Use the company's FAQ, known intent patterns,
+and support knowledge base to better answer customer questions."""
+
+PROMPT_FOOTER = "Respond professionally and clearly based on the context above."
+
+
+@dataclass(frozen=True)
+class PromptContext:
+    text: str
+    version: str         # e.g. "faq3-kb1-dc0"
+    built_at: float
+
+
+def format_version(versions) -> str:
+    faq_v, kb_v, dc_v = versions
+    return f"faq{faq_v}-kb{kb_v}-dc{dc_v}"
+
+
+def render_faq(entries) -> str:
+    return "\n".join([f"Q: {e.get('question','')}\nA: {e.get('answer','')}" for e in entries])
+
+
+def render_intents(intents) -> str:
+    return "\n".join([
+        f"[Intent: {i.get('tag','')}]\n"
+        f"Patterns: {', '.join(i.get('patterns', []))}\n"
+        f"Responses: {', '.join(i.get('responses', []))}"
+        for i in intents
+    ])
+
+
+def render_knowledge(articles) -> str:
+    return "\n".join([f"Title: {a.get('title','')}\nContent: {a.get('content','')}" for a in articles])
+
+
+def build_prompt_context(faq_col, default_chat_col, knowledge_col) -> str:
+    faq_entries = list(faq_col.find({}, {"_id": 0}).limit(PROMPT_FAQ_LIMIT))
+    default_doc = default_chat_col.find_one({"intents": {"$exists": True}}) or {}
+    intent_entries = default_doc.get("intents", [])[:PROMPT_INTENT_LIMIT]
+    knowledge_articles = list(knowledge_col.find({}, {"_id": 0}).limit(PROMPT_KB_LIMIT))
+
+    return f"""{PROMPT_HEADER}
+
+=== FAQs ===
+{render_faq(faq_entries)}
+
+=== Intents ===
+{render_intents(intent_entries)}
+
+=== Knowledge Articles ===
+{render_knowledge(knowledge_articles)}"""
+
+
+def render_prompt(context: str, user_input: str) -> str:
+    return f"{context}\n\nUSER: {user_input}\n{PROMPT_FOOTER}".strip()
+
+
+# =========================
+# Shared context
+# =========================
+_lock = threading.Lock()
+_cached = {"key": None, "context": None}
+
+
+def get_prompt_context(faq_col, default_chat_col, knowledge_col) -> PromptContext:
+    """Cached context block, rebuilt when content versions change or the TTL expires."""
+    versions = get_versions()
+    key = (faq_col, default_chat_col, knowledge_col, versions)
+    with _lock:
+        cached = _cached["context"]
+        if cached is not None and _cached["key"] == key and time.monotonic() - cached.built_at < PROMPT_CONTEXT_TTL:
+            return cached
+
+    text = build_prompt_context(faq_col, default_chat_col, knowledge_col)
+    context = PromptContext(text=text, version=format_version(versions), built_at=time.monotonic())
+    logging.info(f"🔹 Prompt context rebuilt ({len(text)} chars, version {context.version})")
+    with _lock:
+        _cached.update(key=key, context=context)
+    return context
+
+
+def invalidate_prompt_context():
+    with _lock:
+        _cached.update(key=None, context=None)
@@ -0,0 +1,148 @@
+# services/semantic_cache.py
+# ===============================
+# Semantic cache for AI (Gemini) replies.
+#
+# Stores (question embedding, answer) pairs in a services.vector_index
+# VectorIndex; a new question whose cosine similarity to a cached one is at
+# least SEMANTIC_CACHE_THRESHOLD is answered from the cache instead of calling
+# the model. Bounded by size (LRU eviction) and TTL, cleared on content edits,
+# and entries can be purged when users give the answer a thumbs-down.
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+from services.answer_cache import normalize_question
+from services.content_version import CONTENT_COLLECTIONS, subscribe
+from services.vector_index import VectorIndex, get_embed_fn
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+
+
+class SemanticCache:
+    def __init__(self, embed_fn: Optional[Callable] = None, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_size: int = SEMANTIC_CACHE_SIZE, ttl: float = SEMANTIC_CACHE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self._embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._index = VectorIndex()
+        self._expires = OrderedDict()    # key -> expires_at, in LRU order
+        self._lock = threading.RLock()
+        self.hits = self.misses = self.evictions = self.purged = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def embed(self, question: str) -> Optional[np.ndarray]:
+        """Question embedding, or None if the embedder is unavailable."""
+        try:
+            if self._embed_fn is None:
+                self._embed_fn = get_embed_fn()
+            return np.asarray(self._embed_fn([question]), dtype=np.float32)[0]
+        except Exception as e:
+            logging.error(f"Semantic cache embedding failed: {e}")
+            return None
+
+    def _remove(self, key: str):
+        self._index.remove(key)
+        self._expires.pop(key, None)
+
+    def lookup(self, question: str, vector: Optional[np.ndarray] = None) -> Optional[dict]:
+        """Best cached entry above the threshold: {question, answer, score}."""
+        if vector is None:
+            vector = self.embed(question)
+        if vector is None:
+            return None
+        with self._lock:
+            hits = self._index.search(vector, k=1)
+            if hits and hits[0]["score"] >= self.threshold:
+                key = hits[0]["key"]
+                if self._expires.get(key, 0) > self._clock():
+                    self._expires.move_to_end(key)
+                    self.hits += 1
+                    return {"question": hits[0]["question"], "answer": hits[0]["answer"], "score": hits[0]["score"]}
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def store(self, question: str, answer: str, vector: Optional[np.ndarray] = None):
+        if not answer:
+            return
+        if vector is None:
+            vector = self.embed(question)
+        if vector is None:
+            return
+        key = f"q:{normalize_question(question)}"
+        with self._lock:
+            self._index.add([key], vector[None, :], [{"question": question, "answer": answer}])
+            self._expires[key] = self._clock() + self.ttl
+            self._expires.move_to_end(key)
+            while len(self._expires) > self.max_size:
+                oldest = next(iter(self._expires))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def purge(self, question: Optional[str] = None, answer: Optional[str] = None) -> int:
+        """
+        Drop entries that returned `answer`, and the entry that would be served
+        for `question`. Used when a user marks an AI reply as unhelpful.
+        """
+        removed = 0
+        with self._lock:
+            if answer:
+                keys = [k for k, p in self._index.items() if p.get("answer") == answer]
+                for key in keys:
+                    self._remove(key)
+                removed += len(keys)
+            if question and len(self._index):
+                vector = self.embed(question)
+                hits = self._index.search(vector, k=1) if vector is not None else []
+                if hits and hits[0]["score"] >= self.threshold:
+                    self._remove(hits[0]["key"])
+                    removed += 1
+            self.purged += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._index = VectorIndex()
+            self._expires.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._index),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "evictions": self.evictions,
+                "purged": self.purged,
+            }
+
+
+# =========================
+# Shared cache
+# =========================
+semantic_cache = SemanticCache()
+
+
+def _on_content_change(name, action, doc):
+    # cached replies were generated from the old FAQ / knowledge context
+    semantic_cache.clear()
+
+
+for _name in CONTENT_COLLECTIONS:
+    subscribe(_name, _on_content_change)
@@ -0,0 +1,135 @@
+# services/tier_router.py
+# ===============================
+# Concurrent answer tiers for generate_bot_response.
+#
+# All lookup tiers (intent, FAQ/KB retrieval, ...) are started at once on a
+# shared thread pool and their results are taken in priority order, so a turn
+# costs about max(tiers) instead of sum(tiers). Optionally the AI call starts
+# speculatively at the same time; it is cancelled as soon as a cheaper tier
+# returns an answer and otherwise its (possibly streamed) output is used.
+# Speculative calls hold a worker for the whole LLM call, so they run on their
+# own pool and never delay the millisecond tiers.
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+TIER_TIMEOUT = float(os.getenv("TIER_TIMEOUT", "10"))
+SPECULATIVE_AI = os.getenv("SPECULATIVE_AI", "false").lower() in ("1", "true", "yes")
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TIER_WORKERS", "8")), thread_name_prefix="tier")
+_speculative_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SPECULATIVE_WORKERS", "8")),
+                                           thread_name_prefix="speculative")
+_DONE = object()
+
+
+@dataclass
+class TierResult:
+    answer: Optional[str]
+    source: Optional[str] = None
+    details: Dict[str, Any] = field(default_factory=dict)
+    payload: Any = None          # extra data for later stages (e.g. retrieval hits)
+
+
+@dataclass
+class RouteResult:
+    tier: Optional[str] = None                  # name of the winning tier, None if all missed
+    result: Optional[TierResult] = None
+    results: Dict[str, Optional[TierResult]] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class SpeculativeCall:
+    """
+    Runs a streaming producer (`stream_fn(cancel_event)` -> iterator of text)
+    in the background and buffers its chunks until someone consumes them.
+    `on_served` runs once a consumer has read the whole answer of a call that
+    was not cancelled (e.g. to cache an answer only when it was shown).
+    """
+
+    def __init__(self, stream_fn: Callable[[threading.Event], Iterator[str]], executor=None,
+                 on_served: Optional[Callable[[], None]] = None):
+        self.cancel_event = threading.Event()
+        self.started_at = time.perf_counter()
+        self._chunks = queue.Queue()
+        self._stream_fn = stream_fn
+        self._on_served = on_served
+        self._future = (executor or _speculative_executor).submit(self._run)
+
+    def _run(self):
+        try:
+            for chunk in self._stream_fn(self.cancel_event):
+                if self.cancel_event.is_set():
+                    break
+                self._chunks.put(chunk)
+        except Exception as e:
+            logging.error(f"Speculative AI call failed: {e}")
+        finally:
+            self._chunks.put(_DONE)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self._future.cancel()
+
+    def stream(self) -> Iterator[str]:
+        while True:
+            chunk = self._chunks.get()
+            if chunk is _DONE:
+                if self._on_served is not None and not self.cancelled:
+                    try:
+                        self._on_served()
+                    except Exception as e:
+                        logging.error(f"Speculative on_served failed: {e}")
+                return
+            yield chunk
+
+    def result(self) -> str:
+        return "".join(self.stream()).strip()
+
+
+class TierRouter:
+    def __init__(self, tiers: List[Tuple[str, Callable[[str], Optional[TierResult]]]],
+                 timeout: float = TIER_TIMEOUT, executor=None):
+        self.tiers = tiers
+        self.timeout = timeout
+        self._executor = executor or _executor
+
+    @staticmethod
+    def _timed(fn, question):
+        start = time.perf_counter()
+        result = fn(question)
+        return result, (time.perf_counter() - start) * 1000
+
+    def route(self, question: str, speculative: Optional[SpeculativeCall] = None) -> RouteResult:
+        """
+        Start every tier concurrently and return the highest-priority tier
+        (list order) that produced an answer; cancels `speculative` if any did.
+        """
+        futures = [(name, self._executor.submit(self._timed, fn, question)) for name, fn in self.tiers]
+        deadline = time.monotonic() + self.timeout
+        route = RouteResult()
+
+        for pos, (name, future) in enumerate(futures):
+            try:
+                result, route.timings[name] = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except Exception as e:
+                logging.error(f"Tier {name} failed: {e}")
+                result = None
+            route.results[name] = result
+            if result is not None and result.answer:
+                route.tier, route.result = name, result
+                if speculative is not None:
+                    speculative.cancel()
+                for _, pending in futures[pos + 1:]:
+                    pending.cancel()
+                break
+        return route
@@ -1,29 +1,23 @@
-import joblib
-import os
 import logging
-from functools import lru_cache
 from typing import Optional
 
-SENT_MODEL = "../ml/models/sentiment_pipeline.joblib"
-PRIO_MODEL = "../ml/models/priority_pipeline.joblib"
+from services.model_registry import get_pipeline
 
-@lru_cache(maxsize=2)
 def load_sentiment_model() -> Optional[object]:
     try:
-        return joblib.load(SENT_MODEL)
-    except FileNotFoundError:
-        logging.warning(f"Sentiment model not found at {SENT_MODEL}")
+        return get_pipeline("sentiment")
+    except FileNotFoundError as e:
+        logging.warning(str(e))
         return None
     except Exception as e:
         logging.error(f"Error loading sentiment model: {e}")
         return None
 
-@lru_cache(maxsize=2)
 def load_priority_model() -> Optional[object]:
     try:
-        return joblib.load(PRIO_MODEL)
-    except FileNotFoundError:
-        logging.warning(f"Priority model not found at {PRIO_MODEL}")
+        return get_pipeline("priority")
+    except FileNotFoundError as e:
+        logging.warning(str(e))
         return None
     except Exception as e:
         logging.error(f"Error loading priority model: {e}")
@@ -0,0 +1,371 @@
+# services/vector_index.py
+# ===============================
+# Dense retrieval index for FAQ questions and knowledge articles.
+#
+# All entries live in one L2-normalized float32 matrix, so cosine top-k for a
+# query is a single matrix-vector product. The shared index is built lazily
+# from Mongo and then kept up to date incrementally through the
+# services.content_version events fired by the Dashboard and the import page.
+
+import logging
+import os
+import threading
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+
+from services.content_version import subscribe
+
+RETRIEVAL_EMBEDDER = os.getenv("RETRIEVAL_EMBEDDER", "sbert")
+FAQ_MIN_SCORE = float(os.getenv("FAQ_MIN_SCORE", "0.75"))
+KB_MIN_SCORE = float(os.getenv("KB_MIN_SCORE", "0.60"))
+
+# Above this many entries searches go through an IVF index (services.ann_index)
+ANN_MIN_ENTRIES = int(os.getenv("ANN_MIN_ENTRIES", "50000"))
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", "ml/models/ann_index")
+
+KINDS = {"faq": 0, "kb": 1}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+OTHER_KIND = -1                      # entries without a known kind (e.g. semantic cache)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-8)
+
+
+# =========================
+# Matrix-backed index
+# =========================
+class VectorIndex:
+    """
+    Keyed float32 matrix with upsert/remove and matvec top-k search.
+    Each key also gets a stable integer id, used by the attached ANN indexes
+    (one IVF index per kind, so a kind-filtered search only probes that kind).
+    """
+
+    def __init__(self, dim: Optional[int] = None, capacity: int = 256):
+        self.dim = dim
+        self._capacity = capacity
+        self._matrix = None if dim is None else np.zeros((capacity, dim), dtype=np.float32)
+        self._kinds = np.zeros(capacity, dtype=np.int8)
+        self._keys: List[str] = []
+        self._ids: List[int] = []
+        self._payloads: List[dict] = []
+        self._rows = {}
+        self._id_rows = {}
+        self._next_id = 0
+        self.anns = {}                   # kind code -> IVFIndex, empty until build_ann()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def _grow(self, needed: int):
+        if self._matrix is not None and needed <= self._capacity:
+            return
+        capacity = max(self._capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        kinds = np.zeros(capacity, dtype=np.int8)
+        if self._matrix is not None:
+            matrix[:len(self)] = self._matrix[:len(self)]
+            kinds[:len(self)] = self._kinds[:len(self)]
+        self._matrix, self._kinds, self._capacity = matrix, kinds, capacity
+
+    def add(self, keys: List[str], vectors: np.ndarray, payloads: List[dict]):
+        """Insert or replace entries; vectors are normalized here."""
+        vectors = normalize_rows(vectors)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            self._grow(len(self) + len(keys))
+            ids, codes = [], []
+            for key, vec, payload in zip(keys, vectors, payloads):
+                row = self._rows.get(key)
+                if row is None:
+                    row = len(self._keys)
+                    self._keys.append(key)
+                    self._ids.append(self._next_id)
+                    self._payloads.append(payload)
+                    self._rows[key] = row
+                    self._id_rows[self._next_id] = row
+                    self._next_id += 1
+                else:
+                    self._payloads[row] = payload
+                    old_code = int(self._kinds[row])
+                    code = KINDS.get(payload.get("kind"), OTHER_KIND)
+                    if self.anns and old_code != code and old_code in self.anns:
+                        self.anns[old_code].remove([self._ids[row]])
+                self._matrix[row] = vec
+                self._kinds[row] = KINDS.get(payload.get("kind"), OTHER_KIND)
+                ids.append(self._ids[row])
+                codes.append(int(self._kinds[row]))
+            if self.anns:
+                ids, codes = np.asarray(ids), np.asarray(codes)
+                for code in np.unique(codes):
+                    mask = codes == code
+                    self._ann_for(int(code), vectors[mask]).add(ids[mask], vectors[mask])
+
+    def remove(self, key: str) -> bool:
+        """Delete an entry by swapping the last row into its slot."""
+        with self._lock:
+            row = self._rows.pop(key, None)
+            if row is None:
+                return False
+            removed_id = self._ids[row]
+            removed_code = int(self._kinds[row])
+            del self._id_rows[removed_id]
+            last = len(self._keys) - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._kinds[row] = self._kinds[last]
+                self._keys[row] = self._keys[last]
+                self._ids[row] = self._ids[last]
+                self._payloads[row] = self._payloads[last]
+                self._rows[self._keys[row]] = row
+                self._id_rows[self._ids[row]] = row
+            self._keys.pop()
+            self._ids.pop()
+            self._payloads.pop()
+            if removed_code in self.anns:
+                self.anns[removed_code].remove([removed_id])
+            return True
+
+    def items(self) -> List[tuple]:
+        """Snapshot of (key, payload) pairs."""
+        with self._lock:
+            return list(zip(self._keys, self._payloads))
+
+    def search(self, query: np.ndarray, k: int = 5, kind: Optional[str] = None) -> List[dict]:
+        """Top-k entries by cosine similarity, optionally restricted to one kind."""
+        with self._lock:
+            n = len(self)
+            if n == 0:
+                return []
+            q = normalize_rows(query)[0]
+            if self.anns:
+                return self._search_ann(q, k, kind)
+            return self._search_exact(q, k, kind)
+
+    def _search_exact(self, q: np.ndarray, k: int, kind: Optional[str]) -> List[dict]:
+        n = len(self)
+        scores = self._matrix[:n] @ q
+        if kind is not None:
+            scores = np.where(self._kinds[:n] == KINDS[kind], scores, -np.inf)
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"key": self._keys[i], "score": float(scores[i]), **self._payloads[i]}
+            for i in top if np.isfinite(scores[i])
+        ]
+
+    def _search_ann(self, q: np.ndarray, k: int, kind: Optional[str]) -> List[dict]:
+        # a kind filter probes that kind's index only; no filter merges the
+        # top-k of every kind's index
+        if kind is not None:
+            anns = [self.anns[KINDS[kind]]] if KINDS[kind] in self.anns else []
+        else:
+            anns = list(self.anns.values())
+        hits = []
+        for ann in anns:
+            ids, scores = ann.search(q, k=k)
+            for entry_id, score in zip(ids, scores):
+                row = self._id_rows.get(int(entry_id))
+                if row is not None:
+                    hits.append({"key": self._keys[row], "score": float(score), **self._payloads[row]})
+        hits.sort(key=lambda h: -h["score"])
+        return hits[:k]
+
+    def _ann_for(self, code: int, vectors: np.ndarray):
+        """IVF index of a kind; a kind first seen after build_ann gets a one-list (exact) index."""
+        from services.ann_index import IVFIndex
+        ann = self.anns.get(code)
+        if ann is None:
+            ann = self.anns[code] = IVFIndex(vectors.mean(axis=0, keepdims=True))
+        return ann
+
+    def count(self, kind: Optional[str] = None) -> int:
+        """Number of entries, optionally of one kind."""
+        with self._lock:
+            n = len(self)
+            if kind is None:
+                return n
+            return int(np.count_nonzero(self._kinds[:n] == KINDS[kind]))
+
+    def build_ann(self, nlist: Optional[int] = None, nprobe: Optional[int] = None,
+                  path: Optional[str] = None) -> dict:
+        """
+        Attach one IVF index per kind over the current entries ({kind code:
+        IVFIndex}); `nlist` lists are shared between the kinds by size. If `path`/<kind> holds a
+        saved index with the same dimension, only its trained quantizer is
+        reused (the k-means fit is the expensive part): the vectors are
+        assigned to its lists again, since entry ids are per process.
+        Otherwise a new quantizer is trained and saved to `path`/<kind>.
+        """
+        from services.ann_index import IVFIndex, DEFAULT_NPROBE, default_nlist
+
+        with self._lock:
+            n = len(self)
+            if n == 0:
+                return {}
+            anns = {}
+            ids = np.asarray(self._ids[:n])
+            for code in np.unique(self._kinds[:n]):
+                code = int(code)
+                mask = self._kinds[:n] == code
+                vectors = self._matrix[:n][mask]
+                kind_path = os.path.join(path, KIND_NAMES.get(code, "other")) if path else None
+                ann = None
+                if kind_path and os.path.exists(os.path.join(kind_path, "meta.json")):
+                    try:
+                        ann = IVFIndex.load(kind_path, mmap=False)
+                        if ann.dim != self.dim:
+                            ann = None
+                        else:
+                            ann.reset()
+                    except Exception as e:
+                        logging.warning(f"Could not load ANN index from {kind_path}: {e}")
+                        ann = None
+                trained = ann is None
+                if trained:
+                    # the lists of every kind hold about as many vectors, so a
+                    # rare kind gets few lists and nprobe still covers it
+                    lists = default_nlist(len(vectors)) if nlist is None else max(1, round(nlist * len(vectors) / n))
+                    ann = IVFIndex.train(vectors, nlist=lists)
+                if nprobe or trained:
+                    ann.nprobe = nprobe or DEFAULT_NPROBE
+                ann.add(ids[mask], vectors)
+                ann.compact()
+                if trained and kind_path:
+                    ann.save(kind_path)
+                anns[code] = ann
+            self.anns = anns
+            return anns
+
+
+# =========================
+# FAQ / knowledge documents
+# =========================
+def faq_entry(doc: dict):
+    text = str(doc.get("question", "") or "")
+    return f"faq:{doc['_id']}", text, {"kind": "faq", "text": text, "question": text, "answer": doc.get("answer")}
+
+
+def knowledge_entry(doc: dict):
+    title = str(doc.get("title", "") or "")
+    content = str(doc.get("content", "") or "")
+    text = f"{title}\n{content}".strip()
+    return f"kb:{doc['_id']}", text, {"kind": "kb", "text": text, "title": title, "answer": doc.get("content")}
+
+
+ENTRY_BUILDERS = {"faq": faq_entry, "knowledge": knowledge_entry}
+
+
+def get_embed_fn(name: str = RETRIEVAL_EMBEDDER) -> Callable:
+    """Embedding function for the index; per-query calls are micro-batched across sessions."""
+    from services.batching import MICRO_BATCHING, batched_embed_fn
+    if MICRO_BATCHING:
+        return batched_embed_fn(name)
+    from services.embeddings import get_bert_embeddings, get_sbert_embeddings
+    return {"bert": get_bert_embeddings, "sbert": get_sbert_embeddings}[name]
+
+
+class KnowledgeIndex:
+    """VectorIndex over the faq + knowledge collections, embedding text on the way in."""
+
+    def __init__(self, embed_fn: Optional[Callable] = None):
+        self.embed_fn = embed_fn or get_embed_fn()
+        self.index = VectorIndex()
+
+    def __len__(self):
+        return len(self.index)
+
+    def upsert(self, collection: str, docs: Iterable[dict]):
+        entries = [ENTRY_BUILDERS[collection](d) for d in docs if d and d.get("_id") is not None]
+        # an update that cleared the text must not leave the old vector live
+        for key, text, _ in entries:
+            if not text:
+                self.index.remove(key)
+        entries = [e for e in entries if e[1]]
+        if not entries:
+            return
+        keys, texts, payloads = zip(*entries)
+        self.index.add(list(keys), self.embed_fn(list(texts)), list(payloads))
+
+    def delete(self, collection: str, doc: dict):
+        prefix = "faq" if collection == "faq" else "kb"
+        self.index.remove(f"{prefix}:{doc['_id']}")
+
+    def search_text(self, text: str, k: int = 5, kind: Optional[str] = None) -> List[dict]:
+        if not len(self.index):
+            return []
+        return self.index.search(self.embed_fn([text]), k=k, kind=kind)
+
+
+# =========================
+# Shared index
+# =========================
+_lock = threading.Lock()
+_cached = {"collections": None, "index": None, "stale": False}
+
+
+def build_knowledge_index(faq_col, knowledge_col, embed_fn: Optional[Callable] = None) -> KnowledgeIndex:
+    index = KnowledgeIndex(embed_fn)
+    index.upsert("faq", faq_col.find({}, {"question": 1, "answer": 1}))
+    index.upsert("knowledge", knowledge_col.find({}, {"title": 1, "content": 1}))
+    logging.info(f"🔹 Dense knowledge index built with {len(index)} entries")
+    if len(index) >= ANN_MIN_ENTRIES:
+        index.index.build_ann(path=ANN_INDEX_PATH)
+    return index
+
+
+def get_knowledge_index(faq_col, knowledge_col) -> KnowledgeIndex:
+    with _lock:
+        cached = _cached["index"]
+        same = _cached["collections"] == (faq_col, knowledge_col)
+        if cached is not None and same and not _cached["stale"]:
+            return cached
+
+    index = build_knowledge_index(faq_col, knowledge_col)
+    with _lock:
+        _cached.update(collections=(faq_col, knowledge_col), index=index, stale=False)
+    return index
+
+
+def invalidate_knowledge_index():
+    with _lock:
+        _cached.update(collections=None, index=None, stale=False)
+
+
+def _on_content_change(name, action, doc):
+    with _lock:
+        index = _cached["index"]
+    if index is None:
+        return
+    try:
+        if action in ("insert", "update") and isinstance(doc, dict):
+            index.upsert(name, [doc])
+        elif action == "delete" and isinstance(doc, dict):
+            index.delete(name, doc)
+        elif action == "bulk" and isinstance(doc, list):
+            index.upsert(name, doc)
+        else:
+            with _lock:
+                _cached["stale"] = True
+    except Exception as e:
+        logging.error(f"Dense index update failed ({name}/{action}): {e}")
+        with _lock:
+            _cached["stale"] = True
+
+
+for _name in ENTRY_BUILDERS:
+    subscribe(_name, _on_content_change)
@@ -0,0 +1,88 @@
+# simulation/benchmark_ann.py
+# ===========================
+## python -m simulation.benchmark_ann
+## python -m simulation.benchmark_ann --size 200000 --dim 384 --nprobe 1 4 16 64
+
+import argparse
+import logging
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from services.ann_index import IVFIndex, exact_search, default_nlist
+from services.vector_index import normalize_rows
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+def make_dataset(size, dim, n_queries, n_topics=500, seed=42):
+    """Clustered synthetic 'embeddings': articles scattered around topic vectors."""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    labels = rng.integers(0, n_topics, size)
+    data = topics[labels] + 1.5 * rng.standard_normal((size, dim)).astype(np.float32)
+    q_labels = rng.integers(0, n_topics, n_queries)
+    queries = topics[q_labels] + 1.5 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    return normalize_rows(data), normalize_rows(queries)
+
+
+def run_benchmark(size, dim, n_queries, k, nprobes, nlist=None, save_path=None):
+    data, queries = make_dataset(size, dim, n_queries)
+
+    start = time.perf_counter()
+    truth = [set(exact_search(data, q, k)[0].tolist()) for q in queries]
+    exact_qps = n_queries / (time.perf_counter() - start)
+    logging.info(f"⏱ exact search: {exact_qps:.1f} QPS")
+
+    start = time.perf_counter()
+    index = IVFIndex.train(data, nlist=nlist or default_nlist(size))
+    index.add(np.arange(size), data)
+    index.compact()
+    build_s = time.perf_counter() - start
+    logging.info(f"⏱ IVF build (nlist={index.nlist}): {build_s:.1f}s")
+
+    if save_path:
+        index.save(save_path)
+        index = IVFIndex.load(save_path)
+
+    rows = [{"method": "exact", "nprobe": None, "recall_at_k": 1.0, "qps": round(exact_qps, 1)}]
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        found = [index.search(q, k, nprobe=nprobe)[0] for q in queries]
+        qps = n_queries / (time.perf_counter() - start)
+        recall = np.mean([len(truth[i] & set(f.tolist())) / k for i, f in enumerate(found)])
+        row = {"method": "ivf", "nprobe": nprobe, "recall_at_k": round(float(recall), 4), "qps": round(qps, 1)}
+        logging.info(f"⏱ {row}")
+        rows.append(row)
+
+    df = pd.DataFrame(rows)
+    df["size"], df["dim"], df["k"], df["nlist"] = size, dim, k, index.nlist
+    df["speedup"] = (df["qps"] / exact_qps).round(2)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IVF recall@k / QPS against exact search.")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--save", default=None, help="Optional directory to persist the index")
+    args = parser.parse_args()
+
+    df = run_benchmark(args.size, args.dim, args.queries, args.k, args.nprobe, args.nlist, args.save)
+    print(df.to_string(index=False))
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    Path("simulation/result").mkdir(parents=True, exist_ok=True)
+    out = f"simulation/result/benchmark_ann-{timestamp}.csv"
+    df.to_csv(out, index=False)
+    logging.info(f"✅ Benchmark saved to {out}")
@@ -0,0 +1,146 @@
+# simulation/benchmark_batching.py
+# ================================
+## python -m simulation.benchmark_batching
+## python -m simulation.benchmark_batching --model bert --users 1 2 4 8 16 32 64 --requests 20
+## python -m simulation.benchmark_batching --model tiny --max-batch 32 --max-wait-ms 2 5 10
+#
+# Throughput and latency of per-request embedding calls vs the shared
+# MicroBatcher (services/batching.py) with 1-64 concurrent "users", each
+# sending questions back to back. --model tiny uses a small random-init BERT
+# so the benchmark runs without downloading weights.
+
+import argparse
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+from services.batching import MicroBatcher
+from services.embeddings import mean_pool
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+QUESTIONS = [
+    "how do I reset my password",
+    "vpn keeps disconnecting every few minutes when I work from home",
+    "printer on the third floor is out of toner",
+    "cannot access the shared drive after the last windows update",
+    "my laptop battery drains very fast",
+    "request new software licence for the design team",
+    "outlook is not syncing my calendar with my phone",
+    "wifi is slow",
+]
+
+
+def make_embedder(model_name):
+    """Return embed(texts) -> (n, dim) numpy array with masked mean pooling."""
+    if model_name == "tiny":
+        from transformers import BertConfig, BertModel
+        torch.manual_seed(0)
+        model = BertModel(BertConfig(num_hidden_layers=4, hidden_size=256, num_attention_heads=4,
+                                     intermediate_size=1024)).eval()
+        vocab = {w for q in QUESTIONS for w in q.split()}
+        ids = {w: i + 5 for i, w in enumerate(sorted(vocab))}
+
+        def tokenize(texts):
+            rows = [[1] + [ids.get(w, 3) for w in t.split()] + [2] for t in texts]
+            width = max(map(len, rows))
+            input_ids = torch.tensor([r + [0] * (width - len(r)) for r in rows])
+            return {"input_ids": input_ids, "attention_mask": (input_ids != 0).long()}
+    else:
+        from services.embeddings import load_bert
+        tokenizer, model = load_bert()
+
+        def tokenize(texts):
+            return tokenizer(list(texts), return_tensors="pt", truncation=True, padding=True)
+
+    def embed(texts):
+        inputs = tokenize(texts)
+        with torch.no_grad():
+            hidden = model(**inputs).last_hidden_state
+        return mean_pool(hidden, inputs["attention_mask"]).float().numpy()
+
+    return embed
+
+
+def run_users(call, users, requests_per_user, seed=42):
+    latencies, lock = [], threading.Lock()
+    barrier = threading.Barrier(users)
+
+    def user(uid):
+        rng = random.Random(seed + uid)
+        barrier.wait()
+        for _ in range(requests_per_user):
+            start = time.perf_counter()
+            call(rng.choice(QUESTIONS))
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=user, args=(u,)) for u in range(users)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+    }
+
+
+def run_benchmark(model_name, users_list, requests_per_user, max_batch, waits_ms):
+    embed = make_embedder(model_name)
+    embed(QUESTIONS)        # warm-up
+    rows = []
+    for users in users_list:
+        row = {"users": users, "mode": "per_request", "max_wait_ms": None, "avg_batch": 1.0,
+               **run_users(lambda q: embed([q])[0], users, requests_per_user)}
+        logging.info(f"⏱ {row}")
+        rows.append(row)
+
+        for wait_ms in waits_ms:
+            batcher = MicroBatcher("bench", embed, max_batch_size=max_batch, max_wait_ms=wait_ms)
+            metrics = run_users(lambda q: batcher.submit(q).result(), users, requests_per_user)
+            row = {"users": users, "mode": "micro_batch", "max_wait_ms": wait_ms,
+                   "avg_batch": batcher.stats()["avg_batch"], **metrics}
+            batcher.close()
+            logging.info(f"⏱ {row}")
+            rows.append(row)
+
+    df = pd.DataFrame(rows)
+    df["model"], df["max_batch"], df["requests_per_user"] = model_name, max_batch, requests_per_user
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request vs micro-batched embedding under concurrency.")
+    parser.add_argument("--model", choices=["tiny", "bert"], default="tiny")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--requests", type=int, default=20, help="Requests per user")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, nargs="+", default=[5.0])
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    df = run_benchmark(args.model, args.users, args.requests, args.max_batch, args.max_wait_ms)
+    print(df.to_string(index=False))
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    Path("simulation/result").mkdir(parents=True, exist_ok=True)
+    out = f"simulation/result/benchmark_batching-{timestamp}.csv"
+    df.to_csv(out, index=False)
+    logging.info(f"✅ Benchmark saved to {out}")
@@ -0,0 +1,168 @@
+# simulation/benchmark_chat_writes.py
+# ===================================
+## python -m simulation.benchmark_chat_writes
+## python -m simulation.benchmark_chat_writes --sessions 20 --turns 10 --rtt-ms 1.5
+## python -m simulation.benchmark_chat_writes --mongo "mongodb://localhost:27017" --rtt-ms 0
+#
+# Database round-trips (and simulated latency) per chat turn for the
+# previous write paths vs the current ones:
+#
+#   chat page  before: upsert session header, $push question, positional $set answer
+#              two_step: chat_store append (question) + update_message (answer)
+#              batched:  chat_store append of the whole turn (CHAT_BATCH_TURN_WRITES), one
+#                        bucket upsert; the header is only written when a bucket opens
+#   services.db before: find_one + update_one/insert_one per message
+#               after:  save_chat_turn, one upsert with $push $each
+#
+# Runs on mongomock by default; --mongo points it at a real server.
+
+import argparse
+import logging
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+import mongomock
+import pandas as pd
+from pymongo import MongoClient
+
+from services import chat_store
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+OPERATIONS = {"find", "find_one", "find_one_and_update", "insert_one", "insert_many",
+              "update_one", "update_many", "bulk_write", "delete_one", "delete_many"}
+
+
+class CountingCollection:
+    """Collection proxy that counts (and optionally delays) every server operation."""
+
+    def __init__(self, collection, counter: Counter, rtt_ms: float = 0.0):
+        self._collection, self._counter, self._rtt = collection, counter, rtt_ms / 1000
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in OPERATIONS:
+            return attr
+
+        def call(*args, **kwargs):
+            self._counter[name] += 1
+            if self._rtt:
+                time.sleep(self._rtt)
+            return attr(*args, **kwargs)
+        return call
+
+
+def now():
+    return datetime.now(timezone.utc)
+
+
+def message(question, answer=None):
+    return {"message_id": str(uuid.uuid4()), "question": question, "answer": answer,
+            "timestamp": now(), "user_time": now(), "bot_time": now() if answer else None}
+
+
+# =========================
+# Write paths
+# =========================
+def chat_before(cols, session_id, question, answer):
+    chats = cols["chats"]
+    chats.update_one({"session_id": session_id},
+                     {"$setOnInsert": {"user_id": "u", "start_time": now(), "messages": []},
+                      "$set": {"last_updated": now()}}, upsert=True)
+    msg = message(question)
+    chats.update_one({"session_id": session_id},
+                     {"$push": {"messages": msg}, "$set": {"last_updated": now()}}, upsert=True)
+    chats.update_one({"session_id": session_id, "messages.message_id": msg["message_id"]},
+                     {"$set": {"messages.$.answer": answer, "messages.$.bot_time": now()}})
+
+
+def chat_two_step(cols, session_id, question, answer):
+    msg = message(question)
+    chat_store.append_message(session_id, msg, user_id="u", chats_col=cols["chats"], buckets_col=cols["chat_buckets"])
+    chat_store.update_message(session_id, msg["message_id"], {"answer": answer, "bot_time": now()},
+                              chats_col=cols["chats"], buckets_col=cols["chat_buckets"])
+
+
+def chat_batched(cols, session_id, question, answer):
+    chat_store.append_message(session_id, message(question, answer), user_id="u",
+                              chats_col=cols["chats"], buckets_col=cols["chat_buckets"])
+
+
+def db_before(cols, session_id, question, answer):
+    chat = cols["chat"]
+    for role, content in (("user", question), ("assistant", answer)):
+        doc = chat.find_one({"session_id": session_id})
+        msg = {"role": role, "content": content, "timestamp": now(), "feedback": ""}
+        if doc:
+            chat.update_one({"_id": doc["_id"]}, {"$push": {"messages": msg}})
+        else:
+            chat.insert_one({"session_id": session_id, "start_time": now(), "messages": [msg]})
+
+
+def db_after(cols, session_id, question, answer):
+    import services.db as db_services
+    original = db_services.chats_col
+    db_services.chats_col = cols["chat"]
+    try:
+        db_services.save_chat_turn(session_id, question, answer)
+    finally:
+        db_services.chats_col = original
+
+
+PATHS = {
+    "chat_page/before": chat_before,
+    "chat_page/two_step": chat_two_step,
+    "chat_page/batched": chat_batched,
+    "services.db/before": db_before,
+    "services.db/after": db_after,
+}
+
+
+def run_benchmark(sessions, turns, rtt_ms, mongo_uri=None):
+    client = MongoClient(mongo_uri) if mongo_uri else mongomock.MongoClient()
+    rows = []
+    for name, write_turn in PATHS.items():
+        database = client[f"bench_chat_writes_{uuid.uuid4().hex[:8]}"]
+        counter = Counter()
+        cols = {c: CountingCollection(database[c], counter, rtt_ms) for c in ("chats", "chat_buckets", "chat")}
+        start = time.perf_counter()
+        for s in range(sessions):
+            session_id = f"session-{s}"
+            for t in range(turns):
+                write_turn(cols, session_id, f"question {t} of {s}", f"answer {t}")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if mongo_uri:
+            client.drop_database(database.name)
+
+        total_turns = sessions * turns
+        row = {"path": name, "turns": total_turns,
+               "round_trips_per_turn": round(sum(counter.values()) / total_turns, 2),
+               "ms_per_turn": round(elapsed_ms / total_turns, 3),
+               "operations": dict(counter)}
+        logging.info(f"⏱ {row}")
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Round-trips per chat turn, before vs after.")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=10, help="Turns per session")
+    parser.add_argument("--rtt-ms", type=float, default=1.0, help="Simulated latency per operation")
+    parser.add_argument("--mongo", default=None, help="MongoDB URI (default: mongomock)")
+    args = parser.parse_args()
+
+    df = run_benchmark(args.sessions, args.turns, args.rtt_ms, args.mongo)
+    print(df.to_string(index=False))
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    Path("simulation/result").mkdir(parents=True, exist_ok=True)
+    out = f"simulation/result/benchmark_chat_writes-{timestamp}.csv"
+    df.to_csv(out, index=False)
+    logging.info(f"✅ Benchmark saved to {out}")
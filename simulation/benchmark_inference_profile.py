@@ -0,0 +1,110 @@
+# simulation/benchmark_inference_profile.py
+# =========================================
+## python -m simulation.benchmark_inference_profile
+## python -m simulation.benchmark_inference_profile --profiles fp32 int8 bf16 --batch 32 --repeats 5
+## python -m simulation.benchmark_inference_profile --drift --rows 400
+#
+# Embedding latency, model memory and (with --drift) accuracy drift of the
+# inference profiles from services/inference_profile.py on the local dataset.
+
+import argparse
+import logging
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+import torch
+from sklearn.model_selection import train_test_split
+
+from services.embeddings import (
+    get_bert_embeddings, get_gpt2_embeddings, get_sbert_embeddings,
+    load_bert, load_gpt2, load_sbert,
+)
+from services.evaluation import evaluate_profile_drift
+from services.inference_profile import model_size_mb
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+EMBED_FNS = {"BERT": get_bert_embeddings, "GPT-2": get_gpt2_embeddings, "SBERT": get_sbert_embeddings}
+LOADERS = {
+    "BERT": lambda p: load_bert(profile=p)[1],
+    "GPT-2": lambda p: load_gpt2(profile=p)[1],
+    "SBERT": lambda p: load_sbert(profile=p),
+}
+
+
+def load_texts(rows):
+    df = pd.read_csv("data/train_model.csv")[["description", "sentiment"]].dropna()
+    return df.sample(min(rows, len(df)), random_state=42)
+
+
+def run_latency(texts, profiles, batch, repeats):
+    rows = []
+    for name, embed_fn in EMBED_FNS.items():
+        for profile in profiles:
+            size = model_size_mb(LOADERS[name](profile))
+            embed_fn(texts[:batch], profile=profile)        # warm-up
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                for i in range(0, len(texts), batch):
+                    embed_fn(texts[i:i + batch], profile=profile)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            row = {"model": name, "profile": profile, "size_mb": round(size, 1),
+                   "texts": len(texts), "batch": batch,
+                   "seconds": round(best, 3), "texts_per_s": round(len(texts) / best, 1)}
+            logging.info(f"⏱ {row}")
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def run_drift(df, profiles):
+    X_train, X_test, y_train, y_test = train_test_split(
+        df["description"].tolist(), df["sentiment"].tolist(),
+        test_size=0.5, random_state=42, stratify=df["sentiment"]
+    )
+    dataset = {"X_train": X_train, "y_train": y_train, "X_test": X_test, "y_test": y_test,
+               "texts": df["description"].tolist()}
+    rows = []
+    for profile in profiles:
+        if profile == "fp32":
+            continue
+        report = evaluate_profile_drift(EMBED_FNS, dataset, profile=profile, n_clusters=3)
+        for name, drift in report["drift"].items():
+            rows.append({"model": name, "profile": profile,
+                         "cosine_mean": round(drift["cosine_mean"], 5),
+                         "cosine_min": round(drift["cosine_min"], 5),
+                         **{k: round(v, 4) for k, v in drift["deltas"].items() if not k.endswith("_sec")}})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency / memory / drift of the inference profiles.")
+    parser.add_argument("--profiles", nargs="+", default=["fp32", "int8", "bf16"])
+    parser.add_argument("--rows", type=int, default=256)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--drift", action="store_true", help="Also report accuracy drift vs fp32")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    df = load_texts(args.rows)
+    results = {"latency": run_latency(df["description"].astype(str).tolist(), args.profiles,
+                                      args.batch, args.repeats)}
+    if args.drift:
+        results["drift"] = run_drift(df, args.profiles)
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    Path("simulation/result").mkdir(parents=True, exist_ok=True)
+    for kind, frame in results.items():
+        print(frame.to_string(index=False))
+        out = f"simulation/result/benchmark_inference_profile-{kind}-{timestamp}.csv"
+        frame.to_csv(out, index=False)
+        logging.info(f"✅ Benchmark saved to {out}")
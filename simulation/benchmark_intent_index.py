@@ -0,0 +1,122 @@
+# simulation/benchmark_intent_index.py
+# ====================================
+## python -m simulation.benchmark_intent_index
+## python -m simulation.benchmark_intent_index --sizes 100 1000 5000 --queries 200
+
+import argparse
+import logging
+import random
+import string
+import time
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from services.intent_index import IntentIndex, INTENT_SIM_THRESHOLD
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+WORDS = [
+    "password", "reset", "vpn", "printer", "email", "account", "login", "laptop",
+    "network", "slow", "error", "install", "update", "access", "drive", "wifi",
+    "screen", "license", "outlook", "teams", "locked", "broken", "connect", "help",
+]
+
+
+def make_intents(n_patterns, patterns_per_intent=10, seed=42):
+    rng = random.Random(seed)
+    intents = []
+    for i in range(0, n_patterns, patterns_per_intent):
+        patterns = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6)))
+            + " " + "".join(rng.choices(string.ascii_lowercase, k=3))
+            for _ in range(min(patterns_per_intent, n_patterns - i))
+        ]
+        intents.append({"tag": f"intent_{i}", "patterns": patterns, "responses": ["ok"]})
+    return intents
+
+
+def make_queries(intents, n_queries, seed=7):
+    """Half near-duplicates of real patterns (hits), half random sentences (misses)."""
+    rng = random.Random(seed)
+    all_patterns = [p for i in intents for p in i["patterns"]]
+    queries = []
+    for q in range(n_queries):
+        if q % 2 == 0:
+            p = list(rng.choice(all_patterns))
+            p[rng.randrange(len(p))] = rng.choice(string.ascii_lowercase)
+            queries.append("".join(p))
+        else:
+            queries.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))))
+    return queries
+
+
+def linear_match(intents, text, threshold=INTENT_SIM_THRESHOLD):
+    """Original find_default_answer loop."""
+    for intent in intents:
+        for pattern in intent.get("patterns", []):
+            if SequenceMatcher(None, str(pattern).lower(), text).ratio() > threshold:
+                return intent, pattern
+    return None
+
+
+def run_benchmark(sizes, n_queries):
+    rows = []
+    for size in sizes:
+        intents = make_intents(size)
+        queries = make_queries(intents, n_queries)
+
+        start = time.perf_counter()
+        index = IntentIndex(intents)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        linear_times, index_times, candidates = [], [], []
+        mismatches = 0
+        for q in queries:
+            t0 = time.perf_counter()
+            expected = linear_match(intents, q)
+            linear_times.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            got = index.match(q)
+            index_times.append((time.perf_counter() - t0) * 1000)
+
+            candidates.append(len(index.candidates(q)))
+            if (expected and expected[1]) != (got and got[1]):
+                mismatches += 1
+
+        row = {
+            "patterns": size,
+            "build_ms": round(build_ms, 2),
+            "linear_p50_ms": round(float(np.percentile(linear_times, 50)), 3),
+            "linear_p95_ms": round(float(np.percentile(linear_times, 95)), 3),
+            "index_p50_ms": round(float(np.percentile(index_times, 50)), 3),
+            "index_p95_ms": round(float(np.percentile(index_times, 95)), 3),
+            "avg_candidates": round(float(np.mean(candidates)), 1),
+            "mismatches": mismatches,
+        }
+        logging.info(f"⏱ {row}")
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Intent matching latency: linear scan vs trigram index.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2000, 5000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    df = run_benchmark(args.sizes, args.queries)
+    print(df.to_string(index=False))
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    Path("simulation/result").mkdir(parents=True, exist_ok=True)
+    out = f"simulation/result/benchmark_intent_index-{timestamp}.csv"
+    df.to_csv(out, index=False)
+    logging.info(f"✅ Benchmark saved to {out}")
@@ -0,0 +1,121 @@
+# simulation/benchmark_multihead.py
+# =================================
+## python -m simulation.benchmark_multihead
+## python -m simulation.benchmark_multihead --csv data/train_model.csv --batch 1 32 1000
+## python -m simulation.benchmark_multihead --synthetic 5000 --repeats 20
+#
+# Two separate TF-IDF + LogisticRegression pipelines (sentiment, priority)
+# vs the fused MultiHeadClassifier (services/ml.py): one shared vectorizer,
+# one transform per call. Both are trained on the same split; reports
+# per-call latency for each batch size and how often the two paths agree.
+
+import argparse
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from services.ml import MultiHeadClassifier
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+SUBJECTS = ["laptop", "vpn", "printer", "email", "password", "wifi", "shared drive", "monitor", "outlook", "licence"]
+PROBLEMS = {
+    ("negative", "High"): ["is completely down and I cannot work", "crashed again before the deadline",
+                           "stopped working, this is urgent"],
+    ("neutral", "Medium"): ["is slower than usual", "asks me to update", "shows a warning sometimes"],
+    ("positive", "Low"): ["works now, thanks a lot", "was fixed quickly, great job", "question, no rush"],
+}
+
+
+def synthetic_dataset(n, seed=42):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        (sentiment, priority), phrases = rng.choice(list(PROBLEMS.items()))
+        rows.append({"text": f"my {rng.choice(SUBJECTS)} {rng.choice(phrases)}",
+                     "sentiment": sentiment, "priority": priority})
+    return pd.DataFrame(rows)
+
+
+def load_dataset(csv_path, synthetic):
+    if csv_path and Path(csv_path).exists():
+        df = pd.read_csv(csv_path)
+        text_col = "text" if "text" in df.columns else "description"
+        return df.rename(columns={text_col: "text"})[["text", "sentiment", "priority"]].dropna()
+    logging.info(f"ℹ️ No CSV found, using {synthetic} synthetic tickets")
+    return synthetic_dataset(synthetic)
+
+
+def time_call(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times)), float(np.percentile(times, 95))
+
+
+def run_benchmark(df, batch_sizes, repeats):
+    train, test = train_test_split(df, test_size=0.2, random_state=42)
+    separate = {
+        label: make_pipeline(TfidfVectorizer(), LogisticRegression(max_iter=1000)).fit(train["text"], train[label])
+        for label in ("sentiment", "priority")
+    }
+    fused = MultiHeadClassifier().fit(train["text"], {"sentiment": train["sentiment"], "priority": train["priority"]})
+
+    texts = test["text"].tolist()
+    sep_pred = {label: model.predict(texts) for label, model in separate.items()}
+    fused_pred = fused.predict_all(texts)
+    agreement = {label: float(np.mean(sep_pred[label] == fused_pred[label])) for label in separate}
+    accuracy = {label: (float(np.mean(sep_pred[label] == test[label])), float(np.mean(fused_pred[label] == test[label])))
+                for label in separate}
+    logging.info(f"🎯 accuracy (separate, fused)={accuracy} agreement={agreement}")
+
+    rows = []
+    for batch in batch_sizes:
+        sample = (texts * (batch // max(1, len(texts)) + 1))[:batch]
+        paths = {
+            "two_pipelines": lambda: [model.predict(sample) for model in separate.values()],
+            "fused": lambda: fused.predict_all(sample),
+        }
+        for mode, call in paths.items():
+            call()      # warm-up
+            p50, p95 = time_call(call, repeats)
+            row = {"mode": mode, "batch": batch, "p50_ms": round(p50, 3), "p95_ms": round(p95, 3),
+                   "per_text_us": round(p50 * 1000 / batch, 2),
+                   "sentiment_agreement": agreement["sentiment"], "priority_agreement": agreement["priority"]}
+            logging.info(f"⏱ {row}")
+            rows.append(row)
+    result = pd.DataFrame(rows)
+    result["train_rows"], result["test_rows"] = len(train), len(test)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Two TF-IDF pipelines vs one shared-vectorizer multi-head model.")
+    parser.add_argument("--csv", default="data/train_model.csv")
+    parser.add_argument("--synthetic", type=int, default=5000, help="Rows to generate when --csv is missing")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 32, 1000])
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+
+    df = run_benchmark(load_dataset(args.csv, args.synthetic), args.batch, args.repeats)
+    print(df.to_string(index=False))
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    Path("simulation/result").mkdir(parents=True, exist_ok=True)
+    out = f"simulation/result/benchmark_multihead-{timestamp}.csv"
+    df.to_csv(out, index=False)
+    logging.info(f"✅ Benchmark saved to {out}")
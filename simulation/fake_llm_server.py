@@ -0,0 +1,156 @@
+# simulation/fake_llm_server.py
+# =============================
+## python -m simulation.fake_llm_server --port 8765 --latency-ms 800 --jitter-ms 200
+## python -m simulation.fake_llm_server --error-rate 0.3 --slow-rate 0.1 --slow-ms 15000
+## LLM_BACKEND_URL=http://localhost:8765 streamlit run Home.py
+#
+# Local stand-in for the LLM API with latency and error injection, to exercise
+# services/llm_guard.py (deadline, hedging, circuit breaker) without Gemini.
+#
+#   POST /generate {"prompt": "...", "stream": false}  -> {"text": "..."}
+#   POST /generate {"prompt": "...", "stream": true}   -> one JSON line per chunk
+#   POST /config   {"error_rate": 1.0, ...}            -> change injection at runtime
+#   GET  /stats                                        -> request / error counters
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+DEFAULT_CONFIG = {
+    "latency_ms": 500,        # base latency before the first chunk
+    "jitter_ms": 100,         # uniform +/- jitter
+    "error_rate": 0.0,        # share of requests answered with HTTP 503
+    "slow_rate": 0.0,         # share of requests delayed by slow_ms (tail latency)
+    "slow_ms": 10000,
+    "chunk_delay_ms": 30,     # delay between streamed chunks
+    "seed": None,
+}
+
+
+class FakeLLMState:
+    def __init__(self, **config):
+        self.config = {**DEFAULT_CONFIG, **{k: v for k, v in config.items() if v is not None}}
+        self.random = random.Random(self.config["seed"])
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "slow": 0}
+
+    def plan(self):
+        """Decide (delay_seconds, fail) for one request."""
+        with self.lock:
+            c = self.config
+            self.stats["requests"] += 1
+            if self.random.random() < c["error_rate"]:
+                self.stats["errors"] += 1
+                return c["latency_ms"] / 1000 / 4, True
+            delay = c["latency_ms"] + self.random.uniform(-c["jitter_ms"], c["jitter_ms"])
+            if self.random.random() < c["slow_rate"]:
+                self.stats["slow"] += 1
+                delay += c["slow_ms"]
+            return max(delay, 0) / 1000, False
+
+
+def make_handler(state: FakeLLMState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            logging.debug(fmt % args)
+
+        def _json(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with state.lock:
+                    return self._json(200, {**state.stats, "config": state.config})
+            self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            payload = self._read_json()
+            if self.path == "/config":
+                with state.lock:
+                    state.config.update(payload)
+                return self._json(200, state.config)
+            if self.path != "/generate":
+                return self._json(404, {"error": "not found"})
+
+            delay, fail = state.plan()
+            time.sleep(delay)
+            if fail:
+                return self._json(503, {"error": "injected failure"})
+
+            prompt = str(payload.get("prompt", ""))
+            question = prompt.rsplit("USER:", 1)[-1].split("\n")[0].strip() or prompt[:60]
+            text = f"[fake-llm] Here is some help with: {question}"
+            if not payload.get("stream"):
+                return self._json(200, {"text": text})
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for word in text.split(" "):
+                self.wfile.write((json.dumps({"text": word + " "}) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(state.config["chunk_delay_ms"] / 1000)
+            self.close_connection = True
+
+    return Handler
+
+
+def make_server(host="127.0.0.1", port=0, **config):
+    """Build the server (port=0 picks a free port); see server.server_address."""
+    state = FakeLLMState(**config)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def serve_in_thread(**kwargs):
+    """Start a server on a background thread; returns (server, base_url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake LLM server with latency/error injection.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_CONFIG["latency_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=DEFAULT_CONFIG["jitter_ms"])
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_CONFIG["error_rate"])
+    parser.add_argument("--slow-rate", type=float, default=DEFAULT_CONFIG["slow_rate"])
+    parser.add_argument("--slow-ms", type=float, default=DEFAULT_CONFIG["slow_ms"])
+    parser.add_argument("--chunk-delay-ms", type=float, default=DEFAULT_CONFIG["chunk_delay_ms"])
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                         error_rate=args.error_rate, slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+                         chunk_delay_ms=args.chunk_delay_ms, seed=args.seed)
+    logging.info(f"🚀 Fake LLM listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -16,6 +16,8 @@ from pathlib import Path
 # ==== CONFIG MONGO ====
 from services.mongo import db
 from services.monitoring import log_execution
+from services.event_sink import event_sink
+from services.vector_index import VectorIndex, ANN_MIN_ENTRIES
 
 # ==== CONFIG LOGGING ====
 logging.basicConfig(
@@ -31,7 +33,7 @@ default_chat = db["default_chat"]
 knowledge = db["knowledge"]
 
 def log_event(event_type, details, status="success", log_source="simulation"):
-    monitoring_col.insert_one({
+    event_sink.emit(monitoring_col, {
         "event": event_type,
         "details": details,
         "status": status,
@@ -48,23 +50,29 @@ def load_test_queries(file_path):
         return [line.strip() for line in f if line.strip()]
 
 
-def get_bert_best_match(query, kb_entries):
-    from pages.Chatbot import get_bert_embeddings
-    query_emb = get_bert_embeddings(query)
-    best_score = -1
-    best_answer = "No match found."
-    for entry in kb_entries:
-        entry_text = f"{entry.get('question', '')} {entry.get('answer', '')}"
-        entry_emb = get_bert_embeddings(entry_text)
-        score = torch.cosine_similarity(
-            torch.tensor(query_emb), 
-            torch.tensor(entry_emb), 
-            dim=0
-        ).item()
-        if score > best_score:
-            best_score = score
-            best_answer = entry.get("answer", "No answer available.")
-    return best_answer, best_score
+def build_kb_index(kb_entries):
+    """Embed every KB entry once per run (and across runs via services.embedding_cache)."""
+    from services.embeddings import get_bert_embeddings
+    texts = [f"{entry.get('question', '')} {entry.get('answer', '')}" for entry in kb_entries]
+    keys = [str(pos) for pos in range(len(kb_entries))]
+    payloads = [{"answer": entry.get("answer", "No answer available.")} for entry in kb_entries]
+
+    kb_index = VectorIndex()
+    if keys:
+        kb_index.add(keys, get_bert_embeddings(texts), payloads)
+    if len(kb_index) >= ANN_MIN_ENTRIES:
+        kb_index.build_ann()
+    return kb_index
+
+
+def get_bert_best_match(query, kb_entries, kb_index=None):
+    from services.embeddings import get_bert_embeddings
+    if kb_index is None:
+        kb_index = build_kb_index(kb_entries)
+    hits = kb_index.search(get_bert_embeddings(query), k=1)
+    if not hits:
+        return "No match found.", -1
+    return hits[0]["answer"], hits[0]["score"]
 
 
 def simulate_test(model_name, questions, execution_type="test"):
@@ -171,6 +179,9 @@ def run_tests(questions_file="data/questions.txt"):
             "question": doc.get("title", ""), 
             "answer": doc.get("content", "")})
 
+    logging.info(f"Embedding {len(kb_entries)} KB entries...")
+    kb_index = build_kb_index(kb_entries)
+
     results = []
 
     total_queries = len(TEST_QUERIES)
@@ -195,7 +206,7 @@ def run_tests(questions_file="data/questions.txt"):
 
         # --- BERT Test ---
         start_time = time.time()
-        bert_response, bert_score = get_bert_best_match(query, kb_entries)
+        bert_response, bert_score = get_bert_best_match(query, kb_entries, kb_index)
         bert_time = round(time.time() - start_time, 3)
 
         try:
@@ -292,4 +303,6 @@ if __name__ == "__main__":
     results.append(simulate_test("GPT2", test_questions, "test"))
 
     df_results = pd.DataFrame(results)
-    print(df_results)
\ No newline at end of file
+    print(df_results)
+    event_sink.flush()
+    logging.info(f"📝 Event sink: {event_sink.stats()}")
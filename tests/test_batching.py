@@ -0,0 +1,61 @@
+# tests/test_batching.py
+# =======================
+import threading
+
+import numpy as np
+import pytest
+import torch
+
+from services.batching import MicroBatcher
+
+
+def test_concurrent_requests_share_batches_and_get_their_own_row():
+    sizes = []
+
+    def batch_fn(items):
+        sizes.append(len(items))
+        return [x * 10 for x in items]
+
+    batcher = MicroBatcher("test", batch_fn, max_batch_size=8, max_wait_ms=50)
+    results = {}
+    barrier = threading.Barrier(16)
+
+    def user(i):
+        barrier.wait()
+        results[i] = batcher.submit(i).result(timeout=5)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {i: i * 10 for i in range(16)}
+    assert max(sizes) <= 8 and len(sizes) < 16
+    assert batcher.stats()["requests"] == 16
+    batcher.close()
+
+
+def test_batch_error_reaches_every_caller():
+    batcher = MicroBatcher("boom", lambda items: 1 / 0, max_wait_ms=1)
+    with pytest.raises(ZeroDivisionError):
+        batcher.submit("x").result(timeout=5)
+    assert batcher.stats()["errors"] >= 1
+    batcher.close()
+
+
+def test_masked_mean_pool_matches_unpadded_embedding():
+    from transformers import BertConfig, BertModel
+    from services.embeddings import mean_pool
+    torch.manual_seed(0)
+    model = BertModel(BertConfig(num_hidden_layers=1, hidden_size=32, num_attention_heads=2,
+                                 intermediate_size=64, vocab_size=50)).eval()
+    short, long = torch.tensor([[1, 5, 7, 2]]), torch.tensor([[1, 9, 8, 7, 6, 5, 2]])
+    padded = torch.zeros((2, 7), dtype=torch.long)
+    padded[0, :4], padded[1] = short[0], long[0]
+    mask = (torch.arange(7) < torch.tensor([[4], [7]])).long()
+
+    with torch.no_grad():
+        alone = model(short).last_hidden_state.mean(dim=1)
+        batched = mean_pool(model(padded, attention_mask=mask).last_hidden_state, mask)
+    assert np.allclose(alone[0].numpy(), batched[0].numpy(), atol=1e-5)
@@ -0,0 +1,134 @@
+# tests/test_caching.py
+# =====================
+## pytest -v tests/test_caching.py
+
+from unittest.mock import MagicMock
+
+import numpy as np
+
+import services.prompt_context as prompt_context
+from services.answer_cache import AnswerCache, normalize_question
+from services.semantic_cache import SemanticCache
+from services.content_version import bump_version, get_versions
+import services.answer_cache as answer_cache_module
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# ==== services/answer_cache.py ====
+def test_normalize_question():
+    assert normalize_question("  Reset   PASSWORD?! ") == "reset password"
+    assert normalize_question("Não consigo acessar a VPN") == "nao consigo acessar a vpn"
+
+
+def test_answer_cache_lru_ttl_and_stats():
+    clock = FakeClock()
+    cache = AnswerCache(max_size=2, ttl=10, clock=clock)
+    cache.put("reset password", "Use the portal", "faq")
+    cache.put("vpn not connecting", "Restart the client", "kb")
+
+    assert cache.get("Reset password?") == ("Use the portal", "faq")
+    cache.put("printer jam", "Open the tray", "kb")   # evicts the LRU entry (vpn)
+    assert cache.get("vpn not connecting") is None
+    assert cache.get("printer jam") == ("Open the tray", "kb")
+
+    clock.now = 11
+    assert cache.get("reset password") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["evictions"] == 1 and stats["expirations"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_answer_cache_invalidated_on_content_edit():
+    cache = answer_cache_module.answer_cache
+    cache.put("reset password", "Use the portal", "faq")
+    assert cache.get("reset password") is not None
+
+    bump_version("knowledge", "update", {"_id": 1, "title": "t", "content": "c"})
+    assert len(cache) == 0
+    assert cache.get("reset password") is None
+
+
+
+def test_answer_computed_before_a_content_edit_is_not_cached():
+    cache = AnswerCache()
+    versions = get_versions()                  # lookup starts
+    bump_version("faq", "update", {"_id": 1, "question": "q", "answer": "new"})
+    cache.put("reset password", "old answer", "faq", versions=versions)
+    assert cache.get("reset password") is None and cache.stats()["stale_puts"] == 1
+
+    cache.put("reset password", "new answer", "faq", versions=get_versions())
+    assert cache.get("reset password") == ("new answer", "faq")
+
+# ==== services/semantic_cache.py ====
+def fake_embed(texts):
+    """Deterministic 'embedding': letter histogram, so rephrasings stay close."""
+    vecs = np.zeros((len(texts), 26), dtype=np.float32)
+    for i, t in enumerate(texts):
+        for c in t.lower():
+            if "a" <= c <= "z":
+                vecs[i, ord(c) - 97] += 1
+    return vecs
+
+
+def test_semantic_cache_threshold_and_eviction():
+    clock = FakeClock()
+    cache = SemanticCache(embed_fn=fake_embed, threshold=0.95, max_size=2, ttl=100, clock=clock)
+    cache.store("how do I reset my password", "Use the portal")
+    cache.store("printer is jammed", "Open the tray")
+
+    hit = cache.lookup("how do i reset my password?")
+    assert hit["answer"] == "Use the portal" and hit["score"] >= 0.95
+    assert cache.lookup("quantum physics lecture") is None
+
+    cache.store("vpn keeps disconnecting", "Reinstall the client")   # evicts the printer entry (LRU)
+    assert len(cache) == 2
+    assert cache.lookup("printer is jammed") is None
+
+    clock.now = 101
+    assert cache.lookup("how do I reset my password") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_semantic_cache_purge_on_thumbs_down():
+    cache = SemanticCache(embed_fn=fake_embed, threshold=0.95)
+    cache.store("reset my password", "Wrong answer")
+    cache.store("password reset please", "Wrong answer")
+    cache.store("vpn down", "Reinstall the client")
+
+    assert cache.purge("reset my password", "Wrong answer") == 2
+    assert cache.lookup("reset my password") is None
+    assert cache.lookup("vpn down")["answer"] == "Reinstall the client"
+
+
+# ==== services/prompt_context.py ====
+def test_prompt_context_cached_until_content_changes():
+    prompt_context.invalidate_prompt_context()
+    faq_col, dc_col, kb_col = MagicMock(), MagicMock(), MagicMock()
+    faq_col.find.return_value.limit.return_value = [{"question": "Reset?", "answer": "Portal"}]
+    dc_col.find_one.return_value = {"intents": [{"tag": "greet", "patterns": ["hi"], "responses": ["hello"]}]}
+    kb_col.find.return_value.limit.return_value = [{"title": "VPN", "content": "Install client"}]
+
+    first = prompt_context.get_prompt_context(faq_col, dc_col, kb_col)
+    assert "Q: Reset?\nA: Portal" in first.text
+    assert "[Intent: greet]" in first.text and "Title: VPN" in first.text
+    assert prompt_context.get_prompt_context(faq_col, dc_col, kb_col) is first
+    assert faq_col.find.call_count == 1
+
+    bump_version("faq", "update", {"_id": 1, "question": "Reset?", "answer": "Portal"})
+    second = prompt_context.get_prompt_context(faq_col, dc_col, kb_col)
+    assert second is not first and second.version != first.version
+    assert faq_col.find.call_count == 2
+
+    prompt = prompt_context.render_prompt(second.text, "my vpn is down")
+    assert prompt.startswith("You are a support assistant")
+    assert prompt.endswith("USER: my vpn is down\nRespond professionally and clearly based on the context above.")
+    prompt_context.invalidate_prompt_context()
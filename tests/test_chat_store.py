@@ -0,0 +1,155 @@
+# tests/test_chat_store.py
+# =======================
+from unittest.mock import MagicMock
+
+import mongomock
+
+from services import chat_store
+
+
+def make_cols():
+    database = mongomock.MongoClient()["test_db"]
+    return database["chats"], database["chat_buckets"]
+
+
+def test_append_fills_fixed_size_buckets():
+    chats, buckets = make_cols()
+    opened = [
+        chat_store.append_message("s1", {"message_id": f"m{i}", "question": f"q{i}"}, user_id="u@x.com",
+                                  chats_col=chats, buckets_col=buckets, bucket_size=3)
+        for i in range(7)
+    ]
+    assert opened == [True, False, False, True, False, False, True]
+
+    header = chats.find_one({"session_id": "s1"})
+    assert header["bucket_count"] == 3 and header["user_id"] == "u@x.com" and "messages" not in header
+    docs = list(buckets.find({"session_id": "s1"}).sort(chat_store.BUCKET_ORDER))
+    assert [b["count"] for b in docs] == [3, 3, 1] and docs[0]["user_id"] == "u@x.com"
+
+
+def test_append_is_a_single_write_unless_it_opens_a_bucket():
+    chats, buckets = make_cols()
+    chats_spy, buckets_spy = MagicMock(wraps=chats), MagicMock(wraps=buckets)
+    for i in range(4):
+        chat_store.append_message("s1", {"message_id": f"m{i}"}, chats_col=chats_spy, buckets_col=buckets_spy,
+                                  bucket_size=2)
+    assert buckets_spy.update_one.call_count == 4
+    assert chats_spy.update_one.call_count == 2      # buckets opened by m0 and m2
+    assert [c[0] for c in buckets_spy.method_calls] == ["update_one"] * 4
+
+
+def test_load_messages_reads_only_the_last_buckets():
+    chats, buckets = make_cols()
+    for i in range(5):
+        chat_store.append_message("s1", {"message_id": f"m{i}"}, chats_col=chats, buckets_col=buckets, bucket_size=2)
+
+    every = chat_store.load_messages("s1", chats_col=chats, buckets_col=buckets)
+    assert [m["message_id"] for m in every] == ["m0", "m1", "m2", "m3", "m4"]
+    recent = chat_store.load_messages("s1", last_buckets=2, chats_col=chats, buckets_col=buckets)
+    assert [m["message_id"] for m in recent] == ["m2", "m3", "m4"]
+
+
+def test_legacy_sessions_are_read_and_migrated():
+    chats, buckets = make_cols()
+    chats.insert_one({"session_id": "old", "user_id": "u", "messages": [
+        {"message_id": "a", "question": "hi"}, {"question": "no id"}]})
+    # a message appended after the deploy, before the migration ran
+    chat_store.append_message("old", {"message_id": "c", "question": "new"}, chats_col=chats, buckets_col=buckets)
+
+    before = chat_store.load_messages("old", chats_col=chats, buckets_col=buckets)
+    assert [m["question"] for m in before] == ["hi", "no id", "new"]
+    assert chat_store.update_message("old", "a", {"answer": "hello"}, chats_col=chats, buckets_col=buckets)
+
+    stats = chat_store.migrate_to_buckets(chats, buckets, bucket_size=2)
+    assert stats == {"sessions": 1, "messages": 2}
+    assert "messages" not in chats.find_one({"session_id": "old"})
+    after = chat_store.load_messages("old", chats_col=chats, buckets_col=buckets)
+    assert [m["question"] for m in after] == ["hi", "no id", "new"]
+    assert after[0]["answer"] == "hello" and after[1]["message_id"] == "old:1"
+
+    # re-running is a no-op and new appends come after the migrated messages
+    assert chat_store.migrate_to_buckets(chats, buckets, bucket_size=2)["sessions"] == 0
+    chat_store.append_message("old", {"message_id": "d"}, chats_col=chats, buckets_col=buckets, bucket_size=2)
+    after = chat_store.load_messages("old", chats_col=chats, buckets_col=buckets)
+    assert [m["message_id"] for m in after] == ["a", "old:1", "c", "d"]
+
+
+def test_migration_keeps_writes_that_land_while_it_runs():
+    chats, buckets = make_cols()
+    chats.insert_one({"session_id": "old", "messages": [{"message_id": "a", "question": "hi"}]})
+    chat_store.append_message("old", {"message_id": "b", "question": "before"}, chats_col=chats, buckets_col=buckets)
+    stale = chats.find_one({"session_id": "old"})
+
+    # the app keeps writing after the migration read the header
+    chat_store.append_message("old", {"message_id": "c", "question": "during"}, chats_col=chats, buckets_col=buckets)
+    assert chat_store.update_message("old", "a", {"answer": "edited"}, chats_col=chats, buckets_col=buckets)
+    assert chat_store.migrate_session(stale, chats, buckets, bucket_size=2) == 1
+
+    after = chat_store.load_messages("old", chats_col=chats, buckets_col=buckets)
+    assert [m["message_id"] for m in after] == ["a", "b", "c"] and after[0]["answer"] == "edited"
+    assert chats.find_one({"session_id": "old"})["bucket_count"] == 2
+    # edits of migrated messages reach the sealed bucket; appends skip it
+    assert chat_store.update_message("old", "a", {"answer": "again"}, chats_col=chats, buckets_col=buckets)
+    chat_store.append_message("old", {"message_id": "d"}, chats_col=chats, buckets_col=buckets, bucket_size=2)
+    after = chat_store.load_messages("old", chats_col=chats, buckets_col=buckets)
+    assert [m["message_id"] for m in after] == ["a", "b", "c", "d"] and after[0]["answer"] == "again"
+
+
+def test_messages_for_sessions_and_search():
+    chats, buckets = make_cols()
+    chats.insert_one({"session_id": "old", "messages": [{"question": "printer jam"}]})
+    chat_store.append_message("s1", {"message_id": "m", "question": "vpn down"}, chats_col=chats, buckets_col=buckets)
+
+    headers = list(chats.find())
+    messages = chat_store.messages_for_sessions(headers, buckets_col=buckets)
+    assert messages["old"][0]["question"] == "printer jam"
+    assert messages["s1"][0]["question"] == "vpn down"
+    assert chat_store.sessions_matching("VPN", buckets_col=buckets) == ["s1"]
+    first = chat_store.first_messages(["s1", "none"], buckets_col=buckets)
+    assert first["s1"][0]["question"] == "vpn down" and first["none"] == []
+
+
+def test_bulk_update_routes_legacy_messages_to_chats():
+    chats, buckets = MagicMock(), MagicMock()
+    chats.bulk_write.return_value.modified_count = 1
+    buckets.bulk_write.return_value.modified_count = 2
+
+    modified = chat_store.bulk_update_messages([
+        ("s1", "m1", {"thumbs_up": True}),
+        ("s1", "m2", {"answer": "edited"}),
+        ("old", "a", {"thumbs_down": True}),
+        ("s1", "m3", {}),
+    ], legacy_messages={("old", "a")}, chats_col=chats, buckets_col=buckets)
+
+    assert modified == 3
+    assert len(buckets.bulk_write.call_args.args[0]) == 2
+    legacy = chats.bulk_write.call_args.args[0]
+    assert legacy[0]._filter == {"session_id": "old", "messages.message_id": "a"}
+    assert legacy[0]._doc == {"$set": {"messages.$.thumbs_down": True}}
+
+
+def apply_bulk_writes(collection):
+    # mongomock's bulk_write doesn't accept current pymongo UpdateOne; replay as update_one
+    def bulk_write(requests, ordered=True):
+        modified = sum(collection.update_one(r._filter, r._doc).modified_count for r in requests)
+        return MagicMock(modified_count=modified)
+    collection.bulk_write = bulk_write
+
+
+def test_bulk_update_mixed_session():
+    # legacy array plus messages appended to buckets after the split
+    chats, buckets = make_cols()
+    apply_bulk_writes(chats)
+    apply_bulk_writes(buckets)
+    chats.insert_one({"session_id": "old", "messages": [{"message_id": "a", "question": "hi"}]})
+    chat_store.append_message("old", {"message_id": "c", "question": "new"}, chats_col=chats, buckets_col=buckets)
+    headers = list(chats.find({"session_id": "old"}))
+
+    modified = chat_store.bulk_update_messages([
+        ("old", "a", {"thumbs_up": True}),
+        ("old", "c", {"answer": "edited"}),
+    ], chat_store.legacy_message_keys(headers), chats_col=chats, buckets_col=buckets)
+
+    assert modified == 2
+    messages = {m["message_id"]: m for m in chat_store.load_messages("old", chats_col=chats, buckets_col=buckets)}
+    assert messages["a"]["thumbs_up"] is True and messages["c"]["answer"] == "edited"
@@ -3,7 +3,9 @@
 
 ## pytest -v --maxfail=1 --disable-warnings
 
+import mongomock
 import pytest
+import time
 import types
 import numpy as np
 import torch
@@ -11,6 +13,9 @@ from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
 
 import pages.Chatbot as chatbot
+from services.content_version import bump_version
+from services.hybrid_retrieval import RetrievalResult
+from services.llm_guard import CircuitBreaker, LLMGuard
 
 
 @pytest.fixture
@@ -19,12 +24,16 @@ def mock_db(monkeypatch):
     fake_coll = MagicMock()
     monkeypatch.setattr(chatbot, "users", fake_coll)
     monkeypatch.setattr(chatbot, "chats", fake_coll)
+    monkeypatch.setattr(chatbot, "chat_buckets", fake_coll)
     monkeypatch.setattr(chatbot, "faq", fake_coll)
     monkeypatch.setattr(chatbot, "knowledge", fake_coll)
     monkeypatch.setattr(chatbot, "unanswered", fake_coll)
     monkeypatch.setattr(chatbot, "default_chat", fake_coll)
     monkeypatch.setattr(chatbot, "monitoring_col", fake_coll)
     monkeypatch.setattr(chatbot.db, "feedback", fake_coll)
+    # write monitoring events synchronously so tests can inspect insert_one calls
+    monkeypatch.setattr(chatbot.event_sink, "enabled", False)
+    chatbot.answer_cache.clear()
     return fake_coll
 
 
@@ -100,27 +109,6 @@ def test_generate_gpt2_reply_mock(monkeypatch):
     assert reply == "Hello"
 
 
-
-def test_predict_sentiment_with_text(monkeypatch):
-    monkeypatch.setattr(chatbot, "predict_sentiment", lambda x: ["Positive"])
-    result = chatbot.predict_sentiment_with_text("ok")
-    assert result == "Positive"
-
-    # Test fallback
-    monkeypatch.setattr(chatbot, "predict_sentiment", lambda x: 1 / 0)
-    assert chatbot.predict_sentiment_with_text("fail") == "unknown"
-
-
-def test_predict_priority_with_text(monkeypatch):
-    monkeypatch.setattr(chatbot, "predict_priority", lambda x: ["High"])
-    result = chatbot.predict_priority_with_text("ok")
-    assert result == "High"
-
-    # Fallback
-    monkeypatch.setattr(chatbot, "predict_priority", lambda x: 1 / 0)
-    assert chatbot.predict_priority_with_text("fail") == "Low"
-
-
 def test_find_default_answer(monkeypatch, mock_db):
     mock_db.find_one.return_value = {"intents": [
         {"patterns": ["hello"], "responses": ["hi"], "tag": "greet"}
@@ -131,21 +119,119 @@ def test_find_default_answer(monkeypatch, mock_db):
     assert tag == "greet"
 
 
-def test_find_known_answer(monkeypatch, mock_db):
-    mock_db.find_one.return_value = {"answer": "42"}
-    assert chatbot.find_known_answer("question") == "42"
-
-    mock_db.find_one.return_value = None
-    mock_db.find.return_value.limit.return_value = [
-        {"question": "answer me", "answer": "yes"}
+def test_retrieve_answer_finds_faq_and_knowledge(mock_db, monkeypatch):
+    monkeypatch.setattr(chatbot, "get_knowledge_index", MagicMock(side_effect=RuntimeError("no embedder")))
+    mock_db.find.return_value = [
+        {"_id": 1, "question": "reset my password", "answer": "Use the portal"},
+        {"_id": 2, "title": "Help desk", "content": "help desk opening hours"},
     ]
-    monkeypatch.setattr(chatbot, "SequenceMatcher", lambda *a, **k: types.SimpleNamespace(ratio=lambda: 0.8))
-    assert chatbot.find_known_answer("answer me") == "yes"
 
+    faq_hit = chatbot.retrieve_answer("reset password")
+    assert (faq_hit.answer, faq_hit.kind, faq_hit.retriever) == ("Use the portal", "faq", "lexical")
+    kb_hit = chatbot.retrieve_answer("help desk hours")
+    assert (kb_hit.answer, kb_hit.kind) == ("help desk opening hours", "kb")
+    assert chatbot.retrieve_answer("quantum chromodynamics").answer is None
+
+
+def test_generate_bot_response_uses_hybrid_retrieval(mock_db, monkeypatch):
+    monkeypatch.setattr(chatbot, "find_default_answer", lambda q: (None, None))
+    monkeypatch.setattr(chatbot, "get_knowledge_index", lambda *a: None)
+    mock_db.find.return_value = [{"_id": 7, "title": "VPN", "content": "Install the vpn client"}]
+
+    answer, source = chatbot.generate_bot_response("vpn client")
+    assert (answer, source) == ("Install the vpn client", "kb")
+    details = mock_db.insert_one.call_args[0][0]["details"]
+    assert details["retriever"] == "lexical" and details["confidence"] > 0
+
+    monkeypatch.setattr(chatbot, "retrieve_answer", MagicMock(side_effect=AssertionError))
+    assert chatbot.generate_bot_response("VPN client?") == ("Install the vpn client", "kb")
+    assert mock_db.insert_one.call_args[0][0]["details"]["cache_hit"] is True
+
+
+def test_stream_ai_reply_yields_chunks_and_records_ttft(mock_db, monkeypatch):
+    monkeypatch.setattr(chatbot, "llm_guard", LLMGuard(CircuitBreaker("test")))
+    monkeypatch.setattr(chatbot.semantic_cache, "embed", lambda q: None)
+    monkeypatch.setattr(chatbot, "build_ai_prompt", lambda q, hits=None: ("PROMPT", {"prompt_tokens": 3}))
+    chunks = [types.SimpleNamespace(text="Restart "), types.SimpleNamespace(text="the router.")]
+    fake_model = MagicMock()
+    fake_model.start_chat.return_value.send_message.return_value = iter(chunks)
+    monkeypatch.setattr(chatbot, "model", fake_model)
+
+    assert list(chatbot.stream_ai_reply("wifi down")) == ["Restart ", "the router."]
+    fake_model.start_chat.return_value.send_message.assert_called_once_with("PROMPT", stream=True)
+    details = mock_db.insert_one.call_args[0][0]["details"]
+    assert details["prompt_tokens"] == 3 and details["ttft_ms"] is not None
+    assert chatbot.answer_cache.get("wifi down") == ("Restart the router.", "ai")
+
+
+
+def fake_streaming_llm(monkeypatch, chunks):
+    monkeypatch.setattr(chatbot, "llm_guard", LLMGuard(CircuitBreaker("test")))
+    monkeypatch.setattr(chatbot.semantic_cache, "embed", lambda q: None)
+    monkeypatch.setattr(chatbot, "build_ai_prompt", lambda q, hits=None: ("PROMPT", {}))
+    monkeypatch.setattr(chatbot, "get_bm25_index", lambda *a: MagicMock(search=lambda q, k: []))
+    fake_model = MagicMock()
+    fake_model.start_chat.return_value.send_message.side_effect = \
+        lambda *a, **k: iter([types.SimpleNamespace(text=c) for c in chunks])
+    monkeypatch.setattr(chatbot, "model", fake_model)
+
+
+def test_discarded_speculative_answer_is_not_cached(mock_db, monkeypatch):
+    fake_streaming_llm(monkeypatch, ["Restart ", "the router."])
+    monkeypatch.setattr(chatbot, "SPECULATIVE_AI", True)
+
+    def slow_intent(q):
+        time.sleep(0.2)          # the speculative call completes first
+        return "Hello!", "greeting"
+
+    monkeypatch.setattr(chatbot, "find_default_answer", slow_intent)
+    assert chatbot.generate_bot_response("hello there") == ("Hello!", "greeting")
+    assert chatbot.answer_cache.get("hello there") is None
+
+    monkeypatch.setattr(chatbot, "find_default_answer", lambda q: (None, None))
+    monkeypatch.setattr(chatbot, "retrieve_answer", lambda q: RetrievalResult())
+    assert chatbot.generate_bot_response("wifi down") == ("Restart the router.", "ai")
+    assert chatbot.answer_cache.get("wifi down") == ("Restart the router.", "ai")
 
-def test_find_knowledge_answer(mock_db):
-    mock_db.find_one.return_value = {"content": "info"}
-    assert chatbot.find_knowledge_answer("help") == "info"
+
+def test_ai_answer_not_cached_when_content_changes_meanwhile(mock_db, monkeypatch):
+    fake_streaming_llm(monkeypatch, ["Old ", "policy."])
+    monkeypatch.setattr(chatbot, "find_default_answer", lambda q: (None, None))
+    monkeypatch.setattr(chatbot, "retrieve_answer", lambda q: RetrievalResult())
+    real_prompt = chatbot.build_ai_prompt
+
+    def prompt_then_edit(q, hits=None):
+        result = real_prompt(q, hits)
+        bump_version("knowledge", "update", {"_id": 9, "title": "", "content": ""})   # Dashboard edit
+        return result
+
+    monkeypatch.setattr(chatbot, "build_ai_prompt", prompt_then_edit)
+    assert chatbot.generate_bot_response("vpn policy") == ("Old policy.", "ai")
+    assert chatbot.answer_cache.get("vpn policy") is None
+
+def test_stream_ai_reply_falls_back_to_gpt2(mock_db, monkeypatch):
+    monkeypatch.setattr(chatbot, "llm_guard", LLMGuard(CircuitBreaker("test")))
+    monkeypatch.setattr(chatbot.semantic_cache, "embed", lambda q: None)
+    monkeypatch.setattr(chatbot, "build_ai_prompt", lambda q, hits=None: ("PROMPT", {}))
+    monkeypatch.setattr(chatbot, "model", None)
+    monkeypatch.setattr(chatbot, "stream_gpt2_reply", lambda prompt: iter(["gpt2 ", "reply"]))
+
+    assert chatbot.get_ai_reply("wifi down") == "gpt2 reply"
+    assert chatbot.answer_cache.get("wifi down") is None
+
+
+def test_stream_ai_reply_skips_llm_when_circuit_open(mock_db, monkeypatch):
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    breaker.record_failure()
+    monkeypatch.setattr(chatbot, "llm_guard", LLMGuard(breaker))
+    monkeypatch.setattr(chatbot.semantic_cache, "embed", lambda q: None)
+    monkeypatch.setattr(chatbot, "build_ai_prompt", lambda q, hits=None: ("PROMPT", {}))
+    fake_model = MagicMock()
+    monkeypatch.setattr(chatbot, "model", fake_model)
+    monkeypatch.setattr(chatbot, "stream_gpt2_reply", lambda prompt: iter(["local"]))
+
+    assert chatbot.get_ai_reply("wifi down") == "local"
+    fake_model.start_chat.assert_not_called()
 
 
 def test_log_event(mock_db):
@@ -161,6 +247,47 @@ def test_save_chat_message(mock_db, monkeypatch):
     assert isinstance(sid, str)
 
 
+
+@pytest.fixture
+def chat_page(mock_db, monkeypatch):
+    """Chat page state with real (mongomock) chats / chat_buckets collections."""
+    database = mongomock.MongoClient()["test_db"]
+    monkeypatch.setattr(chatbot, "chats", database["chats"])
+    monkeypatch.setattr(chatbot, "chat_buckets", database["chat_buckets"])
+    monkeypatch.setattr(chatbot, "enrichment_worker", MagicMock())
+    monkeypatch.setattr(chatbot, "STREAM_RESPONSES", False)
+    monkeypatch.setitem(chatbot.st.session_state, "session_id", "s1")
+    monkeypatch.setitem(chatbot.st.session_state, "user", {"email": "a@b.com"})
+    monkeypatch.setitem(chatbot.st.session_state, "chat_history", [
+        {"message_id": None, "question": "wifi down", "answer": None, "user_time": datetime.now(timezone.utc)}
+    ])
+    return database
+
+
+def test_batched_turn_is_one_append(chat_page, monkeypatch):
+    monkeypatch.setattr(chatbot, "generate_bot_response", lambda q, stream=False: ("Restart the router.", "ai"))
+    chatbot.answer_pending_turn(0, chatbot.st.session_state.chat_history[0])
+
+    messages = chatbot.load_messages("s1", chats_col=chat_page["chats"], buckets_col=chat_page["chat_buckets"])
+    assert [(m["question"], m["answer"], m["intent_tag"]) for m in messages] == [("wifi down", "Restart the router.", "ai")]
+    assert chatbot.st.session_state.chat_history[0]["message_id"] == messages[0]["message_id"]
+    chatbot.enrichment_worker.submit.assert_called_once_with("s1", messages[0]["message_id"], "wifi down")
+
+
+def test_batched_turn_saves_question_when_generation_fails(chat_page, monkeypatch):
+    monkeypatch.setattr(chatbot, "generate_bot_response", MagicMock(side_effect=RuntimeError("llm down")))
+    with pytest.raises(RuntimeError):
+        chatbot.answer_pending_turn(0, chatbot.st.session_state.chat_history[0])
+
+    messages = chatbot.load_messages("s1", chats_col=chat_page["chats"], buckets_col=chat_page["chat_buckets"])
+    assert [(m["question"], m["answer"]) for m in messages] == [("wifi down", None)]
+
+    # the retry on the next rerun fills in the saved question instead of appending again
+    monkeypatch.setattr(chatbot, "generate_bot_response", lambda q, stream=False: ("Restart the router.", "ai"))
+    chatbot.answer_pending_turn(0, chatbot.st.session_state.chat_history[0])
+    messages = chatbot.load_messages("s1", chats_col=chat_page["chats"], buckets_col=chat_page["chat_buckets"])
+    assert [(m["question"], m["answer"]) for m in messages] == [("wifi down", "Restart the router.")]
+
 def test_send_email_mock(monkeypatch):
     fake_smtp = MagicMock()
     fake_smtp.send = MagicMock()
@@ -179,6 +306,17 @@ def test_handle_feedback(monkeypatch, mock_db):
     chatbot.handle_feedback({"email": "a@b.com", "name": "Foo"}, "Q", "A", "TID", "Great!", liked=True)
 
 
+def test_handle_feedback_thumbs_down_purges_caches(monkeypatch, mock_db):
+    monkeypatch.setattr(chatbot, "send_email", lambda *a, **k: None)
+    purge = MagicMock(return_value=1)
+    monkeypatch.setattr(chatbot.semantic_cache, "purge", purge)
+    chatbot.answer_cache.put("Q", "A", "ai")
+
+    chatbot.handle_feedback({"email": "a@b.com", "name": "Foo"}, "Q", "A", "TID", "Bad", liked=False)
+    purge.assert_called_once_with("Q", "A")
+    assert chatbot.answer_cache.get("Q") is None
+
+
 def test_get_chat_topic():
     msgs = [{"intent_tag": "billing"}, {"intent_tag": "billing"}]
     assert chatbot.get_chat_topic(msgs) == "billing"
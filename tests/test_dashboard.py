@@ -13,6 +13,7 @@ def mock_db(monkeypatch):
     monkeypatch.setattr(dash, "faq", fake_coll)
     monkeypatch.setattr(dash, "knowledge", fake_coll)
     monkeypatch.setattr(dash, "chats", fake_coll)
+    monkeypatch.setattr(dash, "chat_buckets", fake_coll)
     monkeypatch.setattr(dash, "monitoring", fake_coll)
     return fake_coll
 
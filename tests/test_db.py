@@ -0,0 +1,111 @@
+# tests/test_db.py
+# =======================
+from unittest.mock import MagicMock
+
+import mongomock
+
+import services.db as db_services
+
+
+def test_ensure_indexes_is_idempotent_and_accepts_equivalent_indexes():
+    database = mongomock.MongoClient()["test_db"]
+    database["chats"].create_index("session_id")     # default name session_id_1
+
+    first = db_services.ensure_indexes(database)
+    assert "chats.user_id_start_time" in first["created"]
+    assert "chats.session_id" not in first["created"]
+    assert db_services.verify_indexes(database) == {}
+
+    second = db_services.ensure_indexes(database)
+    assert second["created"] == [] and second["failed"] == []
+
+
+
+def test_existing_text_and_hashed_indexes_do_not_break_verification():
+    database = mongomock.MongoClient()["test_db"]
+    database["knowledge"].create_index([("content", "text")])
+    database["chats"].create_index([("user_id", "hashed")])
+
+    report = db_services.ensure_indexes(database)
+    assert report["failed"] == [] and "chats.user_id_start_time" in report["created"]
+    assert db_services.verify_indexes(database) == {}
+
+def test_changed_ttl_is_reported_and_rebuilt_on_request():
+    database = mongomock.MongoClient()["test_db"]
+    db_services.ensure_indexes(database, db_services.declared_indexes(log_ttl_days=0))
+
+    with_ttl = db_services.declared_indexes(log_ttl_days=7)
+    assert db_services.verify_indexes(database, with_ttl) == {
+        "monitoring": {"missing": [], "conflicting": ["timestamp"]}}
+    assert db_services.ensure_indexes(database, with_ttl)["conflicting"] == ["monitoring.timestamp"]
+
+    assert db_services.ensure_indexes(database, with_ttl, rebuild=True)["rebuilt"] == ["monitoring.timestamp"]
+    assert database["monitoring"].index_information()["timestamp"]["expireAfterSeconds"] == 7 * 86400
+
+
+def test_explain_report_flags_collscan():
+    plans = {
+        "chats": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+        "monitoring": {"queryPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}},
+    }
+    database = MagicMock()
+    database.__getitem__.side_effect = lambda name: MagicMock(**{
+        "find.return_value.sort.return_value.explain.return_value": {"queryPlanner": {"winningPlan": plans[name]}},
+        "find.return_value.explain.return_value": {"queryPlanner": {"winningPlan": plans[name]}},
+    })
+    report = db_services.explain_hot_queries(database, [
+        ("chat by session", "chats", {"session_id": "x"}, None),
+        ("logs by source", "monitoring", {"log_source": "production"}, [("timestamp", -1)]),
+    ])
+    assert [r["collscan"] for r in report] == [False, True]
+    assert report[1]["stages"] == ["SORT", "COLLSCAN"]
+
+
+def test_save_chat_turn_creates_the_session_in_one_write(monkeypatch):
+    chat = mongomock.MongoClient()["test_db"]["chat"]
+    monkeypatch.setattr(db_services, "chats_col", chat)
+    db_services.save_chat_turn("s1", "vpn down?", "try reconnecting")
+    db_services.save_chat_message("s1", "user", "thanks")
+
+    doc = chat.find_one({"session_id": "s1"})
+    assert [m["role"] for m in doc["messages"]] == ["user", "assistant", "user"]
+    assert doc["messages"][1]["content"] == "try reconnecting" and "start_time" in doc
+    assert chat.count_documents({}) == 1
+
+
+def test_message_updates_touch_a_single_field(monkeypatch):
+    chat = mongomock.MongoClient()["test_db"]["chat"]
+    monkeypatch.setattr(db_services, "chats_col", chat)
+    db_services.save_chat_turn("s1", "vpn down?", "try reconnecting")
+    doc = chat.find_one({"session_id": "s1"})
+    chat_id, answer_id = str(doc["_id"]), doc["messages"][1]["message_id"]
+
+    assert db_services.update_chat_message(chat_id, 0, "vpn is down")
+    assert db_services.update_message_feedback(chat_id, answer_id, "👍")
+    assert not db_services.update_chat_message(chat_id, 5, "out of range")
+    assert not db_services.update_message_feedback(chat_id, "missing-id", "👎")
+
+    messages = chat.find_one({"session_id": "s1"})["messages"]
+    assert messages[0]["content"] == "vpn is down" and messages[0]["feedback"] == ""
+    assert messages[1]["feedback"] == "👍" and messages[1]["content"] == "try reconnecting"
+
+
+def test_bulk_update_chat_messages_sends_one_unordered_bulk_write(monkeypatch):
+    chat = MagicMock()
+    chat.bulk_write.return_value.modified_count = 2
+    monkeypatch.setattr(db_services, "chats_col", chat)
+    chat_id = "64b000000000000000000001"
+
+    modified = db_services.bulk_update_chat_messages([
+        {"chat_id": chat_id, "message": 0, "content": "edited"},
+        {"chat_id": chat_id, "message": "m-2", "feedback": "👎"},
+        {"chat_id": chat_id, "message": 3},      # nothing to change
+    ])
+    assert modified == 2
+    requests = chat.bulk_write.call_args.args[0]
+    assert chat.bulk_write.call_args.kwargs == {"ordered": False}
+    assert [r._doc for r in requests] == [
+        {"$set": {"messages.0.content": "edited"}},
+        {"$set": {"messages.$.feedback": "👎"}},
+    ]
+    assert requests[1]._filter["messages.message_id"] == "m-2"
@@ -0,0 +1,76 @@
+# tests/test_embedding_store.py
+# =======================
+import mongomock
+import numpy as np
+
+import services.embedding_store as store
+from services.enrichment import EnrichmentWorker
+
+
+def make_db():
+    return mongomock.MongoClient()["test_db"]
+
+
+def test_float16_roundtrip_is_a_zero_copy_view():
+    col = make_db()["message_embeddings"]
+    vec = np.random.default_rng(0).standard_normal(768).astype(np.float32)
+    store.save_embedding("m1", vec, session_id="s1", dtype="float16", collection=col)
+
+    doc = col.find_one({"_id": "m1"})
+    assert len(doc["vector"]) == 768 * 2
+    view = store.decode_vector(doc)
+    assert view.dtype == np.float16 and not view.flags.owndata
+    assert np.allclose(view, vec, atol=1e-2)
+
+
+def test_int8_roundtrip_keeps_cosine():
+    col = make_db()["message_embeddings"]
+    vec = np.random.default_rng(1).standard_normal(768).astype(np.float32)
+    store.save_embedding("m1", vec, dtype="int8", collection=col)
+    out = store.get_embedding("m1", collection=col)
+    assert out.dtype == np.float32
+    assert np.dot(out, vec) / (np.linalg.norm(out) * np.linalg.norm(vec)) > 0.999
+
+
+def test_load_matrix_and_batch_reader():
+    col = make_db()["message_embeddings"]
+    for i in range(3):
+        store.save_embedding(f"m{i}", np.full(4, i, dtype=np.float32), session_id="s1", collection=col)
+    store.save_embedding("other", np.ones(4), session_id="s2", collection=col)
+
+    ids, matrix = store.load_matrix({"session_id": "s1"}, collection=col)
+    assert sorted(ids) == ["m0", "m1", "m2"] and matrix.shape == (3, 4)
+    assert matrix[ids.index("m2")].tolist() == [2.0] * 4
+    assert set(store.get_embeddings(["m0", "missing"], collection=col)) == {"m0"}
+
+
+def test_migration_moves_vectors_out_of_chats():
+    db = make_db()
+    db["chats"].insert_one({"session_id": "s1", "messages": [
+        {"message_id": "a", "question": "q1", "bert_embedding": [0.5] * 8},
+        {"question": "q2", "bert_embedding": None},
+        {"message_id": "c", "question": "q3"},
+        {"question": "q4", "bert_embedding": [0.25] * 8},
+    ]})
+    stats = store.migrate_chat_embeddings(db["chats"], db["message_embeddings"], dtype="float16")
+    assert stats == {"sessions": 1, "embeddings": 2, "skipped": 1}
+
+    messages = db["chats"].find_one({"session_id": "s1"})["messages"]
+    assert all("bert_embedding" not in m for m in messages)
+    assert store.get_embedding("a", collection=db["message_embeddings"]).tolist() == [0.5] * 8
+    # a message without id gets the synthesized one, so its vector can be found
+    assert messages[3]["message_id"] == "s1:3" and "message_id" not in messages[1]
+    assert store.get_embedding("s1:3", collection=db["message_embeddings"]).tolist() == [0.25] * 8
+    assert store.migrate_chat_embeddings(db["chats"], db["message_embeddings"])["sessions"] == 0
+
+
+def test_enrichment_sink_writes_to_store_not_chat():
+    db = make_db()
+    db["chats"].insert_one({"session_id": "s1", "messages": [{"message_id": "m1", "question": "q"}]})
+    saved = {}
+    worker = EnrichmentWorker(db["chats"], {"bert_embedding": lambda texts: [[1.0, 2.0] for _ in texts]},
+                              sinks={"bert_embedding": lambda job, vec: saved.update({job.message_id: vec})})
+    worker.submit("s1", "m1", "q")
+    assert worker.flush(timeout=5)
+    assert saved == {"m1": [1.0, 2.0]}
+    assert "bert_embedding" not in db["chats"].find_one()["messages"][0]
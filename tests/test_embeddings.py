@@ -12,6 +12,8 @@ from unittest.mock import patch, MagicMock
 from datetime import datetime, timezone
 
 import services.embeddings as emb
+import services.embedding_cache as emb_cache
+from services.embedding_cache import DiskVectorStore, EmbeddingCache, text_digest
 import services.evaluation as eval_mod
 import simulation.evaluate_embedding as sim_eval
 
@@ -23,6 +25,12 @@ def mock_mongo(monkeypatch):
     monkeypatch.setattr(eval_mod, "db", db)
     yield db
 
+@pytest.fixture(autouse=True)
+def isolated_embedding_cache(monkeypatch, tmp_path):
+    cache = EmbeddingCache(directory=str(tmp_path / "embedding_cache"))
+    monkeypatch.setattr(emb_cache, "embedding_cache", cache)
+    yield cache
+
 # ==== services/embeddings.py ====
 def test_check_truncation_warns(caplog):
     tok_mock = MagicMock()
@@ -125,3 +133,141 @@ def test_save_results_creates_files_and_mongo(tmp_path, mock_mongo, monkeypatch)
     sim_eval.save_results(res, "unit_test_src")
     assert os.path.exists("results/unit_test_src.json")
     assert mock_mongo["test_results"].count_documents({}) > 0
+
+# ==== services/inference_profile.py ====
+def _tiny_gpt2():
+    from transformers import GPT2Config, GPT2LMHeadModel
+    torch.manual_seed(0)
+    return GPT2LMHeadModel(GPT2Config(n_layer=2, n_head=4, n_embd=128, vocab_size=200, n_positions=64)).eval()
+
+def test_conv1d_to_linear_is_exact():
+    from services.inference_profile import conv1d_to_linear
+    model = _tiny_gpt2()
+    ids = torch.randint(0, 200, (2, 12))
+    with torch.no_grad():
+        before = model(ids).logits
+        after = conv1d_to_linear(model)(ids).logits
+    assert torch.allclose(before, after, atol=1e-5)
+
+def test_int8_profile_shrinks_model_and_stays_close():
+    from transformers import BertConfig, BertModel
+    from services.inference_profile import apply_inference_profile, model_size_mb
+    torch.manual_seed(0)
+    model = BertModel(BertConfig(num_hidden_layers=2, hidden_size=256, num_attention_heads=4,
+                                 intermediate_size=1024, vocab_size=100)).eval()
+    ids = torch.randint(0, 100, (2, 16))
+    with torch.no_grad():
+        ref = model(ids).last_hidden_state.mean(dim=1)
+    size = model_size_mb(model)
+
+    quant = apply_inference_profile(model, "int8")
+    with torch.no_grad():
+        out = quant(ids).last_hidden_state.mean(dim=1)
+    assert model_size_mb(quant) < size * 0.7
+    assert torch.nn.functional.cosine_similarity(ref, out).min() > 0.99
+
+def test_bf16_profile_generates():
+    from services.inference_profile import apply_inference_profile
+    model = apply_inference_profile(_tiny_gpt2(), "bf16")
+    assert next(model.parameters()).dtype == torch.bfloat16
+    out = model.generate(torch.randint(0, 200, (1, 4)), max_length=8, do_sample=False, pad_token_id=0)
+    assert out.shape == (1, 8)
+
+def test_unknown_profile_falls_back_to_fp32():
+    from services.inference_profile import resolve_profile
+    assert resolve_profile("fp8") == "fp32"
+    assert resolve_profile("INT8") == "int8"
+
+def test_evaluate_profile_drift_reports_deltas():
+    def embed(texts, profile="fp32"):
+        base = dummy_embed(texts).astype(float)
+        return base + (0.01 if profile == "int8" else 0.0)
+    dataset = {
+        "X_train": ["a", "b"], "y_train": [0, 1],
+        "X_test": ["c", "d"], "y_test": [0, 1],
+        "texts": ["a", "b", "c", "d"]
+    }
+    report = eval_mod.evaluate_profile_drift({"DUMMY": embed}, dataset, profile="int8", n_clusters=2)
+    drift = report["drift"]["DUMMY"]
+    assert drift["cosine_mean"] > 0.99
+    assert "classification.accuracy" in drift["deltas"]
+
+# ==== chunked inference ====
+def test_plan_chunks_respects_batch_and_token_budget():
+    lengths = [5, 50, 7, 48, 6, 3, 49]
+    chunks = emb.plan_chunks(lengths, batch_size=3, max_tokens=100)
+    assert sorted(i for c in chunks for i in c) == list(range(len(lengths)))
+    for chunk in chunks:
+        assert len(chunk) <= 3
+        assert len(chunk) * max(lengths[i] for i in chunk) <= 100 or len(chunk) == 1
+    assert set(chunks[0]) <= {1, 3, 6}         # longest texts are grouped together
+
+def test_encode_in_chunks_restores_order_and_matches_single_texts():
+    from transformers import BertConfig, BertModel
+    torch.manual_seed(0)
+    model = BertModel(BertConfig(num_hidden_layers=1, hidden_size=32, num_attention_heads=2,
+                                 intermediate_size=64, vocab_size=100)).eval()
+
+    class Tok:
+        pad_token_id = 0
+        def __call__(self, texts, truncation=True):
+            return {"input_ids": [[1] + [3 + len(w) for w in t.split()] + [2] for t in texts]}
+
+    texts = ["a b c d e f g", "hi", "one two three", "x", "four five six seven"]
+    batched = emb.encode_in_chunks(Tok(), model, texts, batch_size=2, max_tokens=12)
+    single = np.vstack([emb.encode_in_chunks(Tok(), model, [t]) for t in texts])
+    assert batched.shape == (5, 32)
+    assert np.allclose(batched, single, atol=1e-5)
+
+# ==== services/embedding_cache.py ====
+def test_embedding_cache_memory_then_disk(tmp_path):
+    calls = []
+    def embed(texts):
+        calls.append(list(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+    cache = EmbeddingCache(max_size=2, directory=str(tmp_path))
+    first = cache.embed("m", embed, ["a", "bb", "a"])
+    assert calls == [["a", "bb"]] and first[:, 0].tolist() == [1, 2, 1]
+    assert cache.embed("m", embed, ["bb"])[0, 0] == 2 and len(calls) == 1
+    assert cache.embed("other", embed, ["bb"]) is not None and len(calls) == 2
+
+    restarted = EmbeddingCache(max_size=2, directory=str(tmp_path))
+    again = restarted.embed("m", embed, ["bb", "a", "ccc"])
+    assert again[:, 0].tolist() == [2, 1, 3]
+    assert calls[-1] == ["ccc"]
+    stats = restarted.stats()
+    assert stats["disk_hits"] == 2 and stats["misses"] == 1
+    assert stats["hit_ratio"] == pytest.approx(2 / 3)
+
+def test_disk_store_shared_by_two_writers(tmp_path):
+    # two processes = two stores on the same directory, each with its own row map
+    a = DiskVectorStore(tmp_path, "m", 2)
+    b = DiskVectorStore(tmp_path, "m", 2)
+    vec = {t: np.array([i, -i], dtype=np.float32) for i, t in enumerate(["x", "y", "z", "w"], start=1)}
+    d = {t: text_digest(t) for t in vec}
+
+    a.append([d["x"]], vec["x"][None])
+    b.append([d["y"], d["x"]], np.stack([vec["y"], vec["x"]]))   # b has not seen x yet
+    a.append([d["z"]], vec["z"][None])
+    assert np.array_equal(b.get(d["z"]), vec["z"])                # picked up a's append
+    assert np.array_equal(a.get(d["y"]), vec["y"])
+
+    # a writer that crashed between its two writes left an unindexed data row
+    with open(a.data_path, "ab") as f:
+        f.write(np.array([9, 9], dtype=np.float32).tobytes())
+    b.append([d["w"]], vec["w"][None])
+
+    restarted = DiskVectorStore(tmp_path, "m", 2)
+    assert len(restarted) == 4
+    for t in vec:
+        assert np.array_equal(restarted.get(d[t]), vec[t])
+
+
+def test_get_bert_embeddings_is_cached(isolated_embedding_cache):
+    with patch("services.embeddings.encode_in_chunks", side_effect=lambda tok, model, texts: np.ones((len(texts), 4))) as enc, \
+         patch("services.embeddings.load_bert", return_value=(MagicMock(), MagicMock())):
+        emb.get_bert_embeddings(["x", "y"])
+        emb.get_bert_embeddings("x")
+    assert enc.call_count == 1
+    assert isolated_embedding_cache.stats()["memory_hits"] == 1
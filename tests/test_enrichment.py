@@ -0,0 +1,77 @@
+# tests/test_enrichment.py
+# =======================
+import threading
+
+import mongomock
+
+from services.enrichment import EnrichmentWorker
+
+
+def make_chats():
+    chats = mongomock.MongoClient()["test_db"]["chats"]
+    chats.insert_one({"session_id": "s1", "messages": [
+        {"message_id": "m1", "question": "my laptop is broken", "sentiment": None},
+        {"message_id": "m2", "question": "thanks, all good", "sentiment": None},
+    ]})
+    return chats
+
+
+def test_worker_sets_fields_on_the_right_message():
+    chats = make_chats()
+    worker = EnrichmentWorker(chats, {
+        "sentiment": lambda texts: ["negative" if "broken" in t else "positive" for t in texts],
+        "bert_embedding": lambda texts: [[float(len(t))] for t in texts],
+    })
+    assert worker.submit("s1", "m2", "thanks, all good")
+    assert worker.submit("s1", "m1", "my laptop is broken")
+    assert worker.flush(timeout=5)
+
+    messages = {m["message_id"]: m for m in chats.find_one({"session_id": "s1"})["messages"]}
+    assert messages["m1"]["sentiment"] == "negative"
+    assert messages["m2"]["sentiment"] == "positive"
+    assert messages["m1"]["bert_embedding"] == [19.0]
+    assert worker.stats()["processed"] == 2
+
+
+def test_failing_enricher_does_not_block_the_others():
+    chats = make_chats()
+    worker = EnrichmentWorker(chats, {
+        "priority": lambda texts: 1 / 0,
+        "sentiment": lambda texts: ["neutral"] * len(texts),
+    })
+    worker.submit("s1", "m1", "x")
+    assert worker.flush(timeout=5)
+    message = chats.find_one({"session_id": "s1"})["messages"][0]
+    assert message["sentiment"] == "neutral" and "priority" not in message
+
+
+def test_full_queue_drops_instead_of_blocking():
+    release = threading.Event()
+
+    def slow(texts):
+        release.wait(5)
+        return ["neutral"] * len(texts)
+
+    worker = EnrichmentWorker(make_chats(), {"sentiment": slow}, maxsize=1, batch_size=1)
+    results = [worker.submit("s1", "m1", "a") for _ in range(5)]
+    assert results[0] and not all(results)
+    assert worker.stats()["dropped"] >= 1
+    release.set()
+    assert worker.flush(timeout=5)
+    assert not worker.submit("s1", None, "no id")
+
+
+def test_multi_field_enricher_sets_every_field():
+    chats = make_chats()
+    calls = []
+
+    def labels(texts):
+        calls.append(len(texts))
+        return {"sentiment": ["negative"] * len(texts), "priority": ["High"] * len(texts)}
+
+    worker = EnrichmentWorker(chats, {("sentiment", "priority"): labels})
+    worker.submit("s1", "m1", "my laptop is broken")
+    assert worker.flush(timeout=5)
+    message = chats.find_one({"session_id": "s1"})["messages"][0]
+    assert message["sentiment"] == "negative" and message["priority"] == "High"
+    assert calls == [1]
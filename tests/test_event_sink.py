@@ -0,0 +1,89 @@
+# tests/test_event_sink.py
+# =======================
+import threading
+
+import mongomock
+import pandas as pd
+
+from services.event_sink import EventSink, csv_file
+
+
+def make_col():
+    return mongomock.MongoClient()["test_db"]["monitoring"]
+
+
+def test_flush_writes_queued_events_with_insert_many(tmp_path):
+    col = make_col()
+    sink = EventSink(batch_size=100, flush_ms=60_000)
+    for i in range(5):
+        assert sink.emit(col, {"event": "chat_response", "n": i})
+        sink.emit(csv_file(tmp_path / "all_log.csv"), {"model": "bert", "n": i})
+    assert col.count_documents({}) == 0          # nothing written on the request path
+
+    assert sink.flush(timeout=5)
+    assert sorted(d["n"] for d in col.find()) == [0, 1, 2, 3, 4]
+    assert list(pd.read_csv(tmp_path / "all_log.csv")["n"]) == [0, 1, 2, 3, 4]
+    stats = sink.stats()
+    assert stats["flushed"] == 10 and stats["queued"] == 0 and stats["batches"] == 2
+    sink.close()
+
+
+def test_full_batch_flushes_without_waiting_for_the_interval():
+    col = make_col()
+    sink = EventSink(batch_size=3, flush_ms=60_000)
+    for i in range(3):
+        sink.emit(col, {"n": i})
+    for _ in range(100):
+        if col.count_documents({}) == 3:
+            break
+        threading.Event().wait(0.05)
+    assert col.count_documents({}) == 3
+    sink.close()
+
+
+class SlowCollection:
+    def __init__(self):
+        self.release = threading.Event()
+        self.docs = []
+
+    def insert_many(self, docs, ordered=True):
+        self.release.wait(5)
+        self.docs += docs
+        return type("Result", (), {"inserted_ids": [None] * len(docs)})()
+
+    def insert_one(self, doc):
+        self.insert_many([doc])
+
+
+def test_drop_policy_counts_dropped_events():
+    target = SlowCollection()
+    sink = EventSink(maxsize=2, batch_size=1, flush_ms=0, policy="drop")
+    results = [sink.emit(target, {"n": i}) for i in range(20)]
+    assert not all(results) and sink.stats()["dropped"] >= 1
+    target.release.set()
+    assert sink.flush(timeout=5)
+    assert len(target.docs) == sink.stats()["flushed"] == sink.stats()["enqueued"]
+    sink.close()
+
+
+def test_disabled_sink_and_closed_sink_write_synchronously():
+    col = make_col()
+    EventSink(enabled=False).emit(col, {"n": 1})
+    assert col.count_documents({}) == 1
+
+    sink = EventSink()
+    sink.close()
+    sink.emit(col, {"n": 2})
+    assert col.count_documents({}) == 2
+
+
+def test_zero_flush_interval_only_flushes_on_size_or_request():
+    col = make_col()
+    sink = EventSink(batch_size=100, flush_ms=0)
+    assert sink.flush_interval is None
+    sink.emit(col, {"n": 1})
+    threading.Event().wait(0.2)
+    assert col.count_documents({}) == 0          # the writer sleeps instead of polling
+    assert sink.flush(timeout=5)
+    assert col.count_documents({}) == 1
+    sink.close()
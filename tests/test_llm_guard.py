@@ -0,0 +1,107 @@
+# tests/test_llm_guard.py
+# =======================
+## pytest -v tests/test_llm_guard.py
+
+import time
+import urllib.error
+
+import mongomock
+import pytest
+
+import services.monitoring as monitoring
+from services.event_sink import event_sink
+from services.llm_guard import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, HttpLLM, LLMGuard, open_stream, record_breaker_state,
+)
+from simulation.fake_llm_server import serve_in_thread
+
+
+@pytest.fixture
+def fake_llm():
+    server, url = serve_in_thread(latency_ms=50, jitter_ms=0, seed=1)
+    yield server, url
+    server.shutdown()
+
+
+def configure(server, **config):
+    with server.state.lock:
+        server.state.config.update(config)
+
+
+def ask(url, prompt="USER: reset password"):
+    return HttpLLM(url, timeout=5).send_message(prompt).text
+
+
+def test_http_llm_against_fake_server(fake_llm):
+    server, url = fake_llm
+    assert "reset password" in ask(url)
+
+    first, rest = open_stream(lambda: HttpLLM(url).start_chat(history=[]), "USER: vpn down")
+    text = first + "".join(c.text for c in rest)
+    assert "vpn down" in text
+    assert server.state.stats["requests"] == 2
+
+
+def test_guard_deadline(fake_llm):
+    server, url = fake_llm
+    configure(server, latency_ms=2000)
+    guard = LLMGuard(CircuitBreaker("t"), deadline=0.3, max_attempts=1)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        guard.call(ask, url)
+    assert time.monotonic() - start < 1.0
+    assert guard.deadline_misses == 1
+
+
+def test_guard_hedges_slow_request(fake_llm, monkeypatch):
+    server, url = fake_llm
+    # first request lands in the slow tail, the hedge doesn't
+    configure(server, slow_rate=1.0, slow_ms=3000)
+    guard = LLMGuard(CircuitBreaker("t"), deadline=5, max_attempts=2)
+    monkeypatch.setattr(guard.latency, "hedge_delay", lambda: 0.2)
+
+    def fast_after_first(*a):
+        configure(server, slow_rate=0.0)
+        return ask(*a)
+
+    start = time.monotonic()
+    calls = iter([ask, fast_after_first])
+    assert "reset password" in guard.call(lambda u: next(calls)(u), url)
+    assert time.monotonic() - start < 1.5
+    assert guard.hedges == 1 and guard.hedge_wins == 1
+
+
+def test_guard_retries_fast_failure_and_breaker_trips(fake_llm):
+    server, url = fake_llm
+    configure(server, error_rate=1.0)
+    states = []
+    breaker = CircuitBreaker("t", failure_threshold=2, reset_timeout=0.2,
+                             on_state_change=lambda b, old, new: states.append(new))
+    guard = LLMGuard(breaker, deadline=2, max_attempts=2)
+
+    for _ in range(2):
+        with pytest.raises(urllib.error.HTTPError):
+            guard.call(ask, url)
+    assert server.state.stats["requests"] == 4  # each call retried once
+    assert breaker.state == "open" and breaker.trips == 1
+
+    with pytest.raises(CircuitOpenError):
+        guard.call(ask, url)
+    assert server.state.stats["requests"] == 4  # rejected without calling upstream
+
+    configure(server, error_rate=0.0)
+    time.sleep(0.25)
+    assert "reset password" in guard.call(ask, url)   # half-open probe succeeds
+    assert states == ["open", "half_open", "closed"]
+
+
+def test_breaker_state_written_to_monitoring(monkeypatch):
+    db = mongomock.MongoClient()["test_db"]
+    monkeypatch.setattr(monitoring, "monitoring_col", db["monitoring"])
+    breaker = CircuitBreaker("llm", failure_threshold=1, on_state_change=record_breaker_state)
+    breaker.record_failure()
+    assert event_sink.flush(timeout=5)
+
+    doc = db["monitoring"].find_one({"event": "circuit_breaker"})
+    assert doc["state"] == "open" and doc["previous_state"] == "closed"
+    assert doc["trips"] == 1
@@ -0,0 +1,61 @@
+# tests/test_ml.py
+# =======================
+import pandas as pd
+import pytest
+
+import services.ml as ml
+import services.model_registry as registry
+
+TEXTS = [
+    "my laptop is broken and I need it now", "server down, urgent", "everything crashed again",
+    "thanks, it works great", "perfect, problem solved", "great support, thank you",
+    "how do I change my wallpaper", "question about the printer menu", "where is the manual",
+] * 4
+
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ml, "MODELS_DIR", tmp_path)
+    monkeypatch.setattr(registry, "PIPELINES_DIR", tmp_path)
+    registry.model_registry.clear()
+    yield tmp_path
+    registry.model_registry.clear()
+
+
+def write_csv(path, missing_priority=False):
+    df = pd.DataFrame({
+        "text": TEXTS,
+        "sentiment": (["negative"] * 3 + ["positive"] * 3 + ["neutral"] * 3) * 4,
+        "priority": (["High"] * 3 + ["Low"] * 6) * 4,
+    })
+    if missing_priority:
+        df.loc[0, "priority"] = None    # each head trains on its own labelled rows
+    df.to_csv(path, index=False)
+    return path
+
+
+def test_fused_training_predicts_all_labels_in_one_call(models_dir):
+    scores = ml.train_and_save_models_from_csv(write_csv(models_dir / "train.csv", missing_priority=True),
+                                               mode="fused", n_clusters=3)
+    assert set(scores) == {"sentiment", "priority"}
+    assert (models_dir / "multihead_pipeline.joblib").exists()
+
+    model = ml.load_multihead_model()
+    assert set(model.heads) == {"sentiment", "priority", "cluster"}
+    labels = ml.predict_labels(["server down, urgent", "thanks, it works great"])
+    assert labels["sentiment"] == ["negative", "positive"]
+    assert labels["priority"][0] == "High"
+    assert list(ml.predict_sentiment(["server down, urgent"])) == ["negative"]
+
+
+def test_separate_training_replaces_a_fused_model(models_dir):
+    csv_path = write_csv(models_dir / "train.csv")
+    ml.train_and_save_models_from_csv(csv_path, mode="fused")
+    ml.train_and_save_models_from_csv(csv_path, mode="separate")
+    assert ml.load_multihead_model() is None
+    assert ml.predict_labels(["thanks, it works great"])["sentiment"] == ["positive"]
+
+
+def test_unknown_training_mode_is_rejected(models_dir):
+    with pytest.raises(ValueError):
+        ml.train_and_save_models_from_csv(write_csv(models_dir / "train.csv"), mode="stacked")
@@ -0,0 +1,89 @@
+# tests/test_model_registry.py
+# =======================
+import threading
+import time
+
+import joblib
+import pytest
+import torch
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+
+import services.model_registry as mr
+from services.model_registry import ModelRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_loads_once_even_with_concurrent_callers():
+    registry = ModelRegistry(idle_ttl=0)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return torch.nn.Linear(4, 4)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("m", loader))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert registry.stats()[0]["size_mb"] >= 0
+
+
+def test_shared_entry_has_no_extra_memory_and_keeps_parent_alive():
+    clock = FakeClock()
+    registry = ModelRegistry(idle_ttl=100, clock=clock)
+    lm = registry.get("lm", lambda: torch.nn.Sequential(torch.nn.Linear(512, 512)))
+    base = registry.get("base", lambda: lm[0], parent="lm")
+    assert base is lm[0]
+
+    sizes = {s["model"]: s["size_mb"] for s in registry.stats()}
+    assert sizes["base"] == 0 and sizes["lm"] > 0
+
+    clock.now = 90
+    registry.get("base", lambda: None, parent="lm")     # touching the child refreshes the parent
+    clock.now = 150
+    assert registry.unload_idle() == []
+    clock.now = 200
+    assert registry.unload_idle() == ["lm"]
+    assert not registry.loaded("base")
+
+
+def test_gpt2_embeddings_share_lm_weights(monkeypatch):
+    from transformers import GPT2Config, GPT2LMHeadModel
+    registry = ModelRegistry(idle_ttl=0)
+    monkeypatch.setattr(mr, "model_registry", registry)
+    lm = GPT2LMHeadModel(GPT2Config(n_layer=1, n_head=2, n_embd=32, vocab_size=50, n_positions=16))
+    monkeypatch.setattr(mr, "get_gpt2_lm", lambda profile=None: ("tok", lm))
+
+    tokenizer, base = mr.get_gpt2("fp32")
+    assert base is lm.transformer
+    assert {s["model"]: s["shares"] for s in registry.stats()}["gpt2:fp32"] == "gpt2-lm:fp32"
+
+
+def test_pipeline_is_cached_until_unloaded(tmp_path, monkeypatch):
+    registry = ModelRegistry(idle_ttl=0)
+    monkeypatch.setattr(mr, "model_registry", registry)
+    monkeypatch.setattr(mr, "PIPELINES_DIR", tmp_path)
+    with pytest.raises(FileNotFoundError):
+        mr.get_pipeline("priority")
+
+    model = make_pipeline(TfidfVectorizer(), LogisticRegression()).fit(["urgent down", "how to"], ["High", "Low"])
+    joblib.dump(model, tmp_path / "priority_pipeline.joblib")
+    first = mr.get_pipeline("priority")
+    assert mr.get_pipeline("priority") is first
+    assert registry.unload("pipeline:priority")
+    assert mr.get_pipeline("priority") is not first
+    assert registry.loads == 2
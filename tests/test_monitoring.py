@@ -9,6 +9,7 @@ import pytest
 from datetime import datetime, timezone
 from unittest.mock import patch
 import services.monitoring as monitoring
+from services.event_sink import event_sink
 
 @pytest.fixture(autouse=True)
 def mock_mongo(monkeypatch):
@@ -31,6 +32,7 @@ def test_log_user_interaction_inserts():
         "user123", "Q?", "A!", "greet", "positive", "high",
         1, 0, False, 1.23
     )
+    assert event_sink.flush(timeout=5)
     doc = monitoring.monitor_col.find_one({"user_id": "user123"})
     assert doc is not None
     assert doc["intent_tag"] == "greet"
@@ -40,6 +42,7 @@ def test_log_error_inserts():
         raise ValueError("fail here")
     except Exception as e:
         monitoring.log_error("user456", e)
+    assert event_sink.flush(timeout=5)
     doc = monitoring.monitor_col.find_one({"user_id": "user456"})
     assert doc is not None
     assert doc["error_type"] == "ValueError"
@@ -58,6 +61,7 @@ def test_generate_report_with_data():
 def test_log_execution_creates_docs_and_csv(tmp_path):
     monitoring.LOG_DIR = tmp_path
     monitoring.log_execution(1.0, 0.9, 2.0, 0.8, execution_type="test")
+    assert event_sink.flush(timeout=5)
     assert monitoring.test_results_col.count_documents({}) == 2
     assert any(f.suffix == ".csv" for f in tmp_path.iterdir())
 
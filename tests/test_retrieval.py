@@ -0,0 +1,341 @@
+# tests/test_retrieval.py
+# =======================
+## pytest -v tests/test_retrieval.py
+
+import random
+import string
+from difflib import SequenceMatcher
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+import services.bm25 as bm25
+import services.context_assembler as context_assembler
+import services.hybrid_retrieval as hybrid_retrieval
+import services.intent_index as intent_index
+import services.vector_index as vector_index
+from services.ann_index import IVFIndex, exact_search
+from services.content_version import bump_version
+
+
+# ==== services/intent_index.py ====
+def linear_match(intents, text, threshold=0.85):
+    for intent in intents:
+        for pattern in intent.get("patterns", []):
+            if SequenceMatcher(None, str(pattern).lower(), text).ratio() > threshold:
+                return intent, str(pattern).lower()
+    return None
+
+
+def test_intent_index_matches_linear_scan():
+    rng = random.Random(0)
+    alphabet = string.ascii_lowercase[:6] + " "
+    intents = [
+        {"tag": f"t{i}", "patterns": ["".join(rng.choices(alphabet, k=rng.randint(1, 25))) for _ in range(5)]}
+        for i in range(40)
+    ]
+    index = intent_index.IntentIndex(intents)
+    patterns = [p for i in intents for p in i["patterns"]]
+
+    for _ in range(300):
+        if rng.random() < 0.5:
+            q = list(rng.choice(patterns))
+            if q:
+                q[rng.randrange(len(q))] = rng.choice(alphabet)
+            q = "".join(q)
+        else:
+            q = "".join(rng.choices(alphabet, k=rng.randint(0, 25)))
+        assert index.match(q) == linear_match(intents, q)
+
+
+def test_intent_index_first_match_and_case():
+    intents = [
+        {"tag": "greet", "patterns": ["Hello there"], "responses": ["hi"]},
+        {"tag": "greet2", "patterns": ["hello there"], "responses": ["hey"]},
+    ]
+    index = intent_index.IntentIndex(intents)
+    intent, pattern = index.match("hello there")
+    assert intent["tag"] == "greet"
+    assert pattern == "hello there"
+    assert index.match("printer jam") is None
+
+
+def test_get_intent_index_rebuilds_on_version_bump():
+    intent_index.invalidate_intent_index()
+    col = MagicMock()
+    col.find_one.return_value = {"intents": [{"tag": "a", "patterns": ["reset password"]}]}
+
+    first = intent_index.get_intent_index(col)
+    assert intent_index.get_intent_index(col) is first
+    assert col.find_one.call_count == 1
+
+    bump_version("default_chat")
+    assert intent_index.get_intent_index(col) is not first
+    assert col.find_one.call_count == 2
+
+
+# ==== services/vector_index.py ====
+def bag_of_words_embed(texts):
+    """Deterministic toy embedder: hashed bag of words."""
+    out = np.zeros((len(texts), 32), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in str(text).lower().split():
+            out[row, sum(map(ord, word)) % 32] += 1.0
+    return out
+
+
+def test_vector_index_add_search_remove():
+    index = vector_index.VectorIndex(capacity=1)
+    vecs = np.eye(4, dtype=np.float32)
+    index.add(["a", "b", "c"], vecs[:3] * 5, [{"kind": "faq"}, {"kind": "kb"}, {"kind": "faq"}])
+
+    hits = index.search(vecs[1], k=2)
+    assert hits[0]["key"] == "b"
+    assert hits[0]["score"] == pytest.approx(1.0)
+    assert [h["key"] for h in index.search(vecs[1], k=3, kind="faq")][0] in ("a", "c")
+
+    assert index.remove("a")
+    assert not index.remove("a")
+    assert len(index) == 2 and "c" in index
+    assert index.search(vecs[2], k=1)[0]["key"] == "c"
+
+
+def test_knowledge_index_incremental_updates(monkeypatch):
+    vector_index.invalidate_knowledge_index()
+    faq_col, kb_col = MagicMock(), MagicMock()
+    faq_col.find.return_value = [{"_id": 1, "question": "reset my password", "answer": "Use the portal"}]
+    kb_col.find.return_value = [{"_id": 2, "title": "VPN", "content": "vpn client setup guide"}]
+    monkeypatch.setattr(vector_index, "get_embed_fn", lambda *a, **k: bag_of_words_embed)
+
+    index = vector_index.get_knowledge_index(faq_col, kb_col)
+    assert len(index) == 2
+    assert index.search_text("reset password", k=1, kind="faq")[0]["answer"] == "Use the portal"
+
+    bump_version("faq", "insert", {"_id": 3, "question": "printer paper jam", "answer": "Open tray"})
+    assert vector_index.get_knowledge_index(faq_col, kb_col) is index
+    assert index.search_text("printer jam", k=1, kind="faq")[0]["answer"] == "Open tray"
+
+    bump_version("faq", "update", {"_id": 3, "question": "printer paper jam", "answer": "Call IT"})
+    assert index.search_text("printer jam", k=1, kind="faq")[0]["answer"] == "Call IT"
+
+    bump_version("knowledge", "delete", {"_id": 2})
+    assert len(index) == 2
+    assert index.search_text("vpn", k=5, kind="kb") == []
+
+    bump_version("faq", "update", {"_id": 3, "question": "", "answer": ""})    # text cleared
+    assert len(index) == 1
+    assert all(h["key"] != "faq:3" for h in index.search_text("printer jam", k=5))
+    vector_index.invalidate_knowledge_index()
+
+
+# ==== services/bm25.py ====
+def test_bm25_ranking_and_threshold():
+    index = bm25.BM25Index()
+    index.add("kb:1", "VPN client setup guide for remote access", {"kind": "kb", "answer": "vpn"})
+    index.add("kb:2", "Printer paper jam: open the tray", {"kind": "kb", "answer": "printer"})
+    index.add("faq:3", "How do I reset my password? Use the self-service portal", {"kind": "faq", "answer": "pwd"})
+
+    hits = index.search("I can't connect to the VPN from home")
+    assert hits[0]["key"] == "kb:1"
+    assert hits[0]["score"] > 0 and 0 < hits[0]["confidence"] <= 1
+    assert index.search("password reset")[0]["confidence"] == pytest.approx(1.0, abs=0.2)
+    assert index.search("the and of") == []
+    assert index.search("password", kind="kb") == []
+
+
+def test_bm25_incremental_add_replace_delete():
+    index = bm25.BM25Index()
+    index.add("kb:1", "vpn setup", {"answer": "a"})
+    index.add("kb:1", "printer setup", {"answer": "b"})
+    assert len(index) == 1
+    assert index.search("vpn") == []
+    assert index.search("printer")[0]["answer"] == "b"
+
+    assert index.delete("kb:1") and not index.delete("kb:1")
+    assert index.search("printer") == []
+
+    for i in range(3000):
+        index.add(f"kb:{i}", f"doc {i} word{i % 7}", {})
+    for i in range(2500):
+        index.delete(f"kb:{i}")
+    assert len(index) == 500
+    assert len(index._keys) < 3000  # compacted
+    assert {h["key"] for h in index.search("word3", k=1000)} == {f"kb:{i}" for i in range(2500, 3000) if i % 7 == 3}
+
+
+def test_get_bm25_index_follows_content_events():
+    bm25.invalidate_bm25_index()
+    faq_col, kb_col = MagicMock(), MagicMock()
+    faq_col.find.return_value = [{"_id": 1, "question": "reset my password", "answer": "Use the portal"}]
+    kb_col.find.return_value = [{"_id": 2, "title": "VPN", "content": "vpn client setup guide"}]
+
+    index = bm25.get_bm25_index(faq_col, kb_col)
+    assert len(index) == 2
+    bump_version("knowledge", "insert", {"_id": 3, "title": "Printer", "content": "clear the paper jam"})
+    assert bm25.get_bm25_index(faq_col, kb_col) is index
+    assert index.search("paper jam")[0]["answer"] == "clear the paper jam"
+
+    bump_version("faq", "delete", {"_id": 1})
+    assert index.search("password") == []
+
+    bump_version("knowledge", "update", {"_id": 3, "title": "", "content": ""})    # text cleared
+    assert index.search("paper jam") == []
+    bm25.invalidate_bm25_index()
+
+
+# ==== services/hybrid_retrieval.py ====
+def test_rrf_fuse_prefers_agreement():
+    lexical = [{"key": "a", "confidence": 0.9}, {"key": "b", "confidence": 0.5}]
+    dense = [{"key": "b", "score": 0.8}, {"key": "c", "score": 0.7}]
+    fused = hybrid_retrieval.rrf_fuse({"lexical": lexical, "dense": dense})
+    assert [h["key"] for h in fused] == ["b", "a", "c"]
+    assert fused[0]["ranks"] == {"lexical": 2, "dense": 1}
+    assert fused[0]["scores"] == {"lexical": 0.5, "dense": 0.8}
+
+
+def test_hybrid_retriever_winner_and_threshold(monkeypatch):
+    monkeypatch.setattr(vector_index, "get_embed_fn", lambda *a, **k: bag_of_words_embed)
+    faqs = [{"_id": 1, "question": "reset my password", "answer": "Use the portal"}]
+    articles = [{"_id": 2, "title": "VPN", "content": "vpn client setup guide"},
+                {"_id": 3, "title": "Printer", "content": "clear the paper jam in the printer tray"}]
+    lexical = bm25.BM25Index()
+    bm25.index_documents(lexical, "faq", faqs)
+    bm25.index_documents(lexical, "knowledge", articles)
+    dense = vector_index.KnowledgeIndex()
+    dense.upsert("faq", faqs)
+    dense.upsert("knowledge", articles)
+
+    result = hybrid_retrieval.HybridRetriever(lexical, dense).retrieve("reset password")
+    assert result.answer == "Use the portal"
+    assert result.kind == "faq" and result.retriever == "hybrid"
+    assert 0 < result.confidence <= 1
+    assert set(result.timings) == {"lexical", "dense"}
+
+    lexical_only = hybrid_retrieval.HybridRetriever(lexical, None).retrieve("printer jam")
+    assert lexical_only.retriever == "lexical" and lexical_only.key == "kb:3"
+
+    miss = hybrid_retrieval.HybridRetriever(lexical, dense).retrieve("quantum chromodynamics")
+    assert miss.answer is None and miss.retriever is None
+
+
+
+class StaticIndex:
+    def __init__(self, hits):
+        self.hits = hits
+
+    def __len__(self):
+        return len(self.hits)
+
+    def search(self, text, k=10):
+        return self.hits[:k]
+
+    search_text = search
+
+
+def test_hybrid_retriever_label_ignores_rejected_retrievers():
+    # both rank the FAQ first, but the lexical score is below BM25_MIN_SCORE
+    faq = {"key": "faq:1", "kind": "faq", "answer": "Use the portal"}
+    lexical = StaticIndex([{**faq, "confidence": hybrid_retrieval.BM25_MIN_SCORE / 2}])
+    dense = StaticIndex([{**faq, "score": 0.99}])
+    result = hybrid_retrieval.HybridRetriever(lexical, dense).retrieve("reset password")
+    assert result.answer == "Use the portal"
+    assert result.retriever == "dense" and result.confidence == pytest.approx(0.99)
+
+    # lexical ranks it better (1 vs 2) but was rejected: still reported as dense
+    other = {"key": "kb:2", "kind": "kb", "answer": "VPN", "score": 0.0}
+    dense = StaticIndex([other, {**faq, "score": 0.99}])
+    assert hybrid_retrieval.HybridRetriever(lexical, dense).retrieve("reset password").retriever == "dense"
+
+# ==== services/ann_index.py ====
+def clustered_vectors(n=2000, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((20, dim))
+    data = centers[rng.integers(0, 20, n)] + 0.3 * rng.standard_normal((n, dim))
+    return vector_index.normalize_rows(data)
+
+
+def test_ivf_recall_and_exact_with_full_probe():
+    data = clustered_vectors()
+    index = IVFIndex.train(data, nlist=20, nprobe=4)
+    index.add(np.arange(len(data)), data)
+    index.compact()
+
+    recalls = []
+    for q in data[:50]:
+        truth = exact_search(data, q, 10)[0]
+        assert set(index.search(q, 10, nprobe=index.nlist)[0]) == set(truth)
+        recalls.append(len(set(index.search(q, 10)[0]) & set(truth)) / 10)
+    assert np.mean(recalls) > 0.9
+
+
+def test_ivf_add_remove_and_persistence(tmp_path):
+    data = clustered_vectors(n=500)
+    index = IVFIndex.train(data, nlist=10, nprobe=10)
+    index.add(np.arange(500), data)
+    index.compact()
+
+    index.remove([0])
+    assert 0 not in index.search(data[0], 5)[0]
+    index.add([0], data[1:2])
+    assert index.search(data[1], 2)[0].tolist().count(0) == 1
+    assert len(index) == 500
+
+    index.save(tmp_path / "ivf")
+    loaded = IVFIndex.load(tmp_path / "ivf")
+    assert len(loaded) == 500
+    assert loaded.search(data[7], 1)[0][0] == 7
+
+
+def test_vector_index_with_ann_attached():
+    data = clustered_vectors(n=300)
+    index = vector_index.VectorIndex()
+    index.add([f"k{i}" for i in range(300)], data, [{"kind": "faq" if i % 2 else "kb"} for i in range(300)])
+    index.build_ann(nlist=8, nprobe=8)
+
+    assert index.search(data[5], k=1)[0]["key"] == "k5"
+    assert all(h["kind"] == "kb" for h in index.search(data[5], k=3, kind="kb"))
+    index.remove("k5")
+    assert index.search(data[5], k=1)[0]["key"] != "k5"
+
+
+
+def test_ann_kind_filter_finds_rare_kind(monkeypatch):
+    # 5 FAQs among 600 entries: a shared IVF index would rarely probe them
+    data = clustered_vectors(n=600)
+    index = vector_index.VectorIndex()
+    kinds = ["faq" if i % 120 == 0 else "kb" for i in range(600)]
+    index.add([f"k{i}" for i in range(600)], data, [{"kind": kind} for kind in kinds])
+    index.build_ann(nlist=16, nprobe=1)
+    assert index.count("faq") == 5
+
+    truths = [index._search_exact(vector_index.normalize_rows(q)[0], 1, "faq") for q in data[1:40]]
+    monkeypatch.setattr(index, "_search_exact", MagicMock(side_effect=AssertionError("brute force")))
+    for q, truth in zip(data[1:40], truths):
+        hits = index.search(q, k=1, kind="faq")
+        assert len(hits) == 1 and hits[0]["kind"] == "faq"
+        assert abs(hits[0]["score"] - truth[0]["score"]) < 1e-5
+    assert len(index.search(data[0], k=10, kind="faq")) == 5
+
+# ==== services/context_assembler.py ====
+def test_assemble_prompt_selects_relevant_snippets_within_budget():
+    hits = [
+        {"key": "kb:1", "kind": "kb", "title": "VPN", "answer": "Install the vpn client " * 200, "rrf": 0.03},
+        {"key": "faq:2", "kind": "faq", "question": "VPN slow?", "answer": "Switch server", "rrf": 0.02},
+    ]
+    lexicon = context_assembler.get_intent_lexicon(intent_index.IntentIndex([
+        {"tag": "vpn_issue", "patterns": ["vpn not connecting"], "responses": ["Check your vpn"]},
+        {"tag": "greeting", "patterns": ["hello"], "responses": ["Hi!"]},
+    ]))
+    intent_hits = lexicon.search("my vpn is not connecting", k=5)
+    assert [h["key"] for h in intent_hits] == ["intent:vpn_issue"]
+
+    assembled = context_assembler.assemble_prompt("my vpn is not connecting", hits, intent_hits, budget=450)
+    assert assembled.prompt_tokens <= 450
+    assert assembled.snippets[0] == "kb:1"
+    assert "=== Intents ===\n[Intent: vpn_issue]" in assembled.prompt
+    assert "greeting" not in assembled.prompt
+    assert assembled.prompt.endswith("Respond professionally and clearly based on the context above.")
+
+    tiny = context_assembler.assemble_prompt("my vpn is not connecting", hits, intent_hits, budget=60)
+    assert tiny.snippets == [] and "===" not in tiny.prompt
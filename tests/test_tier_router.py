@@ -0,0 +1,106 @@
+# tests/test_tier_router.py
+# =========================
+## pytest -v tests/test_tier_router.py
+
+import threading
+import time
+
+from services.tier_router import SpeculativeCall, TierResult, TierRouter
+
+
+def slow_tier(delay, answer=None, source=None):
+    def tier(question):
+        time.sleep(delay)
+        return TierResult(answer, source)
+    return tier
+
+
+def test_router_runs_tiers_concurrently_and_respects_priority():
+    router = TierRouter([
+        ("intent", slow_tier(0.2)),
+        ("retrieval", slow_tier(0.2, "Use the portal", "faq")),
+        ("other", slow_tier(0.2, "lower priority", "x")),
+    ])
+    start = time.perf_counter()
+    route = router.route("reset password")
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.35  # ~max(tiers), not sum(tiers)
+    assert route.tier == "retrieval"
+    assert route.result.answer == "Use the portal" and route.result.source == "faq"
+    assert route.results["intent"].answer is None
+
+
+def test_router_survives_failing_tier():
+    def broken(question):
+        raise RuntimeError("mongo down")
+
+    route = TierRouter([("intent", broken), ("retrieval", slow_tier(0, "ok", "kb"))]).route("q")
+    assert route.tier == "retrieval" and route.results["intent"] is None
+
+
+def test_speculative_call_cancelled_when_cheaper_tier_answers():
+    produced = []
+
+    def fake_llm(cancel_event):
+        for word in ["this ", "is ", "expensive"]:
+            if cancel_event.is_set():
+                return
+            time.sleep(0.05)
+            produced.append(word)
+            yield word
+
+    speculative = SpeculativeCall(fake_llm)
+    route = TierRouter([("intent", slow_tier(0.01, "Hello!", "greeting"))]).route("hi", speculative)
+    assert route.tier == "intent"
+    assert speculative.cancelled
+    time.sleep(0.2)
+    assert len(produced) < 3
+
+
+def test_speculative_call_used_when_all_tiers_miss():
+    started = threading.Event()
+
+    def fake_llm(cancel_event):
+        started.set()
+        yield "AI "
+        yield "answer"
+
+    speculative = SpeculativeCall(fake_llm)
+    route = TierRouter([("intent", slow_tier(0.05)), ("retrieval", slow_tier(0.05))]).route("q", speculative)
+    assert route.tier is None and started.is_set()
+    assert not speculative.cancelled
+    assert list(speculative.stream()) == ["AI ", "answer"]
+
+
+def test_speculative_on_served_runs_only_when_answer_is_consumed():
+    served = []
+
+    def fake_llm(cancel_event):
+        yield "AI answer"
+
+    consumed = SpeculativeCall(fake_llm, on_served=lambda: served.append("consumed"))
+    assert consumed.result() == "AI answer" and served == ["consumed"]
+
+    discarded = SpeculativeCall(fake_llm, on_served=lambda: served.append("discarded"))
+    time.sleep(0.05)          # finished before the cheaper tier won
+    discarded.cancel()
+    assert list(discarded.stream()) == ["AI answer"] and served == ["consumed"]
+
+
+def test_speculative_calls_do_not_starve_tiers():
+    release = threading.Event()
+
+    def stuck_llm(cancel_event):
+        release.wait(5)
+        yield "late"
+
+    calls = [SpeculativeCall(stuck_llm) for _ in range(10)]
+    try:
+        start = time.perf_counter()
+        route = TierRouter([("intent", slow_tier(0.01, "Hello!", "greeting"))], timeout=1).route("hi")
+        assert route.tier == "intent" and time.perf_counter() - start < 0.5
+    finally:
+        release.set()
+        for call in calls:
+            call.cancel()